@@ -3,6 +3,8 @@ from dynamo.utils.classutil import get_instance
 class UpdateBoard(object):
     """
     Interface to local and remote "board" to register asynchronous inventory updates.
+    Updates carry increasing sequence numbers, so that the receiver can read them in chunks and
+    acknowledge (remove) the ones it has applied.
     """
 
     @staticmethod
@@ -21,6 +23,20 @@ class UpdateBoard(object):
     def get_updates(self):
         raise NotImplementedError('get_updates')
 
+    def read_updates(self, after = 0, max_num = None):
+        """
+        @param after    Return updates with sequence number larger than this.
+        @param max_num  Maximum number of updates to return (None: implementation default).
+        @return List of (sequence number, cmd, obj) in the order of the sequence numbers.
+        """
+        raise NotImplementedError('read_updates')
+
+    def acknowledge(self, last):
+        """
+        Remove the updates with sequence number up to last.
+        """
+        raise NotImplementedError('acknowledge')
+
     def flush(self):
         raise NotImplementedError('flush')
 
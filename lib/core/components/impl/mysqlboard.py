@@ -1,9 +1,19 @@
+import zlib
+
 from dynamo.core.components.board import UpdateBoard
 from dynamo.core.inventory import DynamoInventory
 from dynamo.utils.interface.mysql import MySQL
 from dynamo.dataformat import Configuration
 
 class MySQLUpdateBoard(UpdateBoard):
+    """
+    UpdateBoard backed by the inventory_updates table. The row id is the sequence number of the update.
+    Object payloads larger than compress_min_size are stored zlib-compressed when compress is True.
+    """
+
+    _cmd_names = {DynamoInventory.CMD_UPDATE: 'update', DynamoInventory.CMD_DELETE: 'delete'}
+    _cmd_values = {'update': DynamoInventory.CMD_UPDATE, 'delete': DynamoInventory.CMD_DELETE}
+
     def __init__(self, config):
         UpdateBoard.__init__(self, config)
 
@@ -12,6 +22,18 @@ class MySQLUpdateBoard(UpdateBoard):
 
         self._mysql = MySQL(db_params)
 
+        # Compress the object payloads in write_updates
+        self.compress = config.get('compress', False)
+        self.compress_min_size = config.get('compress_min_size', 256)
+
+        # Default number of updates per read_updates call
+        self.read_chunk_size = config.get('read_chunk_size', 10000)
+
+        # Tables created before compression support have no compressed column (see mysql/upgrades.txt)
+        self._has_compressed_column = len(self._mysql.query('SHOW COLUMNS FROM `inventory_updates` LIKE \'compressed\'')) != 0
+        if not self._has_compressed_column:
+            self.compress = False
+
     def lock(self): #override
         self._mysql.lock_tables(write = ['inventory_updates'])
 
@@ -19,28 +41,68 @@ class MySQLUpdateBoard(UpdateBoard):
         self._mysql.unlock_tables()
 
     def get_updates(self): #override
-        for cmd, obj in self._mysql.xquery('SELECT `cmd`, `obj` FROM `inventory_updates` ORDER BY `id`'):
-            if cmd == 'update':
-                yield DynamoInventory.CMD_UPDATE, obj
-            elif cmd == 'delete':
-                yield DynamoInventory.CMD_DELETE, obj
+        last = 0
+        while True:
+            updates = self.read_updates(last)
+            if len(updates) == 0:
+                break
+
+            for _, cmd, obj in updates:
+                yield cmd, obj
+
+            last = updates[-1][0]
+
+    def read_updates(self, after = 0, max_num = None): #override
+        if max_num is None:
+            max_num = self.read_chunk_size
+
+        if self._has_compressed_column:
+            sql = 'SELECT `id`, `cmd`, `compressed`, `obj`'
+        else:
+            sql = 'SELECT `id`, `cmd`, 0, `obj`'
+        sql += ' FROM `inventory_updates` WHERE `id` > %s ORDER BY `id` LIMIT %s'
+
+        updates = []
+        for seq, cmd, compressed, obj in self._mysql.query(sql, after, max_num):
+            if compressed:
+                obj = zlib.decompress(obj)
+
+            try:
+                updates.append((seq, MySQLUpdateBoard._cmd_values[cmd], obj))
+            except KeyError:
+                pass
+
+        return updates
+
+    def acknowledge(self, last): #override
+        self._mysql.query('DELETE FROM `inventory_updates` WHERE `id` <= %s', last)
 
     def flush(self): #override
         self._mysql.query('DELETE FROM `inventory_updates`')
         self._mysql.query('ALTER TABLE `inventory_updates` AUTO_INCREMENT = 1')
 
     def write_updates(self, update_commands): #override
-        self._mysql.lock_tables(write = ['inventory_updates'])
+        def mapping(command):
+            cmd, sobj = command
+            if not self._has_compressed_column:
+                return (MySQLUpdateBoard._cmd_names[cmd], sobj)
+            elif self.compress and len(sobj) > self.compress_min_size:
+                return (MySQLUpdateBoard._cmd_names[cmd], 1, zlib.compress(sobj))
+            else:
+                return (MySQLUpdateBoard._cmd_names[cmd], 0, sobj)
 
-        try:
-            sql = 'INSERT INTO `inventory_updates` (`cmd`, `obj`) VALUES (%s, %s)'
+        if self._has_compressed_column:
+            fields = ('cmd', 'compressed', 'obj')
+        else:
+            fields = ('cmd', 'obj')
+
+        commands = [c for c in update_commands if c[0] in MySQLUpdateBoard._cmd_names]
 
-            for cmd, sobj in update_commands:
-                if cmd == DynamoInventory.CMD_UPDATE:
-                    self._mysql.query(sql, 'update', sobj)
-                elif cmd == DynamoInventory.CMD_DELETE:
-                    self._mysql.query(sql, 'delete', sobj)
+        # lock so that the receiver sees either none or all of the updates
+        self._mysql.lock_tables(write = ['inventory_updates'])
 
+        try:
+            self._mysql.insert_many('inventory_updates', fields, mapping, commands, do_update = False)
         finally:
             self._mysql.unlock_tables()
 
@@ -1,10 +1,15 @@
 import time
 import logging
+import threading
 import fnmatch
 import hashlib
+import marshal
+import zlib
+import json
 
 from dynamo.core.components.persistency import InventoryStore
 from dynamo.utils.interface.mysql import MySQL
+from dynamo.utils.parallel import Map
 from dynamo.dataformat import Configuration, Partition, Dataset, Block, File, Site, SitePartition, Group, DatasetReplica, BlockReplica
 
 LOG = logging.getLogger(__name__)
@@ -17,6 +22,18 @@ class MySQLInventoryStore(InventoryStore):
 
         self._mysql = MySQL(config.db_params)
 
+        # Number of parallel connections used in load_data. Datasets are split into id ranges (shards)
+        # and the blocks and replicas of each shard are read over a separate connection.
+        self.load_workers = config.get('load_workers', 1)
+        self.load_shards_per_worker = config.get('load_shards_per_worker', 4)
+
+        # Maximum number of entries kept in the change log
+        self.change_log_depth = config.get('change_log_depth', 1000)
+
+        # Number of tables copied in parallel and number of rows per checkpoint in clone_tables
+        self.clone_workers = config.get('clone_workers', 4)
+        self.clone_chunk_size = config.get('clone_chunk_size', 100000)
+
     def close(self):
         self._mysql.close()
 
@@ -29,7 +46,8 @@ class MySQLInventoryStore(InventoryStore):
         return True
 
     def new_handle(self): #override
-        config = Configuration(db_params = self._mysql.config())
+        config = Configuration(db_params = self._mysql.config(), load_workers = self.load_workers, load_shards_per_worker = self.load_shards_per_worker,
+            change_log_depth = self.change_log_depth, clone_workers = self.clone_workers, clone_chunk_size = self.clone_chunk_size)
         return MySQLInventoryStore(config)
 
     def get_partitions(self, conditions): #override
@@ -154,6 +172,27 @@ class MySQLInventoryStore(InventoryStore):
 
         return files
 
+    def get_files_many(self, blocks): #override
+        if LOG.getEffectiveLevel() == logging.DEBUG:
+            LOG.debug('Loading files for %d blocks', len(blocks))
+
+        all_files = dict((block, set()) for block in blocks)
+
+        blocks_by_id = dict((block.id, block) for block in blocks if block.id != 0)
+
+        if len(blocks_by_id) == 0:
+            return all_files
+
+        fields = ('id', 'block_id', 'size', 'name') + tuple(File.checksum_algorithms)
+
+        # select_many splits the id list into IN (...) chunks
+        for row in self._mysql.select_many('files', fields, 'block_id', blocks_by_id.keys()):
+            file_id, block_id, size, name = row[:4]
+            block = blocks_by_id[block_id]
+            all_files[block].add(File(name, block = block, size = size, checksum = row[4:], fid = file_id))
+
+        return all_files
+
     def get_file_id(self, lfn): #override
         LOG.debug('Loading file id for LFN %s', lfn)
 
@@ -177,6 +216,17 @@ class MySQLInventoryStore(InventoryStore):
 
         return result[0][0], Block.to_internal_name(result[0][1])
 
+    def find_blocks_containing(self, lfns): #override
+        sqlbase = 'SELECT f.`name`, d.`name`, b.`name` FROM `files` AS f'
+        sqlbase += ' INNER JOIN `blocks` AS b ON b.`id` = f.`block_id`'
+        sqlbase += ' INNER JOIN `datasets` AS d ON d.`id` = b.`dataset_id`'
+
+        result = {}
+        for lfn, dataset_name, block_name in self._mysql.execute_many(sqlbase, 'f.`name`', lfns):
+            result[lfn] = (dataset_name, Block.to_internal_name(block_name))
+
+        return result
+
     def load_data(self, inventory, group_names = None, site_names = None, dataset_names = None): #override
         ## We need the temporary tables to stay alive
         reuse_connection_orig = self._mysql.reuse_connection
@@ -225,25 +275,39 @@ class MySQLInventoryStore(InventoryStore):
 
         LOG.info('Loaded %d datasets in %.1f seconds.', num, time.time() - start)
 
-        ## Load blocks
-        LOG.info('Loading blocks.')
-        start = time.time()
-
         id_block_maps = {} # {dataset_id: {block_id: block}}
-        num = self._load_blocks(inventory, id_dataset_map, id_block_maps, datasets_tmp)
 
-        num_blocks = sum(len(m) for m in id_block_maps.itervalues())
+        if self.load_workers > 1 and group_names is None and site_names is None and dataset_names is None:
+            ## Load blocks and replicas in parallel
+            # Temporary tables for constraints are connection-local, so the sharded load is only used for full loads
+            LOG.info('Loading blocks and replicas with %d workers.', self.load_workers)
+            start = time.time()
 
-        LOG.info('Loaded %d blocks in %.1f seconds.', num_blocks, time.time() - start)
+            self._load_sharded(inventory, id_group_map, id_site_map, id_dataset_map, id_block_maps)
 
-        ## Load replicas (dataset and block in one go)
-        LOG.info('Loading replicas.')
-        start = time.time()
+            num_blocks = sum(len(m) for m in id_block_maps.itervalues())
+
+            LOG.info('Loaded %d blocks in %.1f seconds.', num_blocks, time.time() - start)
 
-        self._load_replicas(
-            inventory, id_group_map, id_site_map, id_dataset_map, id_block_maps,
-            groups_tmp, sites_tmp, datasets_tmp
-        )
+        else:
+            ## Load blocks
+            LOG.info('Loading blocks.')
+            start = time.time()
+    
+            self._load_blocks(inventory, id_dataset_map, id_block_maps, datasets_tmp)
+    
+            num_blocks = sum(len(m) for m in id_block_maps.itervalues())
+    
+            LOG.info('Loaded %d blocks in %.1f seconds.', num_blocks, time.time() - start)
+    
+            ## Load replicas (dataset and block in one go)
+            LOG.info('Loading replicas.')
+            start = time.time()
+    
+            self._load_replicas(
+                inventory, id_group_map, id_site_map, id_dataset_map, id_block_maps,
+                groups_tmp, sites_tmp, datasets_tmp
+            )
 
         num_dataset_replicas = 0
         num_block_replicas = 0
@@ -293,9 +357,19 @@ class MySQLInventoryStore(InventoryStore):
         return len(id_dataset_map)
 
     def _load_blocks(self, inventory, id_dataset_map, id_block_maps, datasets_tmp):
+        blocks = self._yield_blocks(id_dataset_map = id_dataset_map, datasets_tmp = datasets_tmp)
+        self._fill_blocks(blocks, id_block_maps)
+
+    def _fill_blocks(self, blocks, id_block_maps):
+        """
+        Add blocks to their datasets.
+        @param blocks         Iterable of blocks ordered by dataset id
+        @param id_block_maps  {dataset_id: {block_id: block}} to be filled
+        """
+
         _dataset_id = 0
         dataset = None
-        for block in self._yield_blocks(id_dataset_map = id_dataset_map, datasets_tmp = datasets_tmp):
+        for block in blocks:
             if block.dataset.id != _dataset_id:
                 dataset = block.dataset
                 _dataset_id = dataset.id
@@ -307,6 +381,10 @@ class MySQLInventoryStore(InventoryStore):
             id_block_map[block.id] = block
 
     def _load_replicas(self, inventory, id_group_map, id_site_map, id_dataset_map, id_block_maps, groups_tmp, sites_tmp, datasets_tmp):
+        sql = self._form_replicas_sql(groups_tmp, sites_tmp, datasets_tmp)
+        self._fill_replicas(self._mysql.xquery(sql), id_group_map, id_site_map, id_dataset_map, id_block_maps)
+
+    def _form_replicas_sql(self, groups_tmp = None, sites_tmp = None, datasets_tmp = None, dataset_id_range = None):
         sql = 'SELECT dr.`dataset_id`, dr.`site_id`, dr.`growing`, dr.`group_id`, br.`block_id`, br.`group_id`,'
         sql += ' br.`is_custodial`, UNIX_TIMESTAMP(br.`last_update`),'
         if BlockReplica._use_file_ids:
@@ -331,8 +409,19 @@ class MySQLInventoryStore(InventoryStore):
         if datasets_tmp is not None:
             sql += ' INNER JOIN `%s`.`%s` AS dt ON dt.`id` = dr.`dataset_id`' % (self._mysql.scratch_db, datasets_tmp)
 
+        if dataset_id_range is not None:
+            sql += ' WHERE dr.`dataset_id` BETWEEN %d AND %d' % dataset_id_range
+
         sql += ' ORDER BY dr.`dataset_id`, dr.`site_id`, b.`id`'
 
+        return sql
+
+    def _fill_replicas(self, rows, id_group_map, id_site_map, id_dataset_map, id_block_maps):
+        """
+        Create dataset and block replicas from rows of the replicas query.
+        @param rows  Iterable of rows from the query formed in _form_replicas_sql
+        """
+
         # Blocks are left joined -> there will be (# sites) x (# blocks) x (# block files) entries per dataset
 
         _dataset_id = 0
@@ -341,7 +430,7 @@ class MySQLInventoryStore(InventoryStore):
         file_ids = []
         dataset_replica = None
         block_replica = None
-        for row in self._mysql.xquery(sql):
+        for row in rows:
             if BlockReplica._use_file_ids:
                 dataset_id, site_id, growing, d_group_id, block_id, b_group_id, b_is_custodial, b_last_update, b_is_complete, file_id, file_size = row
             else:
@@ -392,7 +481,7 @@ class MySQLInventoryStore(InventoryStore):
                     # closing the previous block replica
                     if not block_replica_complete:
                         block_replica.size = block_replica_size
-                        block_replica.file_ids = tuple(file_ids)
+                        block_replica.file_ids = BlockReplica.make_file_ids(file_ids)
 
                     block_replica_size = 0
                     del file_ids[:]
@@ -431,7 +520,84 @@ class MySQLInventoryStore(InventoryStore):
 
         if BlockReplica._use_file_ids and block_replica is not None and not block_replica_complete:
             block_replica.size = block_replica_size
-            block_replica.file_ids = tuple(file_ids)
+            block_replica.file_ids = BlockReplica.make_file_ids(file_ids)
+
+    def _load_sharded(self, inventory, id_group_map, id_site_map, id_dataset_map, id_block_maps):
+        """
+        Read blocks and replicas in dataset id ranges, each over its own connection. Shard results are
+        stitched into the inventory in the order of the dataset ids, i.e. the result is identical to that
+        of the serial load. Object construction still happens under the GIL; the gain comes from
+        overlapping the query execution and data transfer of multiple shards.
+        A shard is read only when it is less than load_workers shards ahead of the next shard to be
+        stitched, so at most load_workers shards of rows are held in memory at any time. Increase
+        load_shards_per_worker to reduce the size of a shard.
+        """
+
+        dataset_ids = sorted(id_dataset_map.iterkeys())
+        if len(dataset_ids) == 0:
+            return
+
+        num_shards = min(len(dataset_ids), self.load_workers * self.load_shards_per_worker)
+        shard_size = (len(dataset_ids) + num_shards - 1) / num_shards
+
+        shards = []
+        for ishard, ipos in enumerate(xrange(0, len(dataset_ids), shard_size)):
+            id_range = (dataset_ids[ipos], dataset_ids[min(ipos + shard_size, len(dataset_ids)) - 1])
+            shards.append((ishard, id_range))
+
+        # Number of the next shard to be stitched, guarded by window
+        window = threading.Condition()
+        stitch_state = {'next': 0}
+
+        def read_shard(ishard, id_range):
+            # Threads are started in the order of ishard, so the shard to be stitched next is never
+            # waiting here while later shards occupy all workers.
+            with window:
+                while ishard >= stitch_state['next'] + self.load_workers:
+                    window.wait()
+
+            start = time.time()
+
+            # new connection for each shard
+            store = self.new_handle()
+            try:
+                blocks = list(store._yield_blocks(id_dataset_map = id_dataset_map, dataset_id_range = id_range))
+                blocks_time = time.time() - start
+
+                rows = list(store._mysql.xquery(store._form_replicas_sql(dataset_id_range = id_range)))
+            finally:
+                store.close()
+
+            LOG.info('Read shard %d (dataset id %d-%d): %d blocks in %.1f seconds, %d replica rows in %.1f seconds.',
+                ishard, id_range[0], id_range[1], len(blocks), blocks_time, len(rows), time.time() - start - blocks_time)
+
+            return ishard, blocks, rows
+
+        pool = Map(Configuration(num_threads = self.load_workers, repeat_on_exception = False))
+        pool.logger = LOG
+
+        # Shards complete in random order. Stitch them in order of ishard as soon as all preceding shards are in.
+        pending = {}
+        next_shard = 0
+        for ishard, blocks, rows in pool.execute(read_shard, shards, async = True):
+            pending[ishard] = (blocks, rows)
+
+            while next_shard in pending:
+                start = time.time()
+
+                blocks, rows = pending.pop(next_shard)
+                self._fill_blocks(blocks, id_block_maps)
+                self._fill_replicas(rows, id_group_map, id_site_map, id_dataset_map, id_block_maps)
+                # release the rows before waiting for the next shard
+                blocks = rows = None
+
+                LOG.debug('Stitched shard %d in %.1f seconds.', next_shard, time.time() - start)
+
+                next_shard += 1
+
+                with window:
+                    stitch_state['next'] = next_shard
+                    window.notify_all()
 
     def _setup_constraints(self, table, names):
         tmp_table = table + '_load'
@@ -698,17 +864,183 @@ class MySQLInventoryStore(InventoryStore):
         return num
 
     def _clone_from_common_class(self, source): #override
-        # Do the closest thing to INSERT SELECT
+        self.clone_tables(source)
+
+    # Inventory tables and the unique keys used to copy them in chunks (None: copied in one piece)
+    _clone_table_keys = [
+        ('partitions', ('id',)),
+        ('groups', ('id',)),
+        ('sites', ('id',)),
+        ('quotas', ('site_id', 'partition_id')),
+        ('software_versions', ('id',)),
+        ('filename_mappings', None),
+        ('datasets', ('id',)),
+        ('blocks', ('id',)),
+        ('files', ('id',)),
+        ('dataset_replicas', ('dataset_id', 'site_id')),
+        ('block_replicas', ('block_id', 'site_id')),
+        ('block_replica_files', ('file_id', 'site_id')),
+        ('block_replica_sizes', ('block_id', 'site_id'))
+    ]
+
+    def clone_tables(self, source, num_workers = None, chunk_size = None, progress = None):
+        """
+        Copy all inventory tables from another MySQL store. Tables are streamed in parallel, each over its own
+        pair of connections, in chunks ordered by a unique key. The last copied key of each table is recorded
+        in the clone_checkpoints table after every chunk, so that an interrupted clone from the same source
+        resumes where it stopped. At the end, row counts and table checksums are compared to the source.
+        @param source      MySQLInventoryStore
+        @param num_workers Number of tables copied in parallel (default clone_workers).
+        @param chunk_size  Number of rows per chunk (default clone_chunk_size).
+        @param progress    Function called as progress(table, rows copied, total rows) after each chunk.
+
+        @return {table: number of rows}
+        """
+
+        if num_workers is None:
+            num_workers = self.clone_workers
+        if chunk_size is None:
+            chunk_size = self.clone_chunk_size
+
+        source_id = '%s/%s' % (source._mysql.hostname(), source._mysql.db_name())
+
+        def copy_table(table, key):
+            src = MySQL(source._mysql.config())
+            dst = MySQL(self._mysql.config())
+            try:
+                return self._clone_table(src, dst, source_id, table, key, chunk_size, progress)
+            finally:
+                src.close()
+                dst.close()
+
+        pool = Map(Configuration(num_threads = num_workers, repeat_on_exception = False))
+        pool.logger = LOG
+
+        results = {}
+        failed = []
+        for table, num_rows, verified in pool.execute(copy_table, MySQLInventoryStore._clone_table_keys):
+            results[table] = num_rows
+            if not verified:
+                failed.append(table)
+
+        if len(failed) != 0:
+            # checkpoints of the failed tables are reset; these tables will be copied from scratch next time
+            raise RuntimeError('Cloned tables %s do not match the source.' % ', '.join(sorted(failed)))
+
+        self._mysql.query('DELETE FROM `clone_checkpoints`')
+
+        return results
+
+    @staticmethod
+    def _keyset_condition(key):
+        """
+        Form the condition selecting rows after a given value of a multi-column key. The row-value comparison
+        (k1, k2) > (v1, v2) is not resolved into an index range by MySQL before 5.7.3, which makes every chunk
+        a full table scan. The condition is therefore expanded as
+        k1 >= v1 AND (k1 > v1 OR (k1 = v1 AND k2 > v2)), where the leading term restricts the scan to a range
+        of the primary key.
+        @param key  Tuple of column names
+        @return (SQL string with placeholders, function mapping the last key value to the list of arguments)
+        """
+
+        if len(key) == 1:
+            return '`%s` > %%s' % key[0], lambda last_key: [last_key[0]]
+
+        # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+        terms = []
+        indices = []
+        for ik in xrange(len(key)):
+            eqs = ['`%s` = %%s' % k for k in key[:ik]]
+            terms.append('(' + ' AND '.join(eqs + ['`%s` > %%s' % key[ik]]) + ')')
+            indices.extend(range(ik + 1))
+
+        sql = '`%s` >= %%s AND (%s)' % (key[0], ' OR '.join(terms))
+        indices.insert(0, 0)
+
+        return sql, lambda last_key: [last_key[i] for i in indices]
+
+    def _clone_table(self, src, dst, source_id, table, key, chunk_size, progress):
+        start = time.time()
+
+        fields = tuple(row[0] for row in dst.query('SHOW COLUMNS FROM `%s`' % table))
+        fields_str = ', '.join('`%s`' % f for f in fields)
+
+        total_rows = src.query('SELECT COUNT(*) FROM `%s`' % table)[0]
 
-        tables = ['partitions', 'groups', 'sites', 'quotas', 'software_versions', 'filename_mappings',
-                  'datasets', 'blocks', 'files', 'dataset_replicas', 'block_replicas', 'block_replica_files', 'block_replica_sizes']
+        sql = 'SELECT `source`, `last_key`, `num_rows`, `status` FROM `clone_checkpoints` WHERE `table_name` = %s'
+        checkpoint = dst.query(sql, table)
 
-        for table in tables:
-            fields = tuple(row[0] for row in self._mysql.query('SHOW COLUMNS FROM `%s`' % table))
-            fields_str = ', '.join('`%s`' % f for f in fields)
-            self._mysql.query('TRUNCATE TABLE `%s`' % table)
-            rows = source._mysql.xquery('SELECT %s FROM `%s`' % (fields_str, table))
-            self._mysql.insert_many(table, fields, None, rows, do_update = False)
+        if len(checkpoint) != 0 and checkpoint[0][0] == source_id:
+            _, last_key, num_rows, status = checkpoint[0]
+            if last_key is not None:
+                last_key = tuple(json.loads(last_key))
+
+            LOG.info('Resuming the copy of %s after %d rows.', table, num_rows)
+        else:
+            last_key = None
+            num_rows = 0
+            status = 'copying'
+
+            dst.query('TRUNCATE TABLE `%s`' % table)
+            fields_cp = ('table_name', 'source', 'last_key', 'num_rows', 'status')
+            dst.insert_update('clone_checkpoints', fields_cp, table, source_id, None, 0, status)
+
+        if status == 'copying':
+            if key is None:
+                # small table without a unique key
+                dst.query('TRUNCATE TABLE `%s`' % table)
+                rows = src.query('SELECT %s FROM `%s`' % (fields_str, table))
+                dst.insert_many(table, fields, None, rows, do_update = False)
+                num_rows = len(rows)
+
+            else:
+                key_indices = [fields.index(k) for k in key]
+                after_key_sql, after_key_args = MySQLInventoryStore._keyset_condition(key)
+
+                sqlbase = 'SELECT %s FROM `%s`' % (fields_str, table)
+                sqltail = ' ORDER BY %s LIMIT %d' % (', '.join('`%s`' % k for k in key), chunk_size)
+
+                while True:
+                    if last_key is None:
+                        rows = src.query(sqlbase + sqltail)
+                    else:
+                        sql = sqlbase + ' WHERE ' + after_key_sql + sqltail
+                        rows = src.query(sql, *after_key_args(last_key))
+
+                    if len(rows) == 0:
+                        break
+
+                    # chunks may be copied twice when resuming
+                    dst.insert_many(table, fields, None, rows, do_update = True)
+
+                    last_key = tuple(rows[-1][i] for i in key_indices)
+                    num_rows += len(rows)
+
+                    sql = 'UPDATE `clone_checkpoints` SET `last_key` = %s, `num_rows` = %s WHERE `table_name` = %s'
+                    dst.query(sql, json.dumps(last_key), num_rows, table)
+
+                    if progress is not None:
+                        progress(table, num_rows, total_rows)
+
+            dst.query("UPDATE `clone_checkpoints` SET `num_rows` = %s, `status` = 'done' WHERE `table_name` = %s", num_rows, table)
+
+        if progress is not None:
+            progress(table, num_rows, total_rows)
+
+        # Verification
+        src_count = src.query('SELECT COUNT(*) FROM `%s`' % table)[0]
+        dst_count = dst.query('SELECT COUNT(*) FROM `%s`' % table)[0]
+        src_checksum = src.query('CHECKSUM TABLE `%s`' % table)[0][1]
+        dst_checksum = dst.query('CHECKSUM TABLE `%s`' % table)[0][1]
+
+        if src_count != dst_count or src_checksum != dst_checksum:
+            LOG.error('Clone of table %s does not match the source (rows %d/%d, checksum %s/%s).', table, dst_count, src_count, dst_checksum, src_checksum)
+            dst.query('DELETE FROM `clone_checkpoints` WHERE `table_name` = %s', table)
+            return table, dst_count, False
+
+        LOG.info('Copied table %s (%d rows) in %.1f seconds.', table, dst_count, time.time() - start)
+
+        return table, dst_count, True
 
     def _yield_partitions(self): #override
         sql = 'SELECT `id`, `name` FROM `partitions`'
@@ -820,13 +1152,16 @@ class MySQLInventoryStore(InventoryStore):
 
             yield dataset
 
-    def _yield_blocks(self, id_dataset_map = None, datasets_tmp = None): #override
+    def _yield_blocks(self, id_dataset_map = None, datasets_tmp = None, dataset_id_range = None): #override
         sql = 'SELECT b.`id`, d.`id`, d.`name`, b.`name`, b.`size`, b.`num_files`, b.`is_open`, UNIX_TIMESTAMP(b.`last_update`) FROM `blocks` AS b'
         sql += ' INNER JOIN `datasets` AS d ON d.`id` = b.`dataset_id`'
 
         if datasets_tmp is not None:
             sql += ' INNER JOIN `%s`.`%s` AS t ON t.`id` = b.`dataset_id`' % (self._mysql.scratch_db, datasets_tmp)
 
+        if dataset_id_range is not None:
+            sql += ' WHERE b.`dataset_id` BETWEEN %d AND %d' % dataset_id_range
+
         sql += ' ORDER BY b.`dataset_id`'
 
         _dataset_id = 0
@@ -980,7 +1315,7 @@ class MySQLInventoryStore(InventoryStore):
                 if BlockReplica._use_file_ids and block_replica is not None:
                     if not block_replica_complete:
                         block_replica.size = block_replica_size
-                        block_replica.file_ids = tuple(file_ids)
+                        block_replica.file_ids = BlockReplica.make_file_ids(file_ids)
 
                     yield block_replica
 
@@ -1015,10 +1350,154 @@ class MySQLInventoryStore(InventoryStore):
             # if true, we have one last one to yield
             if not block_replica_complete:
                 block_replica.size = block_replica_size
-                block_replica.file_ids = tuple(file_ids)
+                block_replica.file_ids = BlockReplica.make_file_ids(file_ids)
 
             yield block_replica
             
+    def save_many(self, objects): #override
+        # Dataset and block replicas are written in bulk. Everything else is saved one by one, before the
+        # replicas, since replicas may refer to new blocks (whose ids are set by save_block)
+        dataset_replicas = []
+        block_replicas = []
+
+        for obj in objects:
+            if type(obj) is DatasetReplica:
+                dataset_replicas.append(obj)
+            elif type(obj) is BlockReplica:
+                block_replicas.append(obj)
+            else:
+                obj.write_into(self)
+
+        # one commit for all bulk statements (transactions need a persistent connection)
+        reuse_orig = self._mysql.reuse_connection
+        self._mysql.reuse_connection = True
+
+        try:
+            with self._mysql.transaction():
+                if len(dataset_replicas) != 0:
+                    self._update_dataset_replicas(dataset_replicas)
+
+                if len(block_replicas) != 0:
+                    self._update_block_replicas(block_replicas)
+        finally:
+            self._mysql.reuse_connection = reuse_orig
+
+    def delete_many(self, objects): #override
+        dataset_replicas = []
+        block_replicas = []
+
+        for obj in objects:
+            if type(obj) is DatasetReplica:
+                dataset_replicas.append(obj)
+            elif type(obj) is BlockReplica:
+                block_replicas.append(obj)
+            else:
+                obj.delete_from(self)
+
+        reuse_orig = self._mysql.reuse_connection
+        self._mysql.reuse_connection = True
+
+        try:
+            with self._mysql.transaction():
+                if len(dataset_replicas) != 0:
+                    self._remove_dataset_replicas(dataset_replicas)
+
+                if len(block_replicas) != 0:
+                    self._remove_block_replicas(block_replicas)
+        finally:
+            self._mysql.reuse_connection = reuse_orig
+
+    def _update_dataset_replicas(self, replicas):
+        """
+        Bulk version of save_datasetreplica.
+        """
+
+        replicas = [r for r in replicas if r.dataset.id != 0 and r.site.id != 0]
+
+        fields = ('dataset_id', 'site_id', 'growing', 'group_id')
+        mapping = lambda r: (r.dataset.id, r.site.id, r.growing, r.group.id if r.growing else None)
+
+        self._mysql.insert_many('dataset_replicas', fields, mapping, replicas)
+
+    def _update_block_replicas(self, replicas):
+        """
+        Bulk version of save_blockreplica.
+        """
+
+        replicas = [r for r in replicas if r.block.id != 0 and r.site.id != 0]
+
+        fields = ('block_id', 'site_id', 'group_id', 'is_custodial', 'last_update', 'is_complete')
+        mapping = lambda r: (r.block.id, r.site.id, r.group.id, r.is_custodial, \
+                             time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(r.last_update)), r.is_complete())
+
+        self._mysql.insert_many('block_replicas', fields, mapping, replicas)
+
+        full = []
+        partial = []
+        for replica in replicas:
+            if replica.is_complete() or replica.file_ids is None:
+                # see save_blockreplica
+                full.append((replica.block.id, replica.site.id))
+            else:
+                partial.append(replica)
+
+        if BlockReplica._use_file_ids:
+            self._mysql.delete_many('block_replica_files', ('block_id', 'site_id'), full)
+
+            def file_rows():
+                for replica in partial:
+                    for fid in replica.file_ids:
+                        yield (replica.block.id, replica.site.id, fid)
+
+            fields = ('block_id', 'site_id', 'file_id')
+            self._mysql.insert_many('block_replica_files', fields, None, file_rows())
+
+        else:
+            self._mysql.delete_many('block_replica_sizes', ('block_id', 'site_id'), full)
+
+            fields = ('block_id', 'site_id', 'num_files', 'size')
+            mapping = lambda r: (r.block.id, r.site.id, r.file_ids, r.size)
+            self._mysql.insert_many('block_replica_sizes', fields, mapping, partial)
+
+    def _remove_dataset_replicas(self, replicas):
+        """
+        Bulk version of delete_datasetreplica.
+        """
+
+        keys = [(r.dataset.id, r.site.id) for r in replicas if r.dataset.id != 0 and r.site.id != 0]
+
+        sqlbase = 'DELETE FROM br, brf, brs USING `blocks` AS b'
+        sqlbase += ' INNER JOIN `block_replicas` AS br ON br.`block_id` = b.`id`'
+        sqlbase += ' LEFT JOIN `block_replica_files` AS brf ON brf.`block_id` = b.`id` AND brf.`site_id` = br.`site_id`'
+        sqlbase += ' LEFT JOIN `block_replica_sizes` AS brs ON brs.`block_id` = b.`id` AND brs.`site_id` = br.`site_id`'
+
+        self._mysql.execute_many(sqlbase, MySQL.bare('(b.`dataset_id`, br.`site_id`)'), keys)
+
+        self._mysql.delete_many('dataset_replicas', ('dataset_id', 'site_id'), keys)
+
+    def _remove_block_replicas(self, replicas):
+        """
+        Bulk version of delete_blockreplica.
+        """
+
+        replicas = [r for r in replicas if r.block.dataset.id != 0 and r.block.id != 0 and r.site.id != 0]
+
+        keys = [(r.block.id, r.site.id) for r in replicas]
+
+        self._mysql.delete_many('block_replicas', ('block_id', 'site_id'), keys)
+        self._mysql.delete_many('block_replica_files', ('block_id', 'site_id'), keys)
+        self._mysql.delete_many('block_replica_sizes', ('block_id', 'site_id'), keys)
+
+        # delete the dataset replicas that became empty
+        dataset_site_keys = set((r.block.dataset.id, r.site.id) for r in replicas)
+
+        sqlbase = 'SELECT DISTINCT b.`dataset_id`, br.`site_id` FROM `block_replicas` AS br'
+        sqlbase += ' INNER JOIN `blocks` AS b ON b.`id` = br.`block_id`'
+
+        nonempty = set(self._mysql.execute_many(sqlbase, MySQL.bare('(b.`dataset_id`, br.`site_id`)'), dataset_site_keys))
+
+        self._mysql.delete_many('dataset_replicas', ('dataset_id', 'site_id'), dataset_site_keys - nonempty)
+
     def save_block(self, block): #override
         dataset_id = block.dataset.id
         if dataset_id == 0:
@@ -1295,3 +1774,19 @@ class MySQLInventoryStore(InventoryStore):
             csstr += cksum
 
         return hashlib.md5(csstr).hexdigest()
+
+    def log_changes(self, version, commands): #override
+        data = zlib.compress(marshal.dumps(list(commands), 2))
+
+        entry_id = self._mysql.insert_get_id('inventory_changes', columns = ('version', 'commands'), values = (version, data))
+
+        self._mysql.query('DELETE FROM `inventory_changes` WHERE `id` <= %s', entry_id - self.change_log_depth)
+
+    def get_changes(self, version, max_entries = 100): #override
+        last_id = self._mysql.query('SELECT MAX(`id`) FROM `inventory_changes` WHERE `version` = %s', version)[0]
+        if last_id is None:
+            return None
+
+        sql = 'SELECT `version`, `commands` FROM `inventory_changes` WHERE `id` > %s ORDER BY `id` LIMIT %s'
+
+        return [(v, marshal.loads(zlib.decompress(data))) for v, data in self._mysql.query(sql, last_id, max_entries)]
@@ -0,0 +1,322 @@
+import os
+import time
+import marshal
+import logging
+
+from dynamo.dataformat import Dataset, Block, Site, SitePartition, Group, DatasetReplica, BlockReplica
+
+LOG = logging.getLogger(__name__)
+
+class InventoryImage(object):
+    """
+    On-disk snapshot of the full inventory content. The image is a stream of flat marshal records
+    (tuples of simple types), written in an order that allows building the object graph in a single
+    pass without any lookups by name:
+      header, groups, sites, quotas, software version table, then for each dataset:
+      dataset, its blocks, and for each dataset replica: dataset replica, its block replicas.
+    Records refer to groups, sites, and blocks by their position in the stream (not by the store
+    ids, which are not guaranteed to be set for objects created in memory).
+    The header carries a tag (normally the store version) and the image is only loaded if the tag
+    matches, so a stale image is never used.
+    """
+
+    MAGIC = 'dynamo-inventory-image'
+    FORMAT_VERSION = 1
+
+    REC_GROUP, REC_SITE, REC_QUOTA, REC_SOFTWARE_VERSIONS, REC_DATASET, REC_BLOCK, REC_DATASET_REPLICA, REC_BLOCK_REPLICA, REC_END = range(9)
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def read_tag(self):
+        """
+        @return The tag of the existing image or None if there is no valid image.
+        """
+
+        try:
+            with open(self.path, 'rb') as source:
+                return self._read_header(source)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+    def write(self, inventory, tag):
+        """
+        Write the inventory content. The image is first written to a temporary file and then moved
+        in place so that a crash while writing never leaves a truncated image behind.
+        @param inventory  DynamoInventory (fully loaded)
+        @param tag        String identifying the inventory state (e.g. store version)
+
+        @return Number of records written.
+        """
+
+        tmp_path = self.path + '.tmp'
+
+        start = time.time()
+
+        num_records = 0
+        with open(tmp_path, 'wb') as output:
+            for record in self._records(inventory, tag):
+                marshal.dump(record, output)
+                num_records += 1
+
+        os.rename(tmp_path, self.path)
+
+        LOG.info('Wrote %d records to inventory image %s in %.1f seconds.', num_records, self.path, time.time() - start)
+
+        return num_records
+
+    def read(self, inventory, tag):
+        """
+        Load the inventory content from the image. Inventory partitions must already be set up
+        and all other containers must be empty.
+        @param inventory  DynamoInventory
+        @param tag        Expected tag of the image.
+
+        @return True if the image was loaded, False if it does not exist or has a different tag.
+        """
+
+        start = time.time()
+
+        try:
+            source = open(self.path, 'rb')
+        except IOError:
+            LOG.info('Inventory image %s does not exist.', self.path)
+            return False
+
+        with source:
+            try:
+                image_tag = self._read_header(source)
+            except (EOFError, ValueError, TypeError):
+                LOG.warning('Inventory image %s is corrupt.', self.path)
+                return False
+
+            if image_tag != tag:
+                LOG.info('Inventory image %s is outdated (tag %s, expected %s).', self.path, image_tag, tag)
+                return False
+
+            self._decode(source, inventory)
+
+        LOG.info('Loaded inventory image %s in %.1f seconds.', self.path, time.time() - start)
+
+        return True
+
+    def _read_header(self, source):
+        magic, format_version, use_file_ids, tag = marshal.load(source)
+        if magic != InventoryImage.MAGIC or format_version != InventoryImage.FORMAT_VERSION:
+            raise ValueError('Not an inventory image')
+
+        if use_file_ids != BlockReplica._use_file_ids:
+            # image written with a different block replica format
+            return None
+
+        return tag
+
+    def _records(self, inventory, tag):
+        yield (InventoryImage.MAGIC, InventoryImage.FORMAT_VERSION, BlockReplica._use_file_ids, tag)
+
+        # {id(object): position}
+        group_indices = {id(Group.null_group): 0}
+        site_indices = {}
+
+        for group in inventory.groups.itervalues():
+            if group is Group.null_group:
+                continue
+
+            group_indices[id(group)] = len(group_indices)
+            yield (InventoryImage.REC_GROUP, group.id, group.name, Group.olevel_name(group.olevel))
+
+        for site in inventory.sites.itervalues():
+            site_indices[id(site)] = len(site_indices)
+            mapping = dict((protocol, m._chains) for protocol, m in site.filename_mapping.iteritems())
+            yield (InventoryImage.REC_SITE, site.id, site.name, site.host, site.storage_type, site.backend, site.status, mapping)
+
+        for site in inventory.sites.itervalues():
+            for partition, site_partition in site.partitions.iteritems():
+                if partition.subpartitions is None:
+                    yield (InventoryImage.REC_QUOTA, site_indices[id(site)], partition.name, site_partition.quota)
+
+        versions = [(v.id, v.value) for v in Dataset._software_versions_byid if v.value is not None]
+        yield (InventoryImage.REC_SOFTWARE_VERSIONS, versions)
+
+        for dataset in inventory.datasets.itervalues():
+            yield (InventoryImage.REC_DATASET, dataset.id, dataset.name, dataset.status, dataset.data_type,
+                dataset._software_version_id, dataset.last_update, dataset.is_open)
+
+            block_indices = {}
+            for block in dataset.blocks:
+                block_indices[id(block)] = len(block_indices)
+                yield (InventoryImage.REC_BLOCK, block.id, block.name, block.size, block.num_files, block.is_open, block.last_update)
+
+            for dataset_replica in dataset.replicas:
+                if dataset_replica.group is None:
+                    group_index = 0
+                else:
+                    group_index = group_indices[id(dataset_replica.group)]
+
+                yield (InventoryImage.REC_DATASET_REPLICA, site_indices[id(dataset_replica.site)], dataset_replica.growing, group_index)
+
+                for block_replica in dataset_replica.block_replicas:
+                    if BlockReplica._use_file_ids:
+                        if block_replica.file_ids is None:
+                            file_ids = None
+                        else:
+                            # marshal does not handle arrays
+                            file_ids = list(block_replica.file_ids)
+                    else:
+                        file_ids = block_replica.file_ids
+
+                    yield (InventoryImage.REC_BLOCK_REPLICA, block_indices[id(block_replica.block)], group_indices[id(block_replica.group)],
+                        block_replica.is_custodial, block_replica.last_update, block_replica.size, file_ids)
+
+        yield (InventoryImage.REC_END,)
+
+    def _decode(self, source, inventory):
+        """
+        Streaming decoder. Mirrors MySQLInventoryStore.load_data.
+        """
+
+        groups = [inventory.groups[None]]
+        sites = []
+
+        num_datasets = 0
+        num_blocks = 0
+        num_dataset_replicas = 0
+        num_block_replicas = 0
+
+        dataset = None
+        blocks = None
+        dataset_replica = None
+
+        while True:
+            record = marshal.load(source)
+            rtype = record[0]
+
+            if rtype == InventoryImage.REC_BLOCK_REPLICA:
+                # most frequent record first
+                _, block_index, group_index, is_custodial, last_update, size, file_ids = record
+
+                if file_ids is None:
+                    size = -1
+
+                block = blocks[block_index]
+                block_replica = BlockReplica(
+                    block,
+                    dataset_replica.site,
+                    groups[group_index],
+                    is_custodial = is_custodial,
+                    size = size,
+                    last_update = last_update,
+                    file_ids = file_ids
+                )
+
+                dataset_replica.block_replicas.add(block_replica)
+                block.replicas.add(block_replica)
+                num_block_replicas += 1
+
+                continue
+
+            if dataset_replica is not None:
+                # add to dataset and site after filling all block replicas (see MySQLInventoryStore._load_replicas)
+                dataset_replica.dataset.replicas.add(dataset_replica)
+                dataset_replica.site.add_dataset_replica(dataset_replica, add_block_replicas = True)
+                dataset_replica = None
+
+            if rtype == InventoryImage.REC_BLOCK:
+                _, block_id, name, size, num_files, is_open, last_update = record
+                block = Block(
+                    name,
+                    dataset,
+                    size = size,
+                    num_files = num_files,
+                    is_open = is_open,
+                    last_update = last_update,
+                    bid = block_id
+                )
+                dataset.blocks.add(block)
+                blocks.append(block)
+                num_blocks += 1
+
+            elif rtype == InventoryImage.REC_DATASET_REPLICA:
+                _, site_index, growing, group_index = record
+                dataset_replica = DatasetReplica(dataset, sites[site_index])
+                if growing:
+                    dataset_replica.growing = True
+                    dataset_replica.group = groups[group_index]
+
+                num_dataset_replicas += 1
+
+            elif rtype == InventoryImage.REC_DATASET:
+                _, dataset_id, name, status, data_type, sw_version_id, last_update, is_open = record
+                dataset = Dataset(
+                    name,
+                    status = status,
+                    data_type = data_type,
+                    last_update = last_update,
+                    is_open = is_open,
+                    did = dataset_id
+                )
+                dataset._software_version_id = sw_version_id
+                inventory.datasets.add(dataset)
+                blocks = []
+                num_datasets += 1
+
+            elif rtype == InventoryImage.REC_SOFTWARE_VERSIONS:
+                self._init_software_versions(record[1])
+
+            elif rtype == InventoryImage.REC_SITE:
+                _, site_id, name, host, storage_type, backend, status, mapping = record
+                site = Site(
+                    name,
+                    host = host,
+                    storage_type = storage_type,
+                    backend = backend,
+                    status = status,
+                    filename_mapping = mapping,
+                    sid = site_id
+                )
+                inventory.sites.add(site)
+                sites.append(site)
+
+                for partition in inventory.partitions.itervalues():
+                    site.partitions[partition] = SitePartition(site, partition)
+
+            elif rtype == InventoryImage.REC_QUOTA:
+                _, site_index, partition_name, quota = record
+                try:
+                    partition = inventory.partitions[partition_name]
+                except KeyError:
+                    # partition no longer defined
+                    continue
+
+                sites[site_index].partitions[partition].set_quota(quota)
+
+            elif rtype == InventoryImage.REC_GROUP:
+                _, group_id, name, olevel = record
+                group = Group(name, olevel = olevel, gid = group_id)
+                inventory.groups.add(group)
+                groups.append(group)
+
+            elif rtype == InventoryImage.REC_END:
+                break
+
+            else:
+                raise ValueError('Unknown record type %s in inventory image' % str(rtype))
+
+        LOG.info('Read %d groups, %d sites, %d datasets, %d blocks, %d dataset replicas, %d block replicas from the image.',
+            len(groups), len(sites), num_datasets, num_blocks, num_dataset_replicas, num_block_replicas)
+
+    def _init_software_versions(self, versions):
+        # same as in MySQLInventoryStore._yield_datasets
+        maxid = max([vid for vid, _ in versions] + [0])
+
+        Dataset._software_versions_byid = [Dataset.SoftwareVersion(None, 0)] * (maxid + 1)
+        Dataset._software_versions_byvalue = {}
+
+        for vid, value in versions:
+            version = Dataset.SoftwareVersion(value, vid)
+            Dataset._software_versions_byid[vid] = version
+            Dataset._software_versions_byvalue[value] = version
+
@@ -0,0 +1,84 @@
+import collections
+
+class LFNCache(object):
+    """
+    Bounded LRU cache of {lfn: (dataset name, block internal name)} used to resolve file names to blocks
+    without querying the persistency store. Keeps a reverse index by block so that entries can be
+    invalidated when a block or a dataset is deleted.
+    """
+
+    def __init__(self, max_size = 100000):
+        self.max_size = max_size
+
+        self._blocks = collections.OrderedDict() # {lfn: (dataset name, block name)}, least recently used first
+        self._lfns = {} # {(dataset name, block name): set(lfns)}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def get(self, lfn):
+        """
+        @return (dataset name, block name) or None
+        """
+
+        try:
+            key = self._blocks.pop(lfn)
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self._blocks[lfn] = key
+        self.hits += 1
+
+        return key
+
+    def put(self, lfn, key):
+        if self.max_size <= 0:
+            return
+
+        self.invalidate_file(lfn)
+
+        while len(self._blocks) >= self.max_size:
+            old_lfn, old_key = self._blocks.popitem(last = False)
+            self._unlink(old_lfn, old_key)
+
+        self._blocks[lfn] = key
+
+        try:
+            self._lfns[key].add(lfn)
+        except KeyError:
+            self._lfns[key] = set([lfn])
+
+    def invalidate_file(self, lfn):
+        try:
+            key = self._blocks.pop(lfn)
+        except KeyError:
+            return
+
+        self._unlink(lfn, key)
+
+    def invalidate_block(self, dataset_name, block_name):
+        try:
+            lfns = self._lfns.pop((dataset_name, block_name))
+        except KeyError:
+            return
+
+        for lfn in lfns:
+            self._blocks.pop(lfn, None)
+
+    def invalidate_dataset(self, dataset_name):
+        for key in [key for key in self._lfns if key[0] == dataset_name]:
+            self.invalidate_block(*key)
+
+    def clear(self):
+        self._blocks.clear()
+        self._lfns.clear()
+
+    def _unlink(self, lfn, key):
+        lfns = self._lfns[key]
+        lfns.discard(lfn)
+        if len(lfns) == 0:
+            self._lfns.pop(key)
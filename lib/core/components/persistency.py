@@ -86,6 +86,18 @@ class InventoryStore(object):
         
         raise NotImplementedError('get_files')
 
+    def get_files_many(self, blocks):
+        """
+        Return the files of multiple blocks. Implementations should override this method with
+        a batched query; the default falls back to get_files for each block.
+
+        @param blocks  A list of Block objects.
+
+        @return {block: set of files}
+        """
+
+        return dict((block, self.get_files(block)) for block in blocks)
+
     def get_file_id(self, lfn):
         """
         Return the id of a file with the given LFN.
@@ -108,6 +120,24 @@ class InventoryStore(object):
 
         raise NotImplementedError('find_block_containing')
 
+    def find_blocks_containing(self, lfns):
+        """
+        Batched version of find_block_containing. Implementations should override this method with
+        a batched query; the default falls back to find_block_containing for each LFN.
+
+        @param lfns  A list of logical file names.
+
+        @return {lfn: (dataset_name, block_name)} for the files found.
+        """
+
+        result = {}
+        for lfn in lfns:
+            names = self.find_block_containing(lfn)
+            if names is not None:
+                result[lfn] = names
+
+        return result
+
     def load_data(self, inventory, group_names = None, site_names = None, dataset_names = None):
         """
         Load data into inventory.
@@ -292,6 +322,29 @@ class InventoryStore(object):
 
         LOG.info('Saved %d block replicas.', num)
 
+    def save_many(self, objects):
+        """
+        Save multiple objects. Implementations can override this method to write in bulk; the default
+        calls write_into of each object in order. Objects that other objects in the list depend on
+        (e.g. a new block and its replicas) must come first.
+
+        @param objects  List of dataformat objects
+        """
+
+        for obj in objects:
+            obj.write_into(self)
+
+    def delete_many(self, objects):
+        """
+        Delete multiple objects. Implementations can override this method to write in bulk; the default
+        calls delete_from of each object in order.
+
+        @param objects  List of dataformat objects
+        """
+
+        for obj in objects:
+            obj.delete_from(self)
+
     def save_block(self, block):
         raise NotImplementedError('save_block')
 
@@ -391,3 +444,23 @@ class InventoryStore(object):
         Return the version identifier of the current store state.
         """
         raise NotImplementedError('version')
+
+    def log_changes(self, version, commands):
+        """
+        Append an entry to the change log. The change log is a bounded list of inventory update batches keyed
+        by the store version after the batch, used by starting servers to catch up with the other servers
+        without cloning the full store. The default implementation keeps no log.
+        @param version   Store version after applying the commands.
+        @param commands  List of (cmd, encoded object).
+        """
+        pass
+
+    def get_changes(self, version, max_entries = 100):
+        """
+        Return the change log entries recorded after the (last) entry with the given version.
+        @param version      Store version of the client.
+        @param max_entries  Maximum number of entries to return.
+
+        @return List of (version, commands) in the order of application, or None if the version is not in the log.
+        """
+        return None
@@ -0,0 +1,310 @@
+import os
+import time
+import marshal
+import logging
+import threading
+import collections
+
+from dynamo.dataformat import ObjectCodec, DatasetReplica, BlockReplica, File, SitePartition
+from dynamo.utils.log import log_exception
+
+LOG = logging.getLogger(__name__)
+
+class StoreWriteQueue(object):
+    """
+    Write-behind queue of inventory store operations. Operations (cmd, object) are put in the queue by
+    the main thread and applied to the store in order by a writer thread, which uses its own store handle
+    (connection). A snapshot of the object is taken when the operation is queued, so that the writer never
+    sees objects that are being modified by the main thread. Ids assigned by the store are copied back to
+    the live objects. Repeated updates of the same object collapse into one entry holding the latest
+    snapshot. The entry of a replica, file, or quota moves to the position of the latest update (it may
+    refer to a new group or block updated in between), while datasets, blocks, sites, groups, and
+    partitions keep the position of the first update (ids are assigned when they are saved and are needed
+    by later entries).
+    If a journal path is given, every operation is also appended to the journal file, which is truncated
+    whenever the queue is fully drained. A journal left behind by a crashed server can be read back with
+    read_journal() and replayed.
+    """
+
+    # same as DynamoInventory
+    CMD_UPDATE, CMD_DELETE = range(2)
+
+    # Types whose collapsed update moves to the latest position
+    _LEAF_TYPES = (DatasetReplica, BlockReplica, File, SitePartition)
+
+    def __init__(self, store, journal_path = None, batch_size = 10000):
+        self.store = store
+        # handle of the store used by the writer thread (see start)
+        self._writer_store = None
+        self.journal_path = journal_path
+        # maximum number of operations written in one go
+        self.batch_size = batch_size
+
+        self._cond = threading.Condition()
+        # [cmd, obj, snapshot] entries; cmd is None for entries superseded by a later update
+        self._entries = collections.deque()
+        # {id(obj): entry} for objects with a queued update
+        self._queued_updates = {}
+        # number of operations queued or being written
+        self._num_pending = 0
+
+        self._journal = None
+        self._thread = None
+        self._stop = False
+        self._error = None
+
+    def start(self):
+        if self.journal_path:
+            self._journal = open(self.journal_path, 'ab')
+
+        self._writer_store = self.store.new_handle()
+
+        self._stop = False
+        self._thread = threading.Thread(target = self._run, name = 'StoreWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Write out all queued operations and stop the writer thread.
+        """
+
+        if self._thread is None:
+            return
+
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+        self._thread.join()
+        self._thread = None
+
+        self._writer_store.close()
+        self._writer_store = None
+
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def set_store(self, store):
+        """
+        Write out all queued operations and switch to a new store.
+        """
+
+        if self._thread is None:
+            self.store = store
+            return
+
+        self.flush()
+
+        with self._cond:
+            # writer thread is idle
+            self._writer_store.close()
+            self.store = store
+            self._writer_store = store.new_handle()
+
+    def put(self, cmd, obj):
+        snapshot = StoreWriteQueue._snapshot(obj)
+
+        with self._cond:
+            self._check_error()
+
+            if self._journal is not None:
+                marshal.dump((cmd, ObjectCodec.encode(obj)), self._journal)
+
+            entry = [cmd, obj, snapshot]
+
+            if cmd == StoreWriteQueue.CMD_UPDATE:
+                previous = self._queued_updates.get(id(obj))
+                if previous is not None:
+                    if type(obj) not in StoreWriteQueue._LEAF_TYPES:
+                        # keep the position of the queued entry but write the current state
+                        previous[2] = snapshot
+                        return
+
+                    # supersede the queued entry
+                    previous[0] = None
+                    self._num_pending -= 1
+
+                self._queued_updates[id(obj)] = entry
+
+            self._entries.append(entry)
+            self._num_pending += 1
+
+            self._cond.notify_all()
+
+    def sync(self):
+        """
+        Make the journal durable.
+        """
+
+        with self._cond:
+            if self._journal is not None:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+
+    def pending(self):
+        """
+        @return Number of operations not yet written to the store.
+        """
+
+        with self._cond:
+            self._check_error()
+            return self._num_pending
+
+    def flush(self):
+        """
+        Block until all queued operations are written to the store.
+        """
+
+        with self._cond:
+            while self._num_pending != 0 and self._error is None:
+                self._cond.wait(1.)
+
+            self._check_error()
+
+    def read_journal(self):
+        """
+        @return List of (cmd, encoded object) from the journal file.
+        """
+
+        records = []
+
+        if not self.journal_path:
+            return records
+
+        try:
+            source = open(self.journal_path, 'rb')
+        except IOError:
+            return records
+
+        with source:
+            while True:
+                try:
+                    records.append(marshal.load(source))
+                except EOFError:
+                    break
+                except (ValueError, TypeError):
+                    # last record was cut by a crash
+                    LOG.warning('Store write journal %s is truncated after %d records.', self.journal_path, len(records))
+                    break
+
+        return records
+
+    def clear_journal(self):
+        with self._cond:
+            if self._journal is not None:
+                self._journal.seek(0)
+                self._journal.truncate()
+            elif self.journal_path and os.path.exists(self.journal_path):
+                os.unlink(self.journal_path)
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError('Store writer thread failed: %s' % str(self._error))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while len(self._entries) == 0 and not self._stop:
+                    self._cond.wait()
+
+                if len(self._entries) == 0:
+                    # stop requested and nothing left to write
+                    return
+
+                batch = []
+                while len(self._entries) != 0 and len(batch) < self.batch_size:
+                    entry = self._entries.popleft()
+                    cmd, obj, snapshot = entry
+                    if cmd is None:
+                        continue
+
+                    if cmd == StoreWriteQueue.CMD_UPDATE and self._queued_updates.get(id(obj)) is entry:
+                        self._queued_updates.pop(id(obj))
+
+                    batch.append((cmd, obj, snapshot))
+
+            start = time.time()
+
+            try:
+                self._write(batch)
+            except Exception as ex:
+                LOG.error('Failed to write %d operations to the inventory store.', len(batch))
+                log_exception(LOG)
+
+                with self._cond:
+                    # the journal is kept for recovery
+                    self._error = ex
+                    self._cond.notify_all()
+
+                return
+
+            LOG.debug('Wrote %d operations to the inventory store in %.2f seconds.', len(batch), time.time() - start)
+
+            with self._cond:
+                self._num_pending -= len(batch)
+                if self._num_pending == 0 and self._journal is not None:
+                    self._journal.seek(0)
+                    self._journal.truncate()
+
+                self._cond.notify_all()
+
+    @staticmethod
+    def _snapshot(obj):
+        """
+        @return A detached copy of obj with the current values of its attributes. References to other
+                objects (dataset, block, site, group, etc.) are kept, so that the store can read their ids.
+        """
+
+        snapshot = object.__new__(type(obj))
+        for slot in type(obj).__slots__:
+            try:
+                setattr(snapshot, slot, getattr(obj, slot))
+            except AttributeError:
+                # unset slot
+                pass
+
+        return snapshot
+
+    def _write(self, batch):
+        # consecutive operations of the same kind are written together
+        objects = []
+        current = None
+
+        for cmd, obj, snapshot in batch:
+            if cmd != current and len(objects) != 0:
+                self._write_objects(current, objects)
+                objects = []
+
+            current = cmd
+            objects.append((obj, snapshot))
+
+        if len(objects) != 0:
+            self._write_objects(current, objects)
+
+    def _write_objects(self, cmd, objects):
+        store = self._writer_store
+
+        if cmd == StoreWriteQueue.CMD_UPDATE:
+            # Same as InventoryStore.save_many, but ids assigned by the store are copied back to the live
+            # objects before the replicas (which may refer to them) are written.
+            replicas = []
+            for obj, snapshot in objects:
+                if type(snapshot) in (DatasetReplica, BlockReplica):
+                    replicas.append(snapshot)
+                    continue
+
+                snapshot.write_into(store)
+
+                try:
+                    if snapshot.id != obj.id:
+                        obj.id = snapshot.id
+                except AttributeError:
+                    # object type without an id
+                    pass
+
+            if len(replicas) != 0:
+                store.save_many(replicas)
+        else:
+            store.delete_many([snapshot for _, snapshot in objects])
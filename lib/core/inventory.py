@@ -1,10 +1,16 @@
 import logging
 import re
+import time
+import contextlib
 
 from dynamo.policy.condition import Condition
 from dynamo.policy.variables import replica_variables
 import dynamo.dataformat as df
 from dynamo.core.components.persistency import InventoryStore
+from dynamo.core.components.inventoryimage import InventoryImage
+from dynamo.core.components.lfncache import LFNCache
+from dynamo.core.components.writequeue import StoreWriteQueue
+from dynamo.utils.log import log_exception
 
 LOG = logging.getLogger(__name__)
 
@@ -26,6 +32,13 @@ class ObjectRepository(object):
         # Null group always exist
         self.groups[None] = df.Group.null_group
 
+        # Optional {(dataset name, block internal name): block} index for lookups by full block name.
+        # Created by index_blocks() and maintained by embed_into and unlink_from of Block and Dataset.
+        self.block_index = None
+
+        # LFN -> (dataset name, block name) cache for find_file(s)
+        self.lfn_cache = LFNCache()
+
         # This base class does not actually have a persistency store
         self._store = None
 
@@ -34,7 +47,7 @@ class ObjectRepository(object):
 
     def delete(self, obj):
         try:
-            return obj.unlink_from(self)
+            deleted_object = obj.unlink_from(self)
         except (KeyError, df.ObjectError) as e:
             # When delete is attempted on a nonexistent object or something linked to a nonexistent object
             # As this is less alarming, error message is suppressed to debug level.
@@ -45,16 +58,78 @@ class ObjectRepository(object):
             LOG.error('Exception in inventory.delete(%s)' % str(obj))
             raise
 
+        if type(deleted_object) is df.File:
+            self.lfn_cache.invalidate_file(deleted_object.lfn)
+        elif type(deleted_object) is df.Block:
+            self.lfn_cache.invalidate_block(deleted_object.dataset.name, deleted_object.name)
+        elif type(deleted_object) is df.Dataset:
+            self.lfn_cache.invalidate_dataset(deleted_object.name)
+
+        return deleted_object
+
+    def index_blocks(self):
+        """
+        Build the block index from the current content. Also registers the index as Block.inventory_index
+        for name-based lookups from the dataformat objects (Site.find_block_replica).
+        """
+
+        self.block_index = {}
+        for dataset in self.datasets.itervalues():
+            for block in dataset.blocks:
+                self.block_index[(dataset.name, block.name)] = block
+
+        df.Block.inventory_index = self.block_index
+
+    def find_block(self, full_name):
+        """
+        Find a block from its full name.
+
+        @param full_name  Full block name (dataset#block)
+
+        @return A Block object or None if not found.
+        """
+
+        try:
+            key = df.Block.from_full_name(full_name)
+        except df.ObjectError:
+            return None
+
+        return self._find_block_by_key(key)
+
+    def _find_block_by_key(self, key):
+        if self.block_index is not None:
+            return self.block_index.get(key)
+
+        try:
+            dataset = self.datasets[key[0]]
+        except KeyError:
+            return None
+
+        return dataset.find_block(key[1])
+
+    def prefetch_files(self, blocks):
+        """
+        Load the files of many blocks at once (with batched queries to the persistency store) and fill
+        the block file caches. Loops that access the files of many blocks should call this first.
+
+        @param blocks  Iterable of Block objects
+
+        @return {block: files}. The file caches only hold a limited amount of data, so keep the returned
+                dict while iterating over the blocks.
+        """
+
+        return df.Block.prefetch_files(blocks)
+
     def make_object(self, repstr):
         """
-        Create an object from its representation string.
+        Create an object from its encoded string.
 
-        @param repstr  A string returned by repr(obj)
+        @param repstr  A string returned by ObjectCodec.encode(obj) or repr(obj)
 
         @return A new object represented by the input.
         """
 
-        return eval('df.' + repstr)
+        return df.ObjectCodec.decode(repstr)
 
     def find_file(self, lfn):
         """
@@ -67,24 +142,60 @@ class ObjectRepository(object):
         @return A fully-linked File object
         """
 
-        result = self._store.find_block_containing(lfn)
-        # result is None or (dataset_name, block_name)
+        return self.find_files([lfn]).get(lfn)
 
-        if result is None:
-            return None
+    def find_files(self, lfns):
+        """
+        Batched version of find_file. LFNs are first looked up in the LFN cache, and the rest are
+        resolved with a single (chunked) query to the persistency store. Files of the blocks are
+        loaded together through prefetch_files.
 
-        try:
-            dataset = self.datasets[result[0]]
-        except KeyError:
-            # Can happen if the dataset was deleted from the inventory in this process
-            return None
-            
-        block = dataset.find_block(result[1])
-        if block is None:
-            # Similarly, can happen if the block is gone
-            return None
-            
-        return block.find_file(lfn)
+        @param lfns  Iterable of logical file names
+
+        @return {lfn: File} for the files found
+        """
+
+        block_keys = {} # {lfn: (dataset_name, block_name)}
+        unresolved = []
+
+        for lfn in lfns:
+            key = self.lfn_cache.get(lfn)
+            if key is None:
+                unresolved.append(lfn)
+            else:
+                block_keys[lfn] = key
+
+        if len(unresolved) != 0:
+            for lfn, key in self._store.find_blocks_containing(unresolved).iteritems():
+                self.lfn_cache.put(lfn, key)
+                block_keys[lfn] = key
+
+        blocks = {} # {(dataset_name, block_name): block}
+        for key in block_keys.itervalues():
+            if key not in blocks:
+                # block can be None if the dataset or the block was deleted from the inventory in this process
+                blocks[key] = self._find_block_by_key(key)
+
+        # {block: files}; also keeps the file sets in memory until the end of the function
+        block_files = self.prefetch_files(block for block in blocks.itervalues() if block is not None)
+
+        result = {}
+
+        for lfn, key in block_keys.iteritems():
+            block = blocks[key]
+            if block is None:
+                continue
+
+            # Block.find_file would reload the files on the server side, where file sets are not cached
+            lfile = block_files[block].get(lfn)
+            if lfile is None:
+                # File is gone (or the cache entry is stale)
+                self.lfn_cache.invalidate_file(lfn)
+                continue
+
+            result[lfn] = lfile
+
+        return result
 
 
 class DynamoInventoryProxy(ObjectRepository):
@@ -94,6 +205,8 @@ class DynamoInventoryProxy(ObjectRepository):
         self.sites = inventory.sites
         self.datasets = inventory.datasets
         self.partitions = inventory.partitions
+        self.block_index = inventory.block_index
+        self.lfn_cache = inventory.lfn_cache
         self._store = inventory.new_store_handle()
         self._store.server_side = False
         df.Block.inventory_store = self._store
@@ -122,14 +235,14 @@ class DynamoInventoryProxy(ObjectRepository):
 
     def register_update(self, obj): #override
         """
-        Put the text representation of obj to _update_commands.
+        Put the encoded representation of obj to _update_commands.
         """
 
         if self._update_commands is None:
             return
 
         LOG.debug('%s has changed. Adding a clone to updated objects list.', str(obj))
-        self._update_commands.append((DynamoInventory.CMD_UPDATE, repr(obj)))
+        self._update_commands.append((DynamoInventory.CMD_UPDATE, df.ObjectCodec.encode(obj)))
 
     def delete(self, obj): #override
         """
@@ -145,7 +258,7 @@ class DynamoInventoryProxy(ObjectRepository):
 
         if self._update_commands is not None:
             LOG.debug('%s is deleted.', str(obj))
-            self._update_commands.append((DynamoInventory.CMD_DELETE, repr(deleted_object)))
+            self._update_commands.append((DynamoInventory.CMD_DELETE, df.ObjectCodec.encode(deleted_object)))
 
         return deleted_object
 
@@ -167,6 +280,9 @@ class DynamoInventory(ObjectRepository):
     CMD_UPDATE, CMD_DELETE, CMD_EOM = range(3)
     _cmd_str = ['UPDATE', 'DELETE', 'EOM']
 
+    # Object types whose store writes can be deferred and flushed in bulk under batch_writes()
+    _BATCH_WRITE_TYPES = (df.DatasetReplica, df.BlockReplica)
+
     @property
     def has_store(self):
         return self._has_store
@@ -182,12 +298,32 @@ class DynamoInventory(ObjectRepository):
         self._has_store = False
 
         self._store = None
+        # StoreWriteQueue when writing to the store in the background (see start_writer)
+        self._write_queue = None
         if 'persistency' in config:
             self._has_store = True
             self.init_store(config.persistency.module, config.persistency.config)
 
         self.partition_def_path = config.partition_def_path
 
+        # Store BlockReplica.file_ids as sorted arrays of machine integers instead of tuples to save memory
+        if config.get('compact_file_ids', False):
+            df.BlockReplica._compact_file_ids = True
+
+        # Keep an index of blocks by full name
+        self._index_blocks = config.get('index_blocks', False)
+
+        self.lfn_cache.max_size = config.get('lfn_cache_size', self.lfn_cache.max_size)
+
+        # Allow deferring store writes of replicas under batch_writes()
+        self._batch_store_writes = config.get('batch_store_writes', True)
+        # (cmd, [objects]) of deferred store writes, or None when not in batch mode
+        self._write_batch = None
+
+        # Write-behind mode: store writes are done by a writer thread
+        self._write_behind = config.get('write_behind', False)
+        self._write_journal_path = config.get('write_journal_path', None)
+
     def init_store(self, module, config):
         if self._store:
             self._store.close()
@@ -197,7 +333,105 @@ class DynamoInventory(ObjectRepository):
 
         df.Block.inventory_store = self._store
 
+        if self._write_queue is not None:
+            self._write_queue.set_store(self._store)
+
+    def start_writer(self):
+        """
+        If configured for write-behind, replay the write journal left by a previous run, if any, and
+        start the store writer thread. From here on update() and delete() only queue the store writes.
+        Call after the inventory is loaded.
+        """
+
+        if not self._has_store or not self._write_behind or self._write_queue is not None:
+            return
+
+        queue = StoreWriteQueue(self._store, self._write_journal_path)
+
+        records = queue.read_journal()
+        if len(records) != 0:
+            LOG.info('Replaying %d store writes from journal %s.', len(records), self._write_journal_path)
+
+            # Replayed synchronously. Some of the operations may already be in the store; updates and deletes
+            # are idempotent, but objects may have been deleted later in the sequence (in which case the
+            # update refers to an unknown object and is skipped).
+            with self.batch_writes():
+                for cmd, objstr in records:
+                    obj = self.make_object(objstr)
+                    try:
+                        if cmd == DynamoInventory.CMD_UPDATE:
+                            self.update(obj)
+                        else:
+                            self.delete(obj)
+                    except (KeyError, df.ObjectError) as ex:
+                        LOG.warning('Skipping journaled %s of %s: %s', DynamoInventory._cmd_str[cmd], str(obj), str(ex))
+
+            queue.clear_journal()
+
+        queue.start()
+        self._write_queue = queue
+
+    def stop_writer(self):
+        """
+        Write out all queued operations and stop the store writer thread.
+        """
+
+        if self._write_queue is None:
+            return
+
+        queue = self._write_queue
+        self._write_queue = None
+        queue.stop()
+
+    def pending_writes(self):
+        """
+        @return Number of operations queued for the writer thread. Raises RuntimeError if the thread failed.
+        """
+
+        if self._write_queue is None:
+            return 0
+
+        return self._write_queue.pending()
+
+    def flush_writes(self):
+        """
+        Block until all queued operations are written to the store.
+        """
+
+        if self._write_queue is not None:
+            self._write_queue.flush()
+
+    def clear_write_journal(self):
+        """
+        Discard the journaled store writes of a previous run. Call when the store content is synchronized
+        from another server, which makes the journal obsolete.
+        """
+
+        if self._write_journal_path:
+            StoreWriteQueue(self._store, self._write_journal_path).clear_journal()
+
+    def log_changes(self, version, commands):
+        """
+        Record a batch of update commands in the change log of the store.
+        """
+
+        self._store.log_changes(version, commands)
+
+    def get_remote_changes(self, module, config, version, max_entries = 100):
+        """
+        Read the change log of another store.
+        @return See InventoryStore.get_changes
+        """
+
+        source = InventoryStore.get_instance(module, config)
+        try:
+            return source.get_changes(version, max_entries)
+        finally:
+            source.close()
+
     def clone_store(self, module, config):
+        self.flush_writes()
+
         source = InventoryStore.get_instance(module, config)
         self._store.clone_from(source)
         source.close()
@@ -215,8 +449,83 @@ class DynamoInventory(ObjectRepository):
         """
         Save the full inventory content to store.
         """
+        self.flush_writes()
         self._store.save_data(self)
 
+    @contextlib.contextmanager
+    def batch_writes(self):
+        """
+        Context in which update() and delete() apply the changes in memory immediately but defer the store
+        writes of replicas, which are then flushed in bulk through InventoryStore.save_many and delete_many.
+        Deferred writes are flushed when the command switches between update and delete, before any store
+        write of other object types, and at the end of the context, so the store ends up in the same state
+        as with object-by-object writes.
+        """
+
+        if self._write_queue is not None:
+            # writes are queued anyway; make the journal durable at the end of the batch
+            try:
+                yield
+            finally:
+                self._write_queue.sync()
+
+            return
+
+        if not self._has_store or not self._batch_store_writes or self._write_batch is not None:
+            yield
+            return
+
+        self._write_batch = (None, [])
+        try:
+            yield
+        finally:
+            # in-memory changes are already applied; flush even on exceptions
+            try:
+                self._flush_write_batch()
+            finally:
+                self._write_batch = None
+
+    def _defer_write(self, cmd, obj):
+        """
+        @return True if the store write of obj is deferred.
+        """
+
+        if self._write_batch is None:
+            return False
+
+        if type(obj) not in DynamoInventory._BATCH_WRITE_TYPES:
+            self._flush_write_batch()
+            return False
+
+        batch_cmd, objects = self._write_batch
+        if cmd != batch_cmd:
+            self._flush_write_batch()
+            self._write_batch = (cmd, [obj])
+        else:
+            objects.append(obj)
+
+        return True
+
+    def _flush_write_batch(self):
+        cmd, objects = self._write_batch
+        if len(objects) == 0:
+            return
+
+        self._write_batch = (None, [])
+
+        start = time.time()
+
+        try:
+            if cmd == DynamoInventory.CMD_UPDATE:
+                self._store.save_many(objects)
+            else:
+                self._store.delete_many(objects)
+        except:
+            LOG.error('Exception writing a batch of %d %s commands to inventory store', len(objects), DynamoInventory._cmd_str[cmd])
+            raise
+
+        LOG.debug('Wrote a batch of %d %s commands to inventory store in %.2f seconds.', len(objects), DynamoInventory._cmd_str[cmd], time.time() - start)
+
     def new_store_handle(self):
         return self._store.new_handle()
 
@@ -231,17 +540,7 @@ class DynamoInventory(ObjectRepository):
         @param datasets 2-tuple (included, excluded)
         """
 
-        self.loaded = False
-        
-        self.groups.clear()
-        self.groups[None] = df.Group.null_group
-        self.sites.clear()
-        self.datasets.clear()
-        self.partitions.clear()
-
-        LOG.info('Setting up partitions.')
-
-        self._load_partitions()
+        self._reset()
 
         LOG.info('Loading data from persistent storage.')
 
@@ -256,6 +555,56 @@ class DynamoInventory(ObjectRepository):
             dataset_names = dataset_names
         )
 
+        self._report_loaded()
+
+    def load_image(self, path, tag):
+        """
+        Load inventory content from an image file written by save_image.
+        @param path  Path to the image file.
+        @param tag   Expected tag of the image (normally the store version).
+
+        @return True if the content was loaded. False if the image does not exist, is outdated, or is unreadable.
+        """
+
+        self._reset()
+
+        LOG.info('Loading data from inventory image %s.', path)
+
+        try:
+            loaded = InventoryImage(path).read(self, tag)
+        except:
+            LOG.error('Failed to read inventory image %s.', path)
+            log_exception(LOG)
+            loaded = False
+
+        if loaded:
+            self._report_loaded()
+
+        return loaded
+
+    def save_image(self, path, tag):
+        """
+        Write the inventory content into an image file.
+        @param path  Path to the image file.
+        @param tag   Tag of the image (normally the store version).
+        """
+
+        InventoryImage(path).write(self, tag)
+
+    def _reset(self):
+        self.loaded = False
+        
+        self.groups.clear()
+        self.groups[None] = df.Group.null_group
+        self.sites.clear()
+        self.datasets.clear()
+        self.partitions.clear()
+
+        LOG.info('Setting up partitions.')
+
+        self._load_partitions()
+
+    def _report_loaded(self):
         num_dataset_replicas = 0
         num_block_replicas = 0
 
@@ -265,6 +614,9 @@ class DynamoInventory(ObjectRepository):
 
         LOG.info('Data is loaded to memory. %d groups, %d sites, %d datasets, %d dataset replicas, %d block replicas.\n', len(self.groups), len(self.sites), len(self.datasets), num_dataset_replicas, num_block_replicas)
 
+        if self._index_blocks:
+            self.index_blocks()
+
         self.loaded = True
 
     def _load_partitions(self):
@@ -294,6 +646,18 @@ class DynamoInventory(ObjectRepository):
         for partition in partitions:
             self.partitions.add(partition)
 
+        # Partition membership of block replicas is cached and reevaluated only when the group or the custodial flag
+        # of the replica changes. This is only valid if the conditions do not depend on other mutable attributes
+        # (decided by PartitionClassifier for each set of partitions).
+        for name, condition in conditions.iteritems():
+            if type(condition) is list:
+                # superpartition
+                continue
+
+            if not df.PartitionClassifier.is_cacheable(condition):
+                LOG.info('Partition %s depends on mutable attributes. Partition membership will not be cached.', name)
+                break
+
     def _get_group_names(self, included, excluded):
         """Return the list of group names or None according to the arguments."""
 
@@ -378,7 +742,10 @@ class DynamoInventory(ObjectRepository):
 
         embedded_clone = ObjectRepository.update(self, obj)
 
-        if self._has_store:
+        if self._write_queue is not None:
+            self._write_queue.put(DynamoInventory.CMD_UPDATE, embedded_clone)
+
+        elif self._has_store and not self._defer_write(DynamoInventory.CMD_UPDATE, embedded_clone):
             try:
                 embedded_clone.write_into(self._store)
             except:
@@ -399,7 +766,10 @@ class DynamoInventory(ObjectRepository):
         if deleted_object is None:
             return None
 
-        if self._has_store:
+        if self._write_queue is not None:
+            self._write_queue.put(DynamoInventory.CMD_DELETE, deleted_object)
+
+        elif self._has_store and not self._defer_write(DynamoInventory.CMD_DELETE, deleted_object):
             try:
                 deleted_object.delete_from(self._store)
             except:
@@ -407,3 +777,18 @@ class DynamoInventory(ObjectRepository):
                 raise
 
         return deleted_object
+
+    def patch(self, update_commands):
+        """
+        Apply update commands to the in-memory content only, without writing to the store. Used by processes
+        that hold a copy of the server inventory (e.g. the web server).
+        @param update_commands  List of (cmd, encoded object)
+        """
+
+        for cmd, objstr in update_commands:
+            obj = self.make_object(objstr)
+
+            if cmd == DynamoInventory.CMD_UPDATE:
+                ObjectRepository.update(self, obj)
+            elif cmd == DynamoInventory.CMD_DELETE:
+                ObjectRepository.delete(self, obj)
@@ -1,3 +1,4 @@
+import sys
 import time
 import threading
 import socket
@@ -6,6 +7,8 @@ import logging
 from dynamo.core.components.host import ServerHost, OutOfSyncError
 from dynamo.core.components.master import MasterServer, AppManager
 from dynamo.core.components.board import UpdateBoard
+from dynamo.utils.parallel import Map
+from dynamo.dataformat import Configuration
 
 LOG = logging.getLogger(__name__)
 
@@ -142,25 +145,30 @@ class ServerManager(object):
                 hostnames.update(n for n, _, _ in self.master.get_host_list(status = stat))
             return len(hostnames)
 
-    def get_updates(self):
+    def read_updates(self, after = 0):
         """
-        Return entries from the local update board as an iterable.
+        Read one chunk of entries from the local update board. The chunk is read under the board lock so that
+        it does not interleave with a batch of updates being written by a peer. Entries are not removed from
+        the board; call acknowledge_updates once they are applied and persisted.
+        @param after  Read entries with sequence numbers larger than this
+        @return (list of (cmd, obj), sequence number of the last entry or None if there are no entries)
         """
         self.board.lock()
         try:
-            update_commands = self.board.get_updates()
-            has_updates = False
-            for cmd, obj in update_commands:
-                has_updates = True
-                yield (cmd, obj)
-
-            if has_updates:
-                self.board.flush()
-
+            updates = self.board.read_updates(after)
         finally:
             self.board.unlock()
 
-        return
+        if len(updates) == 0:
+            return [], None
+        else:
+            return [(cmd, obj) for _, cmd, obj in updates], updates[-1][0]
+
+    def acknowledge_updates(self, last):
+        """
+        Remove the entries up to the given sequence number from the local update board.
+        """
+        self.board.acknowledge(last)
 
     def send_heartbeat(self):
         """
@@ -265,7 +273,10 @@ class ServerManager(object):
 
     def send_updates(self, update_commands):
         """
-        Send the list of update commands to all online servers.
+        Send the list of update commands to all online servers. All online servers are claimed (set to
+        UPDATING) in one pass under the master lock, and the updates are written to their boards in
+        parallel outside of the lock. Servers that are still processing updates from a previous write
+        process are waited for.
 
         @param update_commands  List of two-tuples (cmd, obj)
         """
@@ -273,48 +284,82 @@ class ServerManager(object):
         # No servers could have come online while we were running a write-enabled process - other_servers is the full list
         # of running servers.
 
+        start = time.time()
+        lock_time = 0.
+        num_sent = 0
+
         processed = set()
 
+        def write(server):
+            try:
+                server.board.write_updates(update_commands)
+            except:
+                LOG.error('Error while sending updates to %s: %s', server.hostname, str(sys.exc_info()[1]))
+                return server, False
+
+            return server, True
+
         while True:
+            targets = []
+            waiting = False
+
+            lock_start = time.time()
             self.master.lock()
 
             try:
                 self.collect_hosts()
-    
-                # update only one server at a time to minimize the time in lock
-                for server in self.other_servers.itervalues():
-                    if server.hostname not in processed:
-                        break
-                else:
-                    # all processed, we are done
-                    break
 
-                if server.status == ServerHost.STAT_ONLINE:
-                    processed.add(server.hostname)
+                for server in self.other_servers.itervalues():
+                    if server.hostname in processed:
+                        continue
 
-                    self.set_status(ServerHost.STAT_UPDATING, server.hostname)
-                    try:
-                        server.board.write_updates(update_commands)
-                    except:
-                        LOG.error('Error while sending updates to %s. Setting server state to OUTOFSYNC.', server.hostname)
-                        self.set_status(ServerHost.STAT_OUTOFSYNC, server.hostname)
-                    else:
-                        LOG.info('Sent %d update commands to %s.', len(update_commands), server.hostname)
-                        
+                    if server.status == ServerHost.STAT_ONLINE:
+                        # An online server has an empty board - it will not set itself online before reading our updates
+                        processed.add(server.hostname)
+                        self.set_status(ServerHost.STAT_UPDATING, server.hostname)
+                        targets.append(server)
 
-                elif server.status == ServerHost.STAT_UPDATING:
-                    # this server is still processing updates from the previous write process
-                    continue
+                    elif server.status == ServerHost.STAT_UPDATING:
+                        # this server is still processing updates from the previous write process
+                        waiting = True
 
-                else:
-                    # any other status means the server is not running
-                    processed.add(server.hostname)
+                    else:
+                        # any other status means the server is not running
+                        processed.add(server.hostname)
 
             finally:
                 self.master.unlock()
+                lock_time += time.time() - lock_start
+
+            if len(targets) != 0:
+                pool = Map(Configuration(num_threads = len(targets), repeat_on_exception = False))
+                failed = []
+                for server, success in pool.execute(write, targets):
+                    if success:
+                        LOG.info('Sent %d update commands to %s.', len(update_commands), server.hostname)
+                        num_sent += 1
+                    else:
+                        failed.append(server)
+
+                if len(failed) != 0:
+                    lock_start = time.time()
+                    self.master.lock()
+                    try:
+                        for server in failed:
+                            LOG.error('Setting server state of %s to OUTOFSYNC.', server.hostname)
+                            self.set_status(ServerHost.STAT_OUTOFSYNC, server.hostname)
+                    finally:
+                        self.master.unlock()
+                        lock_time += time.time() - lock_start
+
+            if not waiting:
+                break
 
             time.sleep(1)
 
+        if len(processed) != 0:
+            LOG.info('Sent updates to %d servers in %.1f seconds (master lock held for %.3f seconds).', num_sent, time.time() - start, lock_time)
+
     def disconnect(self):
         """
         Go offline and delete the entry from the master server list.
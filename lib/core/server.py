@@ -4,6 +4,8 @@ import shutil
 import time
 import logging
 import signal
+import marshal
+import zlib
 import code
 import hashlib
 import multiprocessing
@@ -78,21 +80,25 @@ class DynamoServer(object):
 
         ## Queue to send / receive inventory updates
         self.inventory_update_queue = multiprocessing.JoinableQueue()
+        # Updates are sent in chunks of this many commands, optionally zlib-compressed
+        self.update_chunk_size = config.get('update_chunk_size', 10000)
+        self.compress_updates = config.get('compress_updates', False)
+
+        ## True when the store version has changed but store writes are still queued (write-behind mode)
+        self.store_version_outdated = False
+        ## Update commands applied to the store since the last change log entry
+        self.unlogged_updates = []
 
         ## Recipient of error message emails
         self.notification_recipient = config.notification_recipient
 
     def load_inventory(self):
-        ## Wait until there is no write process
-        while self.manager.master.get_writing_process_id() is not None:
-            LOG.debug('A write-enabled process is running. Checking again in 5 seconds.')
-            time.sleep(5)
-
-        ## Write process is done.
+        ## Wait until there is no write process and no server is updating.
         ## Other servers will not start a new write process while there is a server with status 'starting'.
-        ## The only states the other running servers can be in are therefore 'updating' or 'online'
-        while self.manager.count_servers(ServerHost.STAT_UPDATING) != 0:
-            time.sleep(2)
+        self._wait_for_write_processes()
+
+        ## Set if the local store is to be brought up to date by replaying the change log of a remote store
+        catch_up_source = None
 
         if self.manager.count_servers(ServerHost.STAT_ONLINE) == 0:
             # I am the first server to start the inventory - need to have a store.
@@ -103,13 +109,19 @@ class DynamoServer(object):
             hostname, module, config, version = self.manager.find_remote_store()
 
             if self.inventory.has_store:
-                # Clone the content from a remote store
+                # Journaled store writes from the previous run are superseded by the content of the other servers
+                self.inventory.clear_write_journal()
 
                 # No server will be updating because write process is blocked while we load
-                if version == self.inventory.store_version():
+                local_version = self.inventory.store_version()
+                if version == local_version:
                     LOG.info('Local persistency store is up to date.')
+                elif self.inventory.get_remote_changes(module, config, local_version, max_entries = 0) is not None:
+                    # Replay the missing changes after loading the current content
+                    LOG.info('Local persistency store is behind %s and will be updated from its change log.', hostname)
+                    catch_up_source = (hostname, module, config, local_version)
                 else:
-                    # TODO cloning can take hours; need a way to unblock other servers and pool the updates
+                    # Clone the content from a remote store
                     LOG.info('Cloning inventory content from persistency store at %s', hostname)
                     self.inventory.clone_store(module, config)
             else:
@@ -117,10 +129,118 @@ class DynamoServer(object):
                 self._setup_remote_store(hostname, module, config)
 
         LOG.info('Loading the inventory.')
-        self.inventory.load(**self.inventory_load_opts)
+        start = time.time()
+
+        image_path = self.inventory_config.get('image_path', None)
+        if image_path:
+            # The image is valid only for the current store state and the same load options
+            image_tag = self.inventory.store_version()
+            if self.inventory_load_opts:
+                image_tag += ' ' + repr(sorted(self.inventory_load_opts.items()))
+
+            if self.inventory.load_image(image_path, image_tag):
+                LOG.info('Inventory loaded from image in %.1f seconds.', time.time() - start)
+            else:
+                self.inventory.load(**self.inventory_load_opts)
+                LOG.info('Inventory loaded from persistency store in %.1f seconds.', time.time() - start)
+
+                try:
+                    self.inventory.save_image(image_path, image_tag)
+                except:
+                    # not fatal - we will just load from the store again next time
+                    LOG.error('Failed to write the inventory image %s.', image_path)
+                    log_exception(LOG)
+        else:
+            self.inventory.load(**self.inventory_load_opts)
+            LOG.info('Inventory loaded from persistency store in %.1f seconds.', time.time() - start)
+
+        if catch_up_source is not None and not self._catch_up(*catch_up_source):
+            hostname, module, config, _ = catch_up_source
+            LOG.info('Cloning inventory content from persistency store at %s', hostname)
+            self.inventory.clone_store(module, config)
+            self.inventory.load(**self.inventory_load_opts)
 
         LOG.info('Inventory is ready.')
 
+    def _catch_up(self, hostname, module, config, version):
+        """
+        Bring the local store and the inventory up to date by replaying the change log of the store at
+        hostname, starting from version. Most of the changes are replayed while the other servers can run
+        write processes; new write processes are blocked (status STARTING) only to replay the last entries.
+        On return, the server status is STARTING and no write process is running.
+
+        @return False if the change log does not cover the local version (anymore) or the result is inconsistent.
+        """
+
+        LOG.info('Replaying the change log of %s from version %s.', hostname, version)
+
+        start = time.time()
+        num_entries = 0
+        num_commands = 0
+
+        # Not 'starting' -> other servers can run write processes
+        self.manager.set_status(ServerHost.STAT_INITIAL)
+
+        blocked = False
+
+        while True:
+            changes = self.inventory.get_remote_changes(module, config, version)
+
+            if changes is None:
+                LOG.warning('Store version %s dropped out of the change log of %s.', version, hostname)
+                break
+
+            if len(changes) == 0:
+                if not blocked:
+                    # Block write processes and replay what is left
+                    self.manager.set_status(ServerHost.STAT_STARTING)
+                    self._wait_for_write_processes()
+                    blocked = True
+                    continue
+
+                # The remote store may still be writing the last entry
+                _, _, _, remote_version = self.manager.find_remote_store(hostname)
+                if remote_version == version:
+                    break
+
+                time.sleep(1)
+                continue
+
+            for entry_version, commands in changes:
+                self._apply_updates(commands)
+                self._log_changes(entry_version)
+
+                version = entry_version
+                num_entries += 1
+                num_commands += len(commands)
+
+        if not blocked:
+            self.manager.set_status(ServerHost.STAT_STARTING)
+            self._wait_for_write_processes()
+
+        LOG.info('Replayed %d change log entries (%d commands) in %.1f seconds.', num_entries, num_commands, time.time() - start)
+
+        if changes is None:
+            return False
+
+        self.inventory.flush_writes()
+        local_version = self.inventory.store_version()
+        if local_version != version:
+            LOG.error('Local store version %s after replaying the change log does not match %s.', local_version, version)
+            return False
+
+        return True
+
+    def _wait_for_write_processes(self):
+        while self.manager.master.get_writing_process_id() is not None:
+            LOG.debug('A write-enabled process is running. Checking again in 5 seconds.')
+            time.sleep(5)
+
+        ## Write process is done.
+        ## The only states the other running servers can be in are therefore 'updating' or 'online'
+        while self.manager.count_servers(ServerHost.STAT_UPDATING) != 0:
+            time.sleep(2)
+
     def run(self):
         """
         Main body of the server, but mostly focuses on exception handling.
@@ -138,13 +258,16 @@ class DynamoServer(object):
 
             self.load_inventory()
 
+            # Replays journaled store writes if there are any
+            self.inventory.start_writer()
+
             bconf = self.manager_config.board
             self.manager.master.advertise_board(bconf.module, bconf.config)
 
             if self.inventory.has_store:
                 pconf = self.inventory_config.persistency
                 self.manager.master.advertise_store(pconf.module, pconf.readonly_config)
-                self.manager.master.advertise_store_version(self.inventory.store_version())
+                self._advertise_store_version()
 
             if self.manager.shadow is not None:
                 sconf = self.manager_config.shadow
@@ -194,6 +317,8 @@ class DynamoServer(object):
                 if self.webserver:
                     self.webserver.stop()
 
+                self.inventory.stop_writer()
+
         self.manager.disconnect()
 
     def check_status_and_connection(self):
@@ -206,6 +331,15 @@ class DynamoServer(object):
             hostname, module, config, version = self.manager.find_remote_store()
             self._setup_remote_store(hostname, module, config)
 
+        ## Restart the web server if it could not apply inventory updates
+        if self.webserver is not None and self.webserver.inventory_outdated():
+            LOG.warning('Web server inventory is outdated.')
+            self.webserver.restart()
+
+        ## Advertise the store version once queued writes are done (raises exception if the writer failed)
+        if self.store_version_outdated and self.inventory.pending_writes() == 0:
+            self._advertise_store_version()
+
     def _run_application_cycles(self):
         """
         Infinite-loop main body of the daemon.
@@ -504,48 +638,82 @@ class DynamoServer(object):
             self.manager.master.update_application(app_id, status = status, exit_code = proc.exitcode)
 
     def _collect_updates(self):
+        """
+        Read the update commands sent by a child process through the queue. See _send_updates for the format.
+        """
+
         print_every = 100000
+        next_print = print_every
         updates_received = 0
         deletes_received = 0
 
         reading = False
         update_commands = []
+        expected_seq = 0
+        start_time = 0
 
         while True:
             try:
-                # Once we have an item sent, we'll read until the end (EOM).
+                # Once we have a chunk sent, we'll read until the end (EOM).
                 # If the child dies in the middle of messaging, we get out of the while loop by timeout = 60
-                cmd, objstr = self.inventory_update_queue.get(block = reading, timeout = 60)
+                seq, num_commands, compressed, data = self.inventory_update_queue.get(block = reading, timeout = 60)
             except Queue.Empty:
                 if reading:
                     # The child process crashed or timed out
                     return 2, update_commands
                 else:
                     return 0, update_commands
-            else:
-                self.inventory_update_queue.task_done()
 
+            self.inventory_update_queue.task_done()
+
+            if not reading:
                 reading = True # Now we have to read until the end - start blocking queue.get
+                start_time = time.time()
 
-                if LOG.getEffectiveLevel() == logging.DEBUG:
-                    if cmd == DynamoInventory.CMD_UPDATE:
-                        LOG.debug('Update %d from queue: %s', updates_received, objstr)
-                    elif cmd == DynamoInventory.CMD_DELETE:
-                        LOG.debug('Delete %d from queue: %s', deletes_received, objstr)
+            if seq != expected_seq:
+                LOG.error('Received update chunk %d while expecting %d.', seq, expected_seq)
+                return 2, update_commands
 
+            expected_seq += 1
+
+            if compressed:
+                data = zlib.decompress(data)
+
+            commands = marshal.loads(data)
+
+            if len(commands) != num_commands:
+                LOG.error('Update chunk %d is corrupt (%d commands, expected %d).', seq, len(commands), num_commands)
+                return 2, update_commands
+
+            for cmd, objstr in commands:
                 if cmd == DynamoInventory.CMD_UPDATE:
+                    if LOG.getEffectiveLevel() == logging.DEBUG:
+                        LOG.debug('Update %d from queue: %s', updates_received, objstr)
+
                     updates_received += 1
                     update_commands.append((cmd, objstr))
+
                 elif cmd == DynamoInventory.CMD_DELETE:
+                    if LOG.getEffectiveLevel() == logging.DEBUG:
+                        LOG.debug('Delete %d from queue: %s', deletes_received, objstr)
+
                     deletes_received += 1
                     update_commands.append((cmd, objstr))
 
-                if cmd == DynamoInventory.CMD_EOM or len(update_commands) % print_every == 0:
-                    LOG.info('Received %d updates and %d deletes.', updates_received, deletes_received)
+                elif cmd == DynamoInventory.CMD_EOM:
+                    elapsed = time.time() - start_time
+                    if elapsed > 0.:
+                        rate = len(update_commands) / elapsed
+                    else:
+                        rate = 0.
 
-                if cmd == DynamoInventory.CMD_EOM:
+                    LOG.info('Received %d updates and %d deletes in %.1f seconds (%.0f objects/s).', updates_received, deletes_received, elapsed, rate)
                     return 1, update_commands
 
+            if len(update_commands) >= next_print:
+                LOG.info('Received %d updates and %d deletes.', updates_received, deletes_received)
+                next_print += print_every
+
     def _collect_updates_from_web(self):
         if self.manager.master.get_writing_process_id() != 0 or self.manager.master.get_writing_process_host() != self.manager.hostname:
             return
@@ -610,9 +778,24 @@ class DynamoServer(object):
         self.manager.send_updates(update_commands)
 
     def _read_updates(self):
-        update_commands = self.manager.get_updates()
+        num_updates = 0
+        num_deletes = 0
 
-        num_updates, num_deletes = self._exec_updates(update_commands)
+        # Apply the board content chunk by chunk to bound the memory usage
+        last = 0
+        while True:
+            update_commands, last = self.manager.read_updates(last)
+
+            if last is None:
+                break
+
+            nu, nd = self._exec_updates(update_commands)
+            num_updates += nu
+            num_deletes += nd
+
+            # Remove the updates from the board only after they are in the local store, so that they survive a crash
+            self.inventory.flush_writes()
+            self.manager.acknowledge_updates(last)
 
         if num_updates + num_deletes != 0:
             LOG.info('Received %d updates and %d deletes from a remote server.', num_updates, num_deletes)
@@ -620,34 +803,71 @@ class DynamoServer(object):
             self.manager.set_status(ServerHost.STAT_ONLINE)
 
     def _exec_updates(self, update_commands):
-        num_updates = 0
-        num_deletes = 0
-        for cmd, objstr in update_commands:
-            # Create a python object from its representation string
-            obj = self.inventory.make_object(objstr)
+        # The same commands are applied to the local inventory and sent to the web server
+        if type(update_commands) is not list:
+            update_commands = list(update_commands)
 
-            if cmd == DynamoInventory.CMD_UPDATE:
-                num_updates += 1
-                embedded_object = self.inventory.update(obj)
-                CHANGELOG.info('Saved %s', str(embedded_object))
-
-            elif cmd == DynamoInventory.CMD_DELETE:
-                num_deletes += 1
-                deleted_object = self.inventory.delete(obj)
-                if deleted_object is not None:
-                    CHANGELOG.info('Deleting %s', str(deleted_object))
+        num_updates, num_deletes = self._apply_updates(update_commands)
 
         if num_updates + num_deletes != 0:
             if self.inventory.has_store:
-                self.manager.master.advertise_store_version(self.inventory.store_version())
+                if self.inventory.pending_writes() == 0:
+                    self._advertise_store_version()
+                else:
+                    # Store writes are still ongoing; will advertise in check_status_and_connection
+                    self.store_version_outdated = True
 
             if self.webserver:
-                # Restart the web server so it gets the latest inventory image
-                self.webserver.restart()
+                # The web server applies the same updates to its inventory image
+                self.webserver.update_inventory(update_commands)
 
         return num_updates, num_deletes
 
+    def _apply_updates(self, update_commands):
+        num_updates = 0
+        num_deletes = 0
+
+        # Commands are recorded for the change log of the store
+        record = self.inventory.has_store
+
+        # Replica writes to the store are grouped and flushed in bulk
+        with self.inventory.batch_writes():
+            for cmd, objstr in update_commands:
+                # Create a python object from its representation string
+                obj = self.inventory.make_object(objstr)
+
+                if cmd == DynamoInventory.CMD_UPDATE:
+                    num_updates += 1
+                    embedded_object = self.inventory.update(obj)
+                    CHANGELOG.info('Saved %s', str(embedded_object))
+
+                elif cmd == DynamoInventory.CMD_DELETE:
+                    num_deletes += 1
+                    deleted_object = self.inventory.delete(obj)
+                    if deleted_object is not None:
+                        CHANGELOG.info('Deleting %s', str(deleted_object))
+
+                if record:
+                    self.unlogged_updates.append((cmd, objstr))
+
+        return num_updates, num_deletes
+
+    def _advertise_store_version(self):
+        version = self.inventory.store_version()
+        self._log_changes(version)
+        self.manager.master.advertise_store_version(version)
+        self.store_version_outdated = False
+
+    def _log_changes(self, version):
+        # Starting servers replay the change log from their local store version.
+        # Entries with no commands mark versions that a server can start from.
+        self.inventory.log_changes(version, self.unlogged_updates)
+        self.unlogged_updates = []
+
     def _start_subprocess(self, app, is_local):
+        # Applications read file information from the store - make sure it is up to date
+        self.inventory.flush_writes()
+
         proc_args = (app['path'], app['args'], is_local, app['auth_level'])
 
         proc = multiprocessing.Process(target = self.run_script, name = app['title'], args = proc_args)
@@ -859,32 +1079,58 @@ class DynamoServer(object):
     
     def _send_updates(self, inventory):
         # Collect updates if write-enabled
+        # Commands are sent in chunks (sequence number, number of commands, compressed, data), where data is a marshaled
+        # list of (cmd, objstr), zlib-compressed if compressed is True. The last chunk contains a single CMD_EOM.
     
-        nobj = len(inventory._update_commands)
+        update_commands = inventory._update_commands
+        nobj = len(update_commands)
 
         sys.stderr.write('Sending %d updated objects to the server process.\n' % nobj)
         sys.stderr.flush()
 
+        start_time = time.time()
+
+        seq = 0
         wm = 0.
-        for iobj, (cmd, objstr) in enumerate(inventory._update_commands):
-            if float(iobj) / nobj * 100. > wm:
-                sys.stderr.write(' %.0f%%..' % (float(iobj) / nobj * 100.))
+        for ichunk in xrange(0, nobj, self.update_chunk_size):
+            if float(ichunk) / nobj * 100. > wm:
+                sys.stderr.write(' %.0f%%..' % (float(ichunk) / nobj * 100.))
                 sys.stderr.flush()
                 wm += 5.
+
+            commands = update_commands[ichunk:ichunk + self.update_chunk_size]
     
             try:
-                self.inventory_update_queue.put((cmd, objstr))
+                self.inventory_update_queue.put(self._make_update_chunk(seq, commands))
             except:
-                sys.stderr.write('Exception while sending %s %s\n' % (DynamoInventory._cmd_str[cmd], objstr))
+                sys.stderr.write('Exception while sending updated objects %d-%d\n' % (ichunk, ichunk + len(commands)))
                 sys.stderr.flush()
                 raise
+
+            seq += 1
     
         if nobj != 0:
             sys.stderr.write(' 100%.\n')
             sys.stderr.flush()
         
         # Put end-of-message
-        self.inventory_update_queue.put((DynamoInventory.CMD_EOM, None))
+        self.inventory_update_queue.put(self._make_update_chunk(seq, [(DynamoInventory.CMD_EOM, None)]))
     
         # Wait until all messages are received
         self.inventory_update_queue.join()
+
+        elapsed = time.time() - start_time
+        if elapsed > 0.:
+            rate = nobj / elapsed
+        else:
+            rate = 0.
+
+        sys.stderr.write('Sent %d objects in %d chunks in %.1f seconds (%.0f objects/s).\n' % (nobj, seq, elapsed, rate))
+        sys.stderr.flush()
+
+    def _make_update_chunk(self, seq, commands):
+        data = marshal.dumps(commands)
+        if self.compress_updates:
+            data = zlib.compress(data, 1)
+
+        return (seq, len(commands), self.compress_updates, data)
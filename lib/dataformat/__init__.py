@@ -7,9 +7,10 @@ from sitepartition import SitePartition
 from group import Group
 from datasetreplica import DatasetReplica
 from blockreplica import BlockReplica
-from partition import Partition
+from partition import Partition, PartitionClassifier
 from history import HistoryRecord
 from configuration import Configuration
+from codec import ObjectCodec
 
 __all__ = [
     'IntegrityError',
@@ -25,6 +26,8 @@ __all__ = [
     'DatasetReplica',
     'BlockReplica',
     'Partition',
+    'PartitionClassifier',
     'HistoryRecord',
-    'Configuration'
+    'Configuration',
+    'ObjectCodec'
 ]
@@ -0,0 +1,84 @@
+import array
+import bisect
+
+class FileIdArray(array.array):
+    """
+    Compact, sorted, immutable container of file ids, used for BlockReplica.file_ids when
+    BlockReplica._compact_file_ids is True. Ids are stored as machine integers ('l' = 8 bytes
+    on 64-bit Linux; Python 2 array has no 'q' type) instead of a tuple of boxed (long) integers.
+    Only ids of registered files can be stored - a list containing LFN strings must stay a tuple.
+    Behaves like a tuple for iteration, len, membership test, and repr.
+    """
+
+    __slots__ = []
+
+    def __new__(cls, file_ids = ()):
+        return array.array.__new__(cls, 'l', sorted(file_ids))
+
+    def __init__(self, file_ids = ()):
+        # everything is done in __new__
+        pass
+
+    def __repr__(self):
+        # keep the representation identical to that of a tuple so that repr(BlockReplica) stays valid
+        return repr(tuple(self))
+
+    def __reduce__(self):
+        return (FileIdArray, (self.tolist(),))
+
+    def __contains__(self, file_id):
+        try:
+            idx = bisect.bisect_left(self, file_id)
+        except TypeError:
+            return False
+
+        return idx != len(self) and self[idx] == file_id
+
+    def __eq__(self, other):
+        if type(other) is FileIdArray:
+            return array.array.__eq__(self, other)
+        else:
+            try:
+                return tuple(self) == tuple(other)
+            except TypeError:
+                return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def union(self, other):
+        """Return a FileIdArray (or a tuple if other contains LFNs) of ids in self or other."""
+        return compact_file_ids(set(self).union(other))
+
+    def difference(self, other):
+        """Return a FileIdArray of ids in self but not in other."""
+        if type(other) is FileIdArray:
+            return FileIdArray(fid for fid in self if fid not in other)
+        else:
+            return FileIdArray(set(self).difference(other))
+
+    def intersection(self, other):
+        """Return a FileIdArray of ids in both self and other."""
+        if type(other) is FileIdArray:
+            return FileIdArray(fid for fid in self if fid in other)
+        else:
+            return FileIdArray(set(self).intersection(other))
+
+    # Disable in-place modifications that would break the ordering
+    def _immutable(self, *args):
+        raise TypeError('FileIdArray is immutable')
+
+    append = extend = insert = pop = remove = reverse = fromlist = fromstring = fromfile = fromunicode = byteswap = _immutable
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = _immutable
+
+
+def compact_file_ids(file_ids):
+    """
+    Make a FileIdArray from an iterable of file ids. Return a tuple if any element is not an integer (i.e. an LFN).
+    """
+
+    file_ids = list(file_ids)
+    try:
+        return FileIdArray(file_ids)
+    except TypeError:
+        return tuple(file_ids)
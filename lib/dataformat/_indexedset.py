@@ -0,0 +1,151 @@
+# Set types that keep a dict index of their elements so that lookups by name are O(1).
+# Elements must never change their key while in the set, and keys are assumed to be unique
+# within a set (one block per name in a dataset, one replica per site etc.).
+
+class IndexedSet(set):
+    """
+    A set that maintains {key(element): element}. Subclasses define the static method _key.
+    All in-place mutators of set are overridden to keep the index in sync.
+    The index is built lazily at the first lookup, because elements may not be fully
+    constructed when the set is created (e.g. when unpickling a Dataset). Results of
+    non-mutating set operations (union, difference, copy etc.) are created without calling
+    __init__ and therefore may not have the _index attribute at all.
+    """
+
+    __slots__ = ['_index']
+
+    @staticmethod
+    def _key(obj):
+        raise NotImplementedError('_key')
+
+    def __init__(self, iterable = ()):
+        set.__init__(self, iterable)
+        self._index = None
+
+    def get(self, key, default = None):
+        if getattr(self, '_index', None) is None:
+            self._reindex()
+
+        return self._index.get(key, default)
+
+    def add(self, obj):
+        set.add(self, obj)
+        index = getattr(self, '_index', None)
+        if index is not None:
+            index[self._key(obj)] = obj
+
+    def remove(self, obj):
+        set.remove(self, obj)
+        self._unindex(obj)
+
+    def discard(self, obj):
+        if obj in self:
+            self.remove(obj)
+
+    def pop(self):
+        obj = set.pop(self)
+        self._unindex(obj)
+        return obj
+
+    def clear(self):
+        set.clear(self)
+        self._index = None
+
+    def update(self, *others):
+        for other in others:
+            for obj in other:
+                self.add(obj)
+
+    def difference_update(self, *others):
+        for other in others:
+            for obj in other:
+                self.discard(obj)
+
+    def intersection_update(self, *others):
+        set.intersection_update(self, *others)
+        self._index = None
+
+    def symmetric_difference_update(self, other):
+        set.symmetric_difference_update(self, other)
+        self._index = None
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+    def _unindex(self, obj):
+        index = getattr(self, '_index', None)
+        if index is None:
+            return
+
+        key = self._key(obj)
+        # another element with the same key may have replaced obj in the index
+        if index.get(key) is obj:
+            index.pop(key)
+
+    def _reindex(self):
+        self._index = dict((self._key(obj), obj) for obj in self)
+
+
+class IndexedFrozenSet(frozenset):
+    """Immutable counterpart of IndexedSet."""
+
+    __slots__ = ['_index']
+
+    @staticmethod
+    def _key(obj):
+        raise NotImplementedError('_key')
+
+    def __new__(cls, iterable = ()):
+        obj = frozenset.__new__(cls, iterable)
+        obj._index = None
+        return obj
+
+    def get(self, key, default = None):
+        if getattr(self, '_index', None) is None:
+            self._index = dict((self._key(obj), obj) for obj in self)
+
+        return self._index.get(key, default)
+
+
+def _name_key(obj):
+    return obj.name
+
+def _site_name_key(replica):
+    return replica._site_name()
+
+def _lfn_key(lfile):
+    return lfile.lfn
+
+
+class BlockSet(IndexedSet):
+    """Set of blocks of a dataset, indexed by the internal block name."""
+    __slots__ = []
+    _key = staticmethod(_name_key)
+
+class ReplicaSet(IndexedSet):
+    """Set of dataset or block replicas, indexed by the site name."""
+    __slots__ = []
+    _key = staticmethod(_site_name_key)
+
+class FileSet(IndexedSet):
+    """Set of files of a block, indexed by LFN."""
+    __slots__ = []
+    _key = staticmethod(_lfn_key)
+
+class FrozenFileSet(IndexedFrozenSet):
+    """Immutable set of files of a block, indexed by LFN."""
+    __slots__ = []
+    _key = staticmethod(_lfn_key)
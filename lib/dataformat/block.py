@@ -1,3 +1,4 @@
+import sys
 import time
 import collections
 import threading
@@ -5,6 +6,7 @@ import weakref
 
 from exceptions import ObjectError, IntegrityError, OperationalError
 from _namespace import customize_block
+from _indexedset import ReplicaSet, FileSet, FrozenFileSet
 
 class Block(object):
     """
@@ -14,13 +16,20 @@ class Block(object):
     __slots__ = ['_name', '_dataset', 'id', '_size', '_num_files', 'is_open', 'replicas', 'last_update', '_files']
 
     # Container for the file-set "originals" - Block._files will normally be a weakref pointing to a value of this dict
+    # LRU ordered (least recently used first). Values are (files, estimated size in bytes).
     _files_cache = collections.OrderedDict()
     _files_cache_lock = threading.Lock()
-    _MAX_FILES_CACHE_DEPTH = 1000
+    # Budget on the total estimated memory usage of the cached file sets (bytes). Set through set_default.
+    _files_cache_budget = 512 * 1024 * 1024
+    _files_cache_bytes = 0
+    _files_cache_counters = {'hits': 0, 'misses': 0, 'evictions': 0}
 
     # Pointer to inventory._store
     inventory_store = None
 
+    # Pointer to inventory.block_index ({(dataset name, block internal name): block}) if the inventory keeps one
+    inventory_index = None
+
     # Regular expression object (from re.compile) of the block name format, if there is any.
     name_pattern = None
 
@@ -50,12 +59,30 @@ class Block(object):
     def size(self, value):
         if value != self._size:
             self._check_and_load_files(cache = False)
-            self._size = value
+            self._set_size(value)
 
     @property
     def files(self):
         return self._check_and_load_files()
 
+    @staticmethod
+    def set_default(config):
+        Block._files_cache_budget = config.get('files_cache_budget', Block._files_cache_budget)
+
+    @staticmethod
+    def files_cache_stats():
+        """
+        @return {'hits': n, 'misses': n, 'evictions': n, 'blocks': n, 'bytes': n, 'budget': n}
+        """
+
+        with Block._files_cache_lock:
+            stats = dict(Block._files_cache_counters)
+            stats['blocks'] = len(Block._files_cache)
+            stats['bytes'] = Block._files_cache_bytes
+            stats['budget'] = Block._files_cache_budget
+
+        return stats
+
     def __init__(self, name, dataset, size = 0, num_files = 0, is_open = False, last_update = 0, bid = 0, internal_name = True):
         if internal_name:
             self._name = name
@@ -73,7 +100,8 @@ class Block(object):
         
         self.id = bid
 
-        self.replicas = set()
+        # indexed by site name
+        self.replicas = ReplicaSet()
 
         self._files = None
 
@@ -116,6 +144,9 @@ class Block(object):
         if block is None:
             block = Block(self._name, dataset, self._size, self._num_files, self.is_open, self.last_update, self.id)
             dataset.blocks.add(block)
+            if inventory.block_index is not None:
+                inventory.block_index[(dataset.name, block._name)] = block
+
             updated = True
         elif check and (block is self or block == self):
             # identical object -> return False if check is requested
@@ -140,6 +171,10 @@ class Block(object):
             return None
 
         block.unlink()
+
+        if inventory.block_index is not None:
+            inventory.block_index.pop((dataset.name, block._name), None)
+
         return block
 
     def unlink(self):
@@ -150,10 +185,11 @@ class Block(object):
 
         self._dataset.blocks.remove(self)
 
-        try:
-            Block._files_cache.pop(self)
-        except KeyError:
-            pass
+        if Block.inventory_store is not None and not Block.inventory_store.server_side:
+            with Block._files_cache_lock:
+                Block._uncache_files(self)
+        else:
+            Block._uncache_files(self)
 
     def write_into(self, store):
         store.save_block(self)
@@ -180,14 +216,11 @@ class Block(object):
         @param lfn        File name
         @param must_find  Raise an exception if file is not found.
         """
-        try:
-            return next(f for f in self.files if f._lfn == lfn)
+        lfile = self.files.get(lfn)
+        if lfile is None and must_find:
+            raise ObjectError('Cannot find file %s' % str(lfn))
 
-        except StopIteration:
-            if must_find:
-                raise ObjectError('Cannot find file %s' % str(lfn))
-            else:
-                return None
+        return lfile
 
     def add_file(self, lfile):
         """
@@ -209,17 +242,17 @@ class Block(object):
         self._files.remove(lfile)
 
     def find_replica(self, site, must_find = False):
-        try:
-            if type(site) is str:
-                return next(r for r in self.replicas if r.site.name == site)
-            else:
-                return next(r for r in self.replicas if r.site == site)
+        if type(site) is str:
+            replica = self.replicas.get(site)
+        else:
+            replica = self.replicas.get(site.name)
+            if replica is not None and replica.site != site:
+                replica = None
 
-        except StopIteration:
-            if must_find:
-                raise ObjectError('Cannot find replica at %s for %s' % (site.name, self.full_name()))
-            else:
-                return None
+        if replica is None and must_find:
+            raise ObjectError('Cannot find replica at %s for %s' % (site.name, self.full_name()))
+
+        return replica
 
     def _dataset_name(self):
         if type(self._dataset) is str:
@@ -228,7 +261,11 @@ class Block(object):
             return self._dataset.name
 
     def _check_and_load_files(self, cache = True):
-        if type(self._files) is set:
+        if type(self._files) is FileSet:
+            return self._files
+        elif type(self._files) is set:
+            # _files was directly set to a plain set - convert to an indexed set
+            self._files = FileSet(self._files)
             return self._files
 
         if not Block.inventory_store.server_side:
@@ -245,20 +282,25 @@ class Block(object):
                     except ReferenceError:
                         # expired proxy
                         self._files = None
+                    else:
+                        Block._files_cache_counters['hits'] += 1
+                        try:
+                            # move to the most recently used end
+                            Block._files_cache[self] = Block._files_cache.pop(self)
+                        except KeyError:
+                            # evicted but still referenced by someone
+                            pass
     
                 if self._files is None:
-                    files = frozenset(self._load_files())
+                    Block._files_cache_counters['misses'] += 1
+
+                    files = FrozenFileSet(self._load_files())
                     
                     if Block.inventory_store.server_side:
                         # In server side inventory, we don't keep the files in memory
                         return files
 
-                    while len(Block._files_cache) >= Block._MAX_FILES_CACHE_DEPTH:
-                        # Keep _files_cache FIFO to Block._MAX_FILES_CACHE_DEPTH
-                        Block._files_cache.popitem(last = False)
-
-                    Block._files_cache[self] = files
-                    self._files = weakref.proxy(files)
+                    self._cache_files(files)
 
             else:
                 if Block.inventory_store.server_side:
@@ -266,18 +308,15 @@ class Block(object):
 
                 if type(self._files) is weakref.ProxyType:
                     try:
-                        self._files = set(self._files)
+                        self._files = FileSet(self._files)
                     except ReferenceError:
                         # expired proxy
                         self._files = None
 
-                    try:
-                        Block._files_cache.pop(self)
-                    except KeyError:
-                        pass
+                    Block._uncache_files(self)
 
                 if self._files is None:
-                    self._files = self._load_files()
+                    self._files = FileSet(self._load_files())
 
         finally:
             if not Block.inventory_store.server_side:
@@ -285,20 +324,121 @@ class Block(object):
 
         return self._files
 
+    @staticmethod
+    def prefetch_files(blocks):
+        """
+        Load the files of multiple blocks with batched store queries and put them in the file cache.
+        Blocks whose files are already in memory are not reloaded.
+        @param blocks  Iterable of blocks
+
+        @return {block: files}. Blocks only hold weak references to cached file sets, which can be evicted
+                when the cache budget is exceeded. Keep the returned dict while using the files.
+        """
+
+        result = {}
+        to_load = []
+
+        server_side = Block.inventory_store.server_side
+
+        if not server_side:
+            Block._files_cache_lock.acquire()
+
+        try:
+            for block in blocks:
+                if block in result:
+                    continue
+
+                if block.id == 0 or type(block._files) is FileSet or type(block._files) is set:
+                    result[block] = block._files
+                    continue
+
+                try:
+                    result[block] = Block._files_cache[block][0]
+                except KeyError:
+                    to_load.append(block)
+
+            if len(to_load) != 0:
+                loaded = Block.inventory_store.get_files_many(to_load)
+
+                for block in to_load:
+                    files = FrozenFileSet(loaded[block])
+                    block._check_loaded_files(files)
+
+                    Block._files_cache_counters['misses'] += 1
+
+                    if not server_side:
+                        block._cache_files(files)
+
+                    result[block] = files
+
+        finally:
+            if not server_side:
+                Block._files_cache_lock.release()
+
+        for block, files in result.items():
+            if files is None or type(files) is set:
+                # id == 0 or directly set
+                result[block] = block._check_and_load_files()
+
+        return result
+
+    def _cache_files(self, files):
+        """
+        Put a loaded file set into the cache and point self._files to it. Must be called with the cache lock held.
+        """
+
+        nbytes = Block._estimate_files_size(files)
+
+        while len(Block._files_cache) != 0 and Block._files_cache_bytes + nbytes > Block._files_cache_budget:
+            # Evict least recently used
+            _, (_, evicted_bytes) = Block._files_cache.popitem(last = False)
+            Block._files_cache_bytes -= evicted_bytes
+            Block._files_cache_counters['evictions'] += 1
+
+        # A single block exceeding the budget is still cached (alone) so that it survives until it is used
+        Block._files_cache[self] = (files, nbytes)
+        Block._files_cache_bytes += nbytes
+        self._files = weakref.proxy(files)
+
+    @staticmethod
+    def _uncache_files(block):
+        try:
+            _, nbytes = Block._files_cache.pop(block)
+        except KeyError:
+            pass
+        else:
+            Block._files_cache_bytes -= nbytes
+
+    @staticmethod
+    def _estimate_files_size(files):
+        """
+        Rough estimate of the memory footprint of a file set (container, File objects, LFNs, and checksums).
+        """
+
+        # twice the set size to account for the LFN index built at the first lookup
+        nbytes = 2 * sys.getsizeof(files)
+        for lfile in files:
+            nbytes += sys.getsizeof(lfile) + sys.getsizeof(lfile._lfn) + sys.getsizeof(lfile.checksum)
+
+        return nbytes
+
     def _load_files(self):
         if self.id == 0:
             return set()
 
         files = Block.inventory_store.get_files(self)
 
+        self._check_loaded_files(files)
+
+        return files
+
+    def _check_loaded_files(self, files):
         if len(files) != self._num_files:
             raise IntegrityError('Number of files mismatch in %s: predicted %d, loaded %d' % (str(self), self._num_files, len(files)))
         size = sum(f.size for f in files)
         if size != self._size:
             raise IntegrityError('Size mismatch in %s: predicted %d, loaded %d' % (str(self), self._size, size))
 
-        return files
-
     def _copy_no_check(self, other, load_files = True):
         self.is_open = other.is_open
         self.last_update = other.last_update
@@ -307,7 +447,17 @@ class Block(object):
             # updating file parameters -> need to load files permanently
             self._check_and_load_files(cache = False)
 
-        self._size = other._size
+        self._set_size(other._size)
         self._num_files = other._num_files
 
+    def _set_size(self, value):
+        delta = value - self._size
+        self._size = value
+
+        if delta != 0:
+            # keep the occupancy counters of the site partitions up to date
+            for replica in self.replicas:
+                if type(replica.site) is not str:
+                    replica.site.adjust_occupancy(replica, 0, delta)
+
 customize_block(Block)
@@ -2,15 +2,29 @@ import time
 
 from exceptions import ObjectError
 from block import Block
+from _fileids import compact_file_ids
 from _namespace import customize_blockreplica
 
 class BlockReplica(object):
     """Block placement at a site. Holds an attribute 'group' which can be None.
     BlockReplica size can be different from that of the Block."""
 
-    __slots__ = ['_block', '_site', 'group', 'is_custodial', 'size', 'last_update', 'file_ids']
+    __slots__ = ['_block', '_site', 'group', 'is_custodial', '_size', 'last_update', 'file_ids', '_partition_cache']
 
     _use_file_ids = True
+    # If True, file_ids of registered files are stored in a sorted array of machine integers instead of a tuple
+    _compact_file_ids = False
+
+    @staticmethod
+    def make_file_ids(file_ids):
+        """
+        Make the container for the file_ids attribute from an iterable of file ids and LFNs.
+        @return  A FileIdArray if _compact_file_ids is True and all elements are ids, otherwise a tuple.
+        """
+        if BlockReplica._compact_file_ids:
+            return compact_file_ids(file_ids)
+        else:
+            return tuple(file_ids)
 
     @property
     def block(self):
@@ -20,6 +34,19 @@ class BlockReplica(object):
     def site(self):
         return self._site
 
+    @property
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, value):
+        delta = value - self._size
+        self._size = value
+
+        if delta != 0 and type(self._block) is Block and type(self._site) is not str:
+            # keep the occupancy counters of the site partitions up to date
+            self._site.adjust_occupancy(self, delta, 0)
+
     @property
     def num_files(self):
         if self.file_ids is None:
@@ -39,6 +66,9 @@ class BlockReplica(object):
         self.is_custodial = is_custodial
         self.last_update = last_update
 
+        # set by PartitionClassifier
+        self._partition_cache = None
+
         # Override file_ids depending on the given size:
         # If size < 0, this replica is considered full. If type(block) is Block, set the size and file_ids
         #  from the block. If not, this is a transient object - just set the size to -1.
@@ -48,19 +78,19 @@ class BlockReplica(object):
 
         if size < 0:
             if type(block) is Block:
-                self.size = block.size
+                self._size = block.size
                 if BlockReplica._use_file_ids:
                     self.file_ids = None
                 else:
                     self.file_ids = block.num_files
             else:
-                self.size = -1
+                self._size = -1
                 self.file_ids = None
 
         elif size == 0 and file_ids is None:
-            self.size = 0
+            self._size = 0
             if BlockReplica._use_file_ids:
-                self.file_ids = tuple()
+                self.file_ids = BlockReplica.make_file_ids(())
             else:
                 self.file_ids = 0
 
@@ -69,7 +99,7 @@ class BlockReplica(object):
                 raise ObjectError('Cannot initialize a BlockReplica with finite size and file_ids = None without a valid block')
 
             if size == block.size:
-                self.size = size
+                self._size = size
                 if BlockReplica._use_file_ids:
                     self.file_ids = None
                 else:
@@ -78,7 +108,7 @@ class BlockReplica(object):
                 raise ObjectError('BlockReplica file_ids cannot be None when size is finite and not the full block size')
 
         else:
-            self.size = size
+            self._size = size
 
             if BlockReplica._use_file_ids:
                 # some iterable
@@ -89,7 +119,7 @@ class BlockReplica(object):
                     else:
                         tmplist.append(fid)
     
-                self.file_ids = tuple(tmplist)
+                self.file_ids = BlockReplica.make_file_ids(tmplist)
             else:
                 # must be an integer
                 self.file_ids = file_ids
@@ -214,6 +244,7 @@ class BlockReplica(object):
 
             if block_replicas is None:
                 # site_partition contained all block replicas. It will contain all after a deletion.
+                site_partition._add_size(-self._size, -self._block.size)
                 continue
 
             try:
@@ -222,6 +253,8 @@ class BlockReplica(object):
                 # this replica was not part of the partition
                 continue
 
+            site_partition._add_size(-self._size, -self._block.size)
+
             if len(block_replicas) == 0:
                 site_partition.replicas.pop(dataset_replica)
 
@@ -321,7 +354,7 @@ class BlockReplica(object):
             if self.size == self.block.size and len(file_ids) == self.block.num_files:
                 self.file_ids = None
             else:
-                self.file_ids = tuple(file_ids)
+                self.file_ids = BlockReplica.make_file_ids(file_ids)
 
         else:
             self.file_ids += 1
@@ -359,7 +392,7 @@ class BlockReplica(object):
                 file_ids = list(self.file_ids)
 
             file_ids.remove(identifier)
-            self.file_ids = tuple(file_ids)
+            self.file_ids = BlockReplica.make_file_ids(file_ids)
 
         else:
             self.file_ids -= 1
@@ -429,7 +462,7 @@ class BlockReplica(object):
                     else:
                         tmplist.append(fid)
     
-                self.file_ids = tuple(tmplist)
+                self.file_ids = BlockReplica.make_file_ids(tmplist)
 
         else:
             self.file_ids = other.file_ids
@@ -4,6 +4,7 @@ import threading
 
 from exceptions import ObjectError
 from _namespace import customize_dataset
+from _indexedset import BlockSet, ReplicaSet
 
 class Dataset(object):
     """Represents a dataset."""
@@ -109,8 +110,9 @@ class Dataset(object):
 
         self.id = did
 
-        self.blocks = set()
-        self.replicas = set()
+        # indexed by block name and site name, respectively
+        self.blocks = BlockSet()
+        self.replicas = ReplicaSet()
 
         # "transient" members - excluded in __getstate__
         self.attr = {} # freeform key-value pairs
@@ -192,6 +194,9 @@ class Dataset(object):
         for block in list(dataset.blocks):
             block.unlink()
 
+            if inventory.block_index is not None:
+                inventory.block_index.pop((dataset._name, block.name), None)
+
         return dataset
 
     def write_into(self, store):
@@ -201,13 +206,11 @@ class Dataset(object):
         store.delete_dataset(self)
 
     def find_block(self, block_name, must_find = False):
-        try:
-            return next(b for b in self.blocks if b.name == block_name)
-        except StopIteration:
-            if must_find:
-                raise ObjectError('Could not find block %s in %s', block_name, self._name)
-            else:
-                return None
+        block = self.blocks.get(block_name)
+        if block is None and must_find:
+            raise ObjectError('Could not find block %s in %s', block_name, self._name)
+
+        return block
 
     def find_file(self, path, must_find = False):
         for block in self.blocks:
@@ -221,16 +224,16 @@ class Dataset(object):
             return None
 
     def find_replica(self, site, must_find = False):
-        try:
-            if type(site) is str:
-                return next(r for r in self.replicas if r.site.name == site)
-            else:
-                return next(r for r in self.replicas if r.site == site)
+        if type(site) is str:
+            replica = self.replicas.get(site)
+        else:
+            replica = self.replicas.get(site.name)
+            if replica is not None and replica.site != site:
+                replica = None
 
-        except StopIteration:
-            if must_find:
-                raise ObjectError('Could not find replica on %s of %s', str(site), self._name)
-            else:
-                return None
+        if replica is None and must_find:
+            raise ObjectError('Could not find replica on %s of %s', str(site), self._name)
+
+        return replica
 
 customize_dataset(Dataset)
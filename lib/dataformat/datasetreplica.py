@@ -115,9 +115,11 @@ class DatasetReplica(object):
     def unlink(self):
         for site_partition in self._site.partitions.itervalues():
             try:
-                site_partition.replicas.pop(self)
+                block_replicas = site_partition.replicas.pop(self)
             except KeyError:
-                pass
+                continue
+
+            site_partition._add_replica_size(self, block_replicas, sign = -1)
 
         self._site._dataset_replicas.pop(self._dataset)
 
@@ -6,7 +6,7 @@ class Partition(object):
     that returns True when the passed block replica belongs to the partition.
     """
 
-    __slots__ = ['_name', 'id', '_subpartitions', '_parent', '_condition']
+    __slots__ = ['_name', 'id', '_subpartitions', '_parent', '_condition', '_classifier']
 
     @property
     def name(self):
@@ -30,6 +30,8 @@ class Partition(object):
         # Members that cannot be exported in a pickle (and thus cannot be communicated
         # through multiprocessing queues) - excluded in __getstate__
         self._condition = condition
+        # PartitionClassifier of the set of partitions this partition belongs to (see PartitionClassifier.get)
+        self._classifier = None
 
     def __str__(self):
         return 'Partition %s (id=%d)' % (self._name, self.id)
@@ -45,10 +47,11 @@ class Partition(object):
         return self._name != other._name
 
     def __getstate__(self):
-        return {'_name': self._name, '_subpartitions': self._subpartitions, '_parent': self._parent, '_condition': None}
+        return {'_name': self._name, '_subpartitions': self._subpartitions, '_parent': self._parent, '_condition': None, '_classifier': None}
 
     def __setstate__(self, state):
         # Need this function because Partition does not have __dict__
+        self._classifier = None
         for key, value in state.iteritems():
             setattr(self, key, value)
 
@@ -141,3 +144,122 @@ class Partition(object):
             partition._subpartitions = tuple(subpartitions)
 
         return partition
+
+
+class PartitionClassifier(object):
+    """
+    Computes the set of partitions a block replica belongs to. All leaf partition conditions are
+    evaluated in one pass and superpartition membership is derived from the leaf results, instead of
+    calling Partition.contains (which recurses into subpartitions) for each partition.
+    Results are cached in the block replica and reused as long as its group and custodial flag are
+    unchanged. This is only done if all leaf conditions are known to depend on no replica attributes
+    other than static_variables (see is_cacheable). Set cache_results to False to disable caching
+    altogether.
+    """
+
+    cache_results = True
+
+    # Replica variables that do not change for a block replica with a fixed group
+    static_variables = frozenset(['blockreplica.owner', 'dataset.name', 'site.name', 'site.storage_type'])
+
+    @staticmethod
+    def is_cacheable(condition):
+        """
+        @param condition  Partition condition
+        @return True if the condition is known to depend only on static_variables. Conditions that do not
+                declare their variables (variable_names), e.g. plain callables, are assumed to be mutable.
+        """
+        try:
+            variable_names = condition.variable_names
+        except AttributeError:
+            return False
+
+        return PartitionClassifier.static_variables.issuperset(variable_names)
+
+    @staticmethod
+    def get(partitions):
+        """
+        The classifier is kept in the partition objects, which belong to a single inventory. Each inventory
+        therefore has its own classifier (all sites normally have the same partitions).
+        @param partitions  Iterable of partitions (e.g. Site.partitions)
+        @return A PartitionClassifier for the given set of partitions.
+        """
+        key = frozenset(partitions)
+
+        try:
+            classifier = next(iter(key))._classifier
+        except StopIteration:
+            return PartitionClassifier(key)
+
+        if classifier is None or classifier.key != key:
+            classifier = PartitionClassifier(key)
+            for partition in key:
+                partition._classifier = classifier
+
+        return classifier
+
+    def __init__(self, partitions):
+        self.key = frozenset(partitions)
+
+        self._leaves = []
+        # [(superpartition, [indices of all leaf partitions under it])]
+        self._supers = []
+
+        leaf_indices = {}
+        for partition in self.key:
+            if partition.subpartitions is None:
+                leaf_indices[partition] = len(self._leaves)
+                self._leaves.append(partition)
+
+        def collect_leaves(partition):
+            if partition.subpartitions is None:
+                return [leaf_indices[partition]]
+            else:
+                indices = []
+                for subp in partition.subpartitions:
+                    indices.extend(collect_leaves(subp))
+                return indices
+
+        for partition in self.key:
+            if partition.subpartitions is not None:
+                self._supers.append((partition, collect_leaves(partition)))
+
+        # Membership is cached only if no leaf condition depends on mutable attributes
+        self.cache_results = all(PartitionClassifier.is_cacheable(leaf._condition) for leaf in self._leaves)
+
+        # Cache entries are shared among block replicas: {(group, is_custodial, partitions): entry}
+        self._entries = {}
+        # Unique token identifying this classifier in the cache entries (does not survive pickling)
+        self._token = object()
+
+    def classify(self, block_replica):
+        """
+        @param block_replica  BlockReplica
+        @return Frozenset of partitions that contain the block replica.
+        """
+
+        entry = block_replica._partition_cache
+        if entry is not None and entry[0] is self._token and entry[1] is block_replica.group and entry[2] == block_replica.is_custodial:
+            return entry[3]
+
+        matches = [leaf._condition.match(block_replica) for leaf in self._leaves]
+
+        partitions = [leaf for leaf, match in zip(self._leaves, matches) if match]
+        for superpartition, indices in self._supers:
+            for index in indices:
+                if matches[index]:
+                    partitions.append(superpartition)
+                    break
+
+        partitions = frozenset(partitions)
+
+        if self.cache_results and PartitionClassifier.cache_results:
+            key = (block_replica.group, block_replica.is_custodial, partitions)
+            try:
+                entry = self._entries[key]
+            except KeyError:
+                entry = self._entries[key] = (self._token,) + key
+
+            block_replica._partition_cache = entry
+
+        return partitions
@@ -3,6 +3,8 @@ import re
 
 from exceptions import ObjectError, IntegrityError
 from sitepartition import SitePartition
+from partition import PartitionClassifier
+from block import Block
 
 class Site(object):
     """Represents a site. Owns lists of dataset and block replicas, which are organized into partitions."""
@@ -204,14 +206,28 @@ class Site(object):
             else:
                 return dataset_replica.find_block_replica(block, must_find = must_find)
         else:
-            # lookup by block name - very inefficient operation
-            for dataset_replica in self._dataset_replicas.itervalues():
-                for block_replica in dataset_replica.block_replicas:
-                    if block_replica.block.name == block:
-                        return block_replica
+            # lookup by full block name
+            try:
+                dataset_name, block_name = Block.from_full_name(block)
+            except ObjectError:
+                dataset_name = None
+
+            block_obj = None
+            if dataset_name is None:
+                pass
+            elif Block.inventory_index is not None:
+                block_obj = Block.inventory_index.get((dataset_name, block_name))
+            else:
+                for dataset_replica in self._dataset_replicas.itervalues():
+                    if dataset_replica.dataset.name == dataset_name:
+                        block_obj = dataset_replica.dataset.find_block(block_name)
+                        break
+
+            if block_obj is not None:
+                return self.find_block_replica(block_obj, must_find = must_find)
 
             if must_find:
-                raise ObjectError('Could not find replica of %s in %s' % (block.full_name(), self._name))
+                raise ObjectError('Could not find replica of %s in %s' % (block, self._name))
             else:
                 return None
 
@@ -222,20 +238,29 @@ class Site(object):
         self._dataset_replicas[replica.dataset] = replica
 
         if add_block_replicas:
-            for partition, site_partition in self.partitions.iteritems():
-                block_replicas = set()
-                for block_replica in replica.block_replicas:
-                    if partition.contains(block_replica):
-                        block_replicas.add(block_replica)
-    
+            classifier = PartitionClassifier.get(self.partitions)
+
+            partition_block_replicas = dict((partition, set()) for partition in self.partitions)
+            for block_replica in replica.block_replicas:
+                for partition in classifier.classify(block_replica):
+                    partition_block_replicas[partition].add(block_replica)
+
+            for partition, block_replicas in partition_block_replicas.iteritems():
                 if len(block_replicas) == 0:
                     continue
+
+                site_partition = self.partitions[partition]
+
+                if replica in site_partition.replicas:
+                    site_partition._add_replica_size(replica, site_partition.replicas[replica], sign = -1)
     
                 if block_replicas == replica.block_replicas:
                     site_partition.replicas[replica] = None
                 else:
                     site_partition.replicas[replica] = block_replicas
 
+                site_partition._add_replica_size(replica, block_replicas)
+
     def add_block_replica(self, replica):
         # this function should be called automatically to avoid integrity errors
         try:
@@ -246,13 +271,15 @@ class Site(object):
         if replica not in dataset_replica.block_replicas:
             raise IntegrityError('%s is not a block replica of %s' % (str(replica), str(dataset_replica)))
 
-        for partition, site_partition in self.partitions.iteritems():
-            if not partition.contains(replica):
-                continue
+        containing_partitions = PartitionClassifier.get(self.partitions).classify(replica)
 
+        for partition, site_partition in self.partitions.iteritems():
             try:
                 block_replica_list = site_partition.replicas[dataset_replica]
             except KeyError:
+                if partition not in containing_partitions:
+                    continue
+
                 if len(dataset_replica.block_replicas) == 1:
                     # this is the sole block replica
                     site_partition.replicas[dataset_replica] = None
@@ -263,11 +290,15 @@ class Site(object):
                     # assume this function was called for all new block replicas
                     # then we are just adding another replica to this partition
                     pass
-                else:
+                elif partition in containing_partitions:
                     # again assuming this function is called for all new block replicas,
                     # block_replica_list not being None implies that adding this new
                     # replica will not make the dataset replica in this partition complete
                     block_replica_list.add(replica)
+                else:
+                    continue
+
+            site_partition._add_size(replica.size, replica.block.size)
 
     def update_partitioning(self, replica):
         if replica.site is not self:
@@ -277,21 +308,30 @@ class Site(object):
             if replica not in self._dataset_replicas:
                 return
 
+            classifier = PartitionClassifier.get(self.partitions)
+            # {block_replica: frozenset of partitions}
+            memberships = dict((block_replica, classifier.classify(block_replica)) for block_replica in replica.block_replicas)
+
             for partition, site_partition in self.partitions.iteritems():
                 try:
                     block_replicas = site_partition.replicas[replica]
                 except KeyError:
                     block_replicas = set()
+                else:
+                    site_partition._add_replica_size(replica, block_replicas, sign = -1)
     
                 if block_replicas is None:
                     # previously, was all contained - need to check again
                     block_replicas = set()
                     for block_replica in replica.block_replicas:
-                        if partition.contains(block_replica):
+                        if partition in memberships[block_replica]:
                             block_replicas.add(block_replica)
 
                     if block_replicas != replica.block_replicas:
                         site_partition.replicas[replica] = block_replicas
+                        site_partition._add_replica_size(replica, block_replicas)
+                    else:
+                        site_partition._add_replica_size(replica, None)
 
                     continue
 
@@ -300,13 +340,13 @@ class Site(object):
 
                 # reevaluate existing block replicas
                 for block_replica in list(block_replicas):
-                    if not partition.contains(block_replica):
+                    if partition not in memberships[block_replica]:
                         block_replicas.remove(block_replica)
 
                 # add new block replicas
                 new_replicas = replica.block_replicas - block_replicas
                 for block_replica in new_replicas:
-                    if partition.contains(block_replica):
+                    if partition in memberships[block_replica]:
                         block_replicas.add(block_replica)
                
                 if len(block_replicas) == 0:
@@ -319,6 +359,8 @@ class Site(object):
                 else:
                     site_partition.replicas[replica] = block_replicas
 
+                site_partition._add_replica_size(replica, block_replicas)
+
         else:
             # BlockReplica
             dataset_replica = self.find_dataset_replica(replica.block.dataset)
@@ -326,30 +368,36 @@ class Site(object):
             if dataset_replica is None:
                 return
 
+            containing_partitions = PartitionClassifier.get(self.partitions).classify(replica)
+
             for partition, site_partition in self.partitions.iteritems():
                 try:
                     block_replicas = site_partition.replicas[dataset_replica]
                 except KeyError:
                     block_replicas = set()
 
-                if partition.contains(replica):
+                if partition in containing_partitions:
                     if block_replicas is None or replica in block_replicas:
                         # already included
                         continue
                     else:
                         block_replicas.add(replica)
+                        site_partition._add_size(replica.size, replica.block.size)
                 else:
                     if block_replicas is None:
                         # this dataset replica used to be fully included but now it's not
                         # make a copy of the full list of block replicas
                         block_replicas = set(dataset_replica.block_replicas)
                         block_replicas.remove(replica)
+                        site_partition._add_size(-replica.size, -replica.block.size)
                     else:
                         try:
                             block_replicas.remove(replica)
                         except KeyError:
                             # not included already
                             pass
+                        else:
+                            site_partition._add_size(-replica.size, -replica.block.size)
 
                 if len(block_replicas) == 0:
                     try:
@@ -362,6 +410,31 @@ class Site(object):
                 else:
                     site_partition.replicas[dataset_replica] = block_replicas
 
+    def adjust_occupancy(self, block_replica, physical, logical):
+        """
+        Add size changes of a block replica to the size counters of the site partitions that contain it.
+        @param block_replica  BlockReplica whose size (physical) or block size (logical) changed
+        @param physical       Change in block replica size
+        @param logical        Change in block size
+        """
+
+        try:
+            dataset_replica = self._dataset_replicas[block_replica.block.dataset]
+        except KeyError:
+            return
+
+        for site_partition in self.partitions.itervalues():
+            try:
+                block_replicas = site_partition.replicas[dataset_replica]
+            except KeyError:
+                continue
+
+            if block_replicas is None:
+                block_replicas = dataset_replica.block_replicas
+
+            if block_replica in block_replicas:
+                site_partition._add_size(physical, logical)
+
     def to_pfn(self, lfn, protocol):
         try:
             mapping = self.filename_mapping[protocol]
@@ -5,7 +5,10 @@ from exceptions import ObjectError, IntegrityError
 class SitePartition(object):
     """State of a partition at a site."""
 
-    __slots__ = ['_site', '_partition', '_quota', 'replicas']
+    __slots__ = ['_site', '_partition', '_quota', 'replicas', '_size_physical', '_size_logical']
+
+    # Set to True to verify the running size counters against a full recount at every occupancy_fraction call
+    _check_occupancy = False
 
     @property
     def site(self):
@@ -38,6 +41,10 @@ class SitePartition(object):
         self._quota = quota
         # {dataset_replica: set(block_replicas) or None (if all blocks are in)}
         self.replicas = {}
+        # Running totals of block replica sizes and block sizes of the replicas in this partition.
+        # Updated by Site, DatasetReplica, BlockReplica, and Block whenever self.replicas or a size changes.
+        self._size_physical = 0
+        self._size_logical = 0
 
     def __str__(self):
         if type(self._partition) is str:
@@ -129,16 +136,61 @@ class SitePartition(object):
         elif quota < 0:
             return 0.
         else:
-            total_size = 0.
-            for replica, block_replicas in self.replicas.iteritems():
-                if block_replicas is None:
-                    total_size += replica.size(physical = physical)
-                elif physical:
-                    total_size += sum(br.size for br in block_replicas)
-                else:
-                    total_size += sum(br.block.size for br in block_replicas)
-
-            return total_size / quota
+            if SitePartition._check_occupancy:
+                self.check_occupancy()
+
+            if physical:
+                return float(self._size_physical) / quota
+            else:
+                return float(self._size_logical) / quota
+
+    def recount_size(self, physical = True):
+        """
+        Compute the total size of the replicas in this partition by looping over all block replicas.
+        """
+        total_size = 0
+        for replica, block_replicas in self.replicas.iteritems():
+            if block_replicas is None:
+                total_size += replica.size(physical = physical)
+            elif physical:
+                total_size += sum(br.size for br in block_replicas)
+            else:
+                total_size += sum(br.block.size for br in block_replicas)
+
+        return total_size
+
+    def reset_size(self):
+        """
+        Set the running size counters from a full recount. Needed when self.replicas is filled directly.
+        """
+        self._size_physical = self.recount_size(physical = True)
+        self._size_logical = self.recount_size(physical = False)
+
+    def check_occupancy(self):
+        """
+        Compare the running size counters to a full recount and raise IntegrityError if they differ.
+        """
+        physical = self.recount_size(physical = True)
+        logical = self.recount_size(physical = False)
+
+        if physical != self._size_physical or logical != self._size_logical:
+            raise IntegrityError('Size counters of %s/%s are inconsistent: physical %d (recount %d), logical %d (recount %d)' % \
+                (self._site_name(), self._partition_name(), self._size_physical, physical, self._size_logical, logical))
+
+    def _add_size(self, physical, logical):
+        self._size_physical += physical
+        self._size_logical += logical
+
+    def _add_replica_size(self, dataset_replica, block_replicas, sign = 1):
+        """
+        Add (sign = 1) or subtract (sign = -1) the size of the entry (dataset_replica, block_replicas) to the counters.
+        """
+        if block_replicas is None:
+            block_replicas = dataset_replica.block_replicas
+
+        for block_replica in block_replicas:
+            self._size_physical += sign * block_replica.size
+            self._size_logical += sign * block_replica.block.size
 
     def embed_tree(self, inventory):
         if self._partition._subpartitions is not None:
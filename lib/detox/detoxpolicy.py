@@ -120,6 +120,8 @@ class DetoxPolicy(object):
                     if type(pred) is predicates.BinaryExpr and pred.variable.vtype == attrs.Attr.TIME_TYPE:
                         pred.rhs += config.time_shift * 24. * 3600.
 
+                line.condition.compile()
+
         # Check if the replicas can be deleted just before making the deletion requests.
         # Set to a function that takes a list of dataset replicas and removes from it
         # the replicas that should not be deleted.
@@ -239,10 +241,18 @@ class DetoxPolicy(object):
                     replica.block_replicas.remove(block_replica)
                     block_replicas_tmp.add(block_replica)
 
+                # cached values of the dataset assumed the full replica
+                if attrs.Attr.cache is not None:
+                    attrs.Attr.cache.invalidate(replica.dataset)
+
         else:
             actions.append(self.default_decision.action(None))
 
         # return the block replicas
-        replica.block_replicas.update(block_replicas_tmp)
+        if len(block_replicas_tmp) != 0:
+            replica.block_replicas.update(block_replicas_tmp)
+
+            if attrs.Attr.cache is not None:
+                attrs.Attr.cache.invalidate(replica.dataset)
         
         return actions
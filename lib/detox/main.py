@@ -8,6 +8,8 @@ from dynamo.dataformat.history import DeletedReplica
 from dynamo.detox.detoxpolicy import DetoxPolicy
 from dynamo.detox.detoxpolicy import Ignore, Protect, Delete, Dismiss, ProtectBlock, DeleteBlock, DismissBlock
 from dynamo.detox.history import DetoxHistory
+from dynamo.detox.vectorized import VectorizedPolicy
+from dynamo.policy.attrs import Attr, AttrCache
 from dynamo.operation.deletion import DeletionInterface
 from dynamo.utils.signaling import SignalBlocker
 
@@ -31,6 +33,18 @@ class Detox(object):
 
         self.deletion_per_iteration = config.get('deletion_per_iteration', 0.01)
 
+        # Evaluate numeric policy predicates on columns of all replicas at once (needs NumPy)
+        self.vectorize = config.get('vectorize', False)
+        if self.vectorize and not VectorizedPolicy.available:
+            LOG.warning('NumPy is not available. Policy will be evaluated replica by replica.')
+            self.vectorize = False
+
+        # VectorizedPolicy used in _execute_policy
+        self._vectorized = None
+
+        # Profile the policy predicates in the first iteration and reorder them for the following iterations
+        self.adaptive_ordering = config.get('adaptive_ordering', False)
+
         self.test_run = config.get('test_run', False)
         if self.test_run:
             self.deletion_op.set_read_only()
@@ -68,7 +82,16 @@ class Detox(object):
         self.history.save_conditions(self.policy.policy_lines)
 
         LOG.info('Applying policy to replicas.')
-        deleted, kept, protected, reowned = self._execute_policy(partition_repository)
+        # Attributes computed from dataset replicas are cached throughout the policy execution.
+        # _execute_policy invalidates the cached values of a dataset whenever its replicas change.
+        attr_cache = AttrCache()
+        Attr.cache = attr_cache
+        try:
+            deleted, kept, protected, reowned = self._execute_policy(partition_repository)
+        finally:
+            Attr.cache = None
+
+        LOG.info('Attribute cache: %d hits, %d misses, %d invalidations.', attr_cache.hits, attr_cache.misses, attr_cache.invalidations)
 
         partition = partition_repository.partitions[self.policy.partition_name]
         quotas = dict((s, s.partitions[partition].quota * 1.e-12) for s in partition_repository.sites.itervalues())
@@ -134,6 +157,8 @@ class Detox(object):
                     # Add to the site partition
                     site.partitions[partition].replicas[replica] = None
 
+                site.partitions[partition].reset_size()
+
         # Create a copy of the inventory, limiting to the current partition
         # We will be stripping replicas off the image as we process the policy in iterations
         LOG.info('Creating a partition image.')
@@ -221,6 +246,9 @@ class Detox(object):
                     if not full_replica:
                         block_replica_clone_set.add(block_replica_clone)
 
+            # replicas were filled directly - set the occupancy counters
+            site_partition_clone.reset_size()
+
         return partition_repository
 
     def _execute_policy(self, repository):
@@ -256,6 +284,12 @@ class Detox(object):
 
         LOG.info('Start deletion. Evaluating %d lines against %d replicas.', len(self.policy.policy_lines), len(all_replicas))
 
+        if self.vectorize:
+            self._vectorized = VectorizedPolicy(self.policy)
+            evaluate = self._vectorized.evaluate
+        else:
+            evaluate = self.policy.evaluate
+
         protected = {} # {replica: {condition_id: set(block_replicas)}}
         deleted = {} # same
         kept = {} # same
@@ -295,15 +329,24 @@ class Detox(object):
 
             ignored_replicas = set()
             empty_replicas = set()
+
+            profiling = (self.adaptive_ordering and iteration == 1)
+            if profiling:
+                for line in self._adaptive_lines():
+                    line.condition.start_profiling()
+
             start = time.time()
 
+            if self._vectorized is not None:
+                self._vectorized.prepare(all_replicas)
+
             for replica in all_replicas:
                 # Call policy.evaluate for each replica
                 # Function evaluate() returns a list of actions. If the replica matches a dataset-level policy,
                 # there is only one element in the returned list.
                 # Block-level actions are triggered only if the condition does not apply to all blocks.
                 # Sort the evaluation results into the three candidate containers above.
-                actions = self.policy.evaluate(replica)
+                actions = evaluate(replica)
 
                 # Keep track of block replicas matching block-level conditions
                 block_replicas = set(replica.block_replicas)
@@ -378,11 +421,15 @@ class Detox(object):
 
             for replica in empty_replicas:
                 replica.unlink_from(repository)
+                self._invalidate_attrs(replica)
 
             all_replicas -= empty_replicas
             all_replicas -= ignored_replicas
 
             LOG.info('Took %f seconds to evaluate', time.time() - start)
+
+            if profiling:
+                self._reorder_predicates()
             LOG.info(' %d dataset replicas in deletion candidates', len(delete_candidates))
 
             if len(delete_candidates) == 0:
@@ -461,6 +508,7 @@ class Detox(object):
                         replica.growing = False
                     
                     replica.unlink_from(repository)
+                    self._invalidate_attrs(replica)
                     all_replicas.remove(replica)
 
                 site_partition = site.partitions[partition]
@@ -473,6 +521,10 @@ class Detox(object):
 
         # done iterating
 
+        if self._vectorized is not None:
+            LOG.info('Vectorized policy evaluation: %d decisions from columns, %d partly from columns, %d replica by replica.', self._vectorized.num_vectorized, self._vectorized.num_partial, self._vectorized.num_fallback)
+            self._vectorized = None
+
         LOG.info(' %d dataset replicas in delete list', len(deleted))
         LOG.info(' %d dataset replicas in keep list', len(kept))
         LOG.info(' %d dataset replicas in protect list', len(protected))
@@ -530,6 +582,9 @@ class Detox(object):
                     if not partition.contains(block_replica):
                         blocks_to_unlink.add(block_replica)
 
+        if len(blocks_to_hand_over) != 0 or len(blocks_to_unlink) != 0:
+            self._invalidate_attrs(replica)
+
         if len(blocks_to_unlink) != 0:
             for block_replica in blocks_to_unlink:
                 block_replica.unlink_from(repository)
@@ -561,6 +616,45 @@ class Detox(object):
 
         return blocks_to_unlink - blocks_to_hand_over
 
+    def _adaptive_lines(self):
+        """
+        Policy lines whose predicates are profiled and reordered. With vectorized evaluation, lines decided
+        from the columns alone are excluded: their conditions only run for the few rows that cannot use the
+        columns, so the statistics would not represent the evaluation and the order hardly matters. The other
+        lines are profiled on the rows where they are actually evaluated replica by replica.
+        """
+
+        if self._vectorized is None:
+            return self.policy.policy_lines
+
+        return [line for iline, line in enumerate(self.policy.policy_lines) if not self._vectorized.decides_from_columns(iline)]
+
+    def _reorder_predicates(self):
+        """
+        Stop profiling the policy lines and reorder their predicates by the collected statistics.
+        """
+
+        for line in self._adaptive_lines():
+            condition = line.condition
+            condition.stop_profiling()
+
+            if len(condition.predicates) < 2:
+                continue
+
+            if condition.reorder():
+                LOG.info('Reordered predicates of policy %s: %s', str(line), condition.describe_predicates())
+            else:
+                LOG.info('Kept predicate order of policy %s: %s', str(line), condition.describe_predicates())
+
+    def _invalidate_attrs(self, replica):
+        """Drop the cached attribute values of the dataset of a replica that has changed."""
+
+        if Attr.cache is not None:
+            Attr.cache.invalidate(replica.dataset)
+
+        if self._vectorized is not None:
+            self._vectorized.invalidate(replica.dataset)
+
     def _commit_deletions(self, cycle_number, inventory, deleted, comment):
         """
         @param cycle_number  Cycle number.
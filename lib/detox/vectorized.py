@@ -0,0 +1,331 @@
+import logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import dynamo.policy.attrs as attrs
+import dynamo.policy.predicates as predicates
+from dynamo.detox.detoxpolicy import DatasetAction, BlockAction
+
+LOG = logging.getLogger(__name__)
+
+class VectorizedPolicy(object):
+    """
+    Columnar evaluation of the policy lines of a DetoxPolicy over all candidate dataset replicas.
+    Values of single-valued numeric, time, and boolean variables are stored in NumPy arrays (one row per
+    replica), and predicates on them are evaluated as vector masks. Other predicates on single-valued
+    variables (e.g. text matches) are evaluated once per row and stored as boolean columns. A line whose
+    vectorizable predicates do not all pass cannot match and is skipped. If the first line that passes
+    consists only of vectorizable predicates and has a dataset-level decision, the decision is made without
+    looking at the replica again. Lines with block-level predicates or decisions are evaluated on the
+    replica, and once block replicas are stripped by a block-level action, all following lines are too.
+    Rows with values that are not numbers are handed to DetoxPolicy.evaluate. The result is identical to
+    DetoxPolicy.evaluate.
+    Rows are computed once and recomputed only for the datasets passed to invalidate(). Replicas of a
+    dataset invalidated during an evaluation pass are evaluated by DetoxPolicy.evaluate for the rest of
+    the pass.
+    """
+
+    available = (np is not None)
+
+    def __init__(self, policy):
+        self.policy = policy
+
+        # [(vectorizable predicates, True if all predicates are vectorizable, True if dataset-level decision)]
+        self._lines = []
+        # variables with a value column
+        self._variables = []
+        # predicates with a result column
+        self._row_predicates = []
+
+        for line in policy.policy_lines:
+            vector_predicates = []
+            for predicate in line.condition.predicates:
+                if predicate.variable.multi_valued:
+                    continue
+
+                vector_predicates.append(predicate)
+
+                if self._has_value_column(predicate):
+                    if predicate.variable not in self._variables:
+                        self._variables.append(predicate.variable)
+                else:
+                    self._row_predicates.append(predicate)
+
+            complete = (len(vector_predicates) == len(line.condition.predicates))
+            dataset_level = not issubclass(line.decision.action_cls, BlockAction)
+
+            self._lines.append((vector_predicates, complete, dataset_level))
+
+        # {replica: row}
+        self._rows = {}
+        # {dataset: [row]}
+        self._dataset_rows = {}
+        # {variable: array}
+        self._columns = {}
+        # {predicate: array}
+        self._predicate_columns = {}
+        # rows with values that cannot be put in the columns
+        self._unusable = None
+        # rows to recompute
+        self._dirty_rows = set()
+        # datasets changed during the current pass
+        self._changed_datasets = set()
+        # masks[iline][row]: vectorizable predicates of the line pass
+        self._masks = None
+        # index of the first line with passing vectorizable predicates per row (-1 if none)
+        self._first_line = None
+
+        # replicas decided from the columns alone, in part, and not at all
+        self.num_vectorized = 0
+        self.num_partial = 0
+        self.num_fallback = 0
+
+    def prepare(self, replicas):
+        """
+        Start an evaluation pass over replicas. Builds the columns at the first call and recomputes the
+        rows of invalidated datasets at the following calls.
+        @param replicas  Collection of dataset replicas to be evaluated
+        """
+
+        if self._first_line is None:
+            self._build(replicas)
+        else:
+            for replica in replicas:
+                if replica not in self._rows:
+                    # not known at build time; will be evaluated one by one
+                    self._changed_datasets.add(replica.dataset)
+
+            for row in self._dirty_rows:
+                self._fill_row(row)
+
+        self._dirty_rows.clear()
+        self._changed_datasets.clear()
+
+        num_rows = len(self._replicas)
+
+        # masks[iline][row]
+        masks = np.ones((max(len(self._lines), 1), num_rows), dtype = bool)
+
+        for iline, (vector_predicates, _, _) in enumerate(self._lines):
+            for predicate in vector_predicates:
+                masks[iline] &= self._evaluate_predicate(predicate)
+
+        self._masks = masks
+
+        if len(self._lines) == 0:
+            self._first_line = np.full(num_rows, -1, dtype = int)
+        else:
+            self._first_line = masks.argmax(axis = 0)
+            self._first_line[~masks.any(axis = 0)] = -1
+
+    def evaluate(self, replica):
+        """
+        Same as DetoxPolicy.evaluate.
+        """
+
+        try:
+            row = self._rows[replica]
+        except KeyError:
+            row = None
+
+        if row is None or self._unusable[row] or replica.dataset in self._changed_datasets:
+            self.num_fallback += 1
+            return self.policy.evaluate(replica)
+
+        iline = self._first_line[row]
+        if iline == -1:
+            self.num_vectorized += 1
+            return [self.policy.default_decision.action(None)]
+
+        _, complete, dataset_level = self._lines[iline]
+        if complete and dataset_level:
+            self.num_vectorized += 1
+
+            line = self.policy.policy_lines[iline]
+            line.has_match = True
+            return [line.decision.action(line)]
+
+        self.num_partial += 1
+        return self._evaluate_lines(replica, row)
+
+    def decides_from_columns(self, iline):
+        """
+        @param iline  Index of the policy line
+        @return True if the decision of the line is made from the columns alone. The condition of such a
+                line is evaluated replica by replica only for rows that cannot use the columns.
+        """
+
+        _, complete, dataset_level = self._lines[iline]
+        return complete and dataset_level
+
+    def invalidate(self, dataset):
+        """
+        Mark the rows of the replicas of dataset for recomputation. Call whenever the replicas of the
+        dataset or their block replicas change.
+        """
+
+        try:
+            rows = self._dataset_rows[dataset]
+        except KeyError:
+            return
+
+        self._dirty_rows.update(rows)
+        self._changed_datasets.add(dataset)
+
+    def _evaluate_lines(self, replica, row):
+        # Same as DetoxPolicy.evaluate, skipping the lines whose vectorizable predicates fail
+        actions = []
+        block_replicas_tmp = set()
+
+        passes = self._masks[:, row].tolist()
+
+        for iline, line in enumerate(self.policy.policy_lines):
+            if len(block_replicas_tmp) == 0:
+                if not passes[iline]:
+                    continue
+
+                _, complete, dataset_level = self._lines[iline]
+                if complete and dataset_level:
+                    line.has_match = True
+                    action = line.decision.action(line)
+                else:
+                    action = line.evaluate(replica)
+            else:
+                # column values were computed with all block replicas in place
+                action = line.evaluate(replica)
+
+            if action is None:
+                continue
+
+            actions.append(action)
+            if isinstance(action, DatasetAction):
+                break
+
+            else:
+                for block_replica in action.block_replicas:
+                    replica.block_replicas.remove(block_replica)
+                    block_replicas_tmp.add(block_replica)
+
+                if attrs.Attr.cache is not None:
+                    attrs.Attr.cache.invalidate(replica.dataset)
+
+        else:
+            actions.append(self.policy.default_decision.action(None))
+
+        if len(block_replicas_tmp) != 0:
+            replica.block_replicas.update(block_replicas_tmp)
+
+            if attrs.Attr.cache is not None:
+                attrs.Attr.cache.invalidate(replica.dataset)
+
+        return actions
+
+    def _has_value_column(self, predicate):
+        variable = predicate.variable
+        ptype = type(predicate)
+
+        if variable.vtype == attrs.Attr.BOOL_TYPE:
+            return ptype is predicates.Assert or ptype is predicates.Negate
+
+        if variable.vtype != attrs.Attr.NUMERIC_TYPE and variable.vtype != attrs.Attr.TIME_TYPE:
+            return False
+
+        if ptype is predicates.Lt or ptype is predicates.Gt or ptype is predicates.Eq or ptype is predicates.Neq:
+            return self._is_number(predicate.rhs)
+        elif ptype is predicates.In or ptype is predicates.Notin:
+            return all(self._is_number(value) for value in predicate.rhs)
+        else:
+            return False
+
+    @staticmethod
+    def _is_number(value):
+        vtype = type(value)
+        # bool is an int
+        return vtype is int or vtype is long or vtype is float or vtype is bool
+
+    def _build(self, replicas):
+        self._replicas = list(replicas)
+        self._rows = dict((replica, row) for row, replica in enumerate(self._replicas))
+
+        self._dataset_rows = {}
+        for row, replica in enumerate(self._replicas):
+            try:
+                self._dataset_rows[replica.dataset].append(row)
+            except KeyError:
+                self._dataset_rows[replica.dataset] = [row]
+
+        num_rows = len(self._replicas)
+
+        self._columns = {}
+        for variable in self._variables:
+            if variable.vtype == attrs.Attr.BOOL_TYPE:
+                self._columns[variable] = np.zeros(num_rows, dtype = bool)
+            else:
+                self._columns[variable] = np.zeros(num_rows, dtype = np.float64)
+
+        self._predicate_columns = {}
+        for predicate in self._row_predicates:
+            self._predicate_columns[predicate] = np.zeros(num_rows, dtype = bool)
+
+        self._unusable = np.zeros(num_rows, dtype = bool)
+
+        for row in xrange(num_rows):
+            self._fill_row(row)
+
+        LOG.info('Built policy columns for %d variables and %d predicates over %d replicas.', len(self._variables), len(self._row_predicates), num_rows)
+
+    def _fill_row(self, row):
+        replica = self._replicas[row]
+
+        if replica.dataset.find_replica(replica.site) is not replica:
+            # replica is gone from the repository; will never be evaluated again
+            self._unusable[row] = True
+            return
+
+        unusable = False
+
+        for variable in self._variables:
+            value = variable.get(replica)
+
+            if variable.vtype == attrs.Attr.BOOL_TYPE:
+                self._columns[variable][row] = bool(value)
+            elif self._is_number(value) and (type(value) is float or abs(value) < (1 << 53)):
+                # integers are exact in float64 up to 2^53
+                self._columns[variable][row] = value
+            else:
+                # Python 2 comparisons of non-numbers do not translate to arrays
+                unusable = True
+
+        for predicate in self._row_predicates:
+            self._predicate_columns[predicate][row] = bool(predicate(replica))
+
+        self._unusable[row] = unusable
+
+    def _evaluate_predicate(self, predicate):
+        try:
+            return self._predicate_columns[predicate]
+        except KeyError:
+            pass
+
+        column = self._columns[predicate.variable]
+        ptype = type(predicate)
+
+        if ptype is predicates.Assert:
+            return column
+        elif ptype is predicates.Negate:
+            return ~column
+        elif ptype is predicates.Lt:
+            return column < predicate.rhs
+        elif ptype is predicates.Gt:
+            return column > predicate.rhs
+        elif ptype is predicates.Eq:
+            return column == predicate.rhs
+        elif ptype is predicates.Neq:
+            return column != predicate.rhs
+        elif ptype is predicates.In:
+            return np.in1d(column, predicate.rhs)
+        else:
+            return ~np.in1d(column, predicate.rhs)
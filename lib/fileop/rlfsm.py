@@ -496,8 +496,13 @@ class RLFSM(object):
 
         sids = []
 
-        for sid, lfn, site_name, created, delete in self.db.query(sql):
-            lfile = inventory.find_file(lfn)
+        rows = self.db.query(sql)
+
+        # resolve all file names at once
+        files = inventory.find_files(set(row[1] for row in rows))
+
+        for sid, lfn, site_name, created, delete in rows:
+            lfile = files.get(lfn)
             if lfile is None or lfile.id == 0:
                 continue
 
@@ -533,8 +538,10 @@ class RLFSM(object):
 
         subscriptions = []
 
-        get_all = 'SELECT u.`id`, u.`status`, u.`delete`, f.`block_id`, f.`name`, s.`name`, u.`hold_reason` FROM `file_subscriptions` AS u'
+        get_all = 'SELECT u.`id`, u.`status`, u.`delete`, f.`block_id`, f.`name`, s.`name`, u.`hold_reason`, d.`name`, b.`name` FROM `file_subscriptions` AS u'
         get_all += ' INNER JOIN `files` AS f ON f.`id` = u.`file_id`'
+        get_all += ' INNER JOIN `blocks` AS b ON b.`id` = f.`block_id`'
+        get_all += ' INNER JOIN `datasets` AS d ON d.`id` = b.`dataset_id`'
         get_all += ' INNER JOIN `sites` AS s ON s.`id` = u.`site_id`'
 
         constraints = []
@@ -564,8 +571,27 @@ class RLFSM(object):
         COPY = 0
         DELETE = 1
 
-        for row in self.db.query(get_all):
-            sub_id, st, optype, block_id, file_name, site_name, hold_reason = row
+        rows = self.db.query(get_all)
+
+        # Resolve the blocks first and load their files in bulk
+        blocks = {} # {block_id: block}
+        for row in rows:
+            block_id, dataset_name, block_name = row[3], row[7], row[8]
+            if block_id in blocks:
+                continue
+
+            try:
+                dataset = inventory.datasets[dataset_name]
+            except KeyError:
+                blocks[block_id] = None
+            else:
+                blocks[block_id] = dataset.find_block(Block.to_internal_name(block_name))
+
+        # keep the file sets alive while looping
+        block_files = inventory.prefetch_files(b for b in blocks.itervalues() if b is not None)
+
+        for row in rows:
+            sub_id, st, optype, block_id, file_name, site_name, hold_reason = row[:7]
 
             if site_name != _destination_name:
                 _destination_name = site_name
@@ -580,22 +606,20 @@ class RLFSM(object):
             if destination is None:
                 continue
 
-            if block_id != _block_id:
-                lfile = inventory.find_file(file_name)
-                if lfile is None:
-                    # Dataset, block, or file was deleted from the inventory earlier in this process (deletion not reflected in the inventory store yet)
-                    continue
+            block = blocks[block_id]
+            if block is None:
+                # Dataset or block was deleted from the inventory earlier in this process (deletion not reflected in the inventory store yet)
+                continue
+
+            lfile = block.find_file(file_name)
+            if lfile is None:
+                # Similarly, file was deleted from the inventory earlier in this process
+                continue
 
+            if block_id != _block_id:
                 _block_id = block_id
-                block = lfile.block
                 dest_replica = block.find_replica(destination)
 
-            else:
-                lfile = block.find_file(file_name)
-                if lfile is None:
-                    # Dataset, block, or file was deleted from the inventory earlier in this process (deletion not reflected in the inventory store yet)
-                    continue
-
             if dest_replica is None and st != 'cancelled':
                 LOG.debug('Destination replica for %s does not exist. Canceling the subscription.', file_name)
                 # Replica was invalidated
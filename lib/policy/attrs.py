@@ -4,10 +4,56 @@ import subprocess
 
 from dynamo.dataformat import DatasetReplica, BlockReplica, Site, SitePartition
 from dynamo.dataformat.exceptions import OperationalError
+import dynamo.policy.timeexpr as timeexpr
 
 class InvalidExpression(Exception):
     pass
 
+class AttrCache(object):
+    """
+    Cache of attribute values that are computed from the replicas of a dataset. Values are grouped
+    by dataset, and whoever changes the replicas of a dataset (or their block replicas) while the
+    cache is in use must call invalidate(dataset). Set as Attr.cache to enable.
+    """
+
+    def __init__(self):
+        # {dataset: {key: value}}
+        self._values = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, dataset, key, func, obj):
+        """
+        @param dataset  Dataset the value depends on
+        @param key      Key of the value within the dataset (e.g. the attr object)
+        @param func     Function to compute the value
+        @param obj      Argument to func
+        """
+
+        try:
+            values = self._values[dataset]
+        except KeyError:
+            values = self._values[dataset] = {}
+
+        try:
+            value = values[key]
+        except KeyError:
+            self.misses += 1
+            value = values[key] = func(obj)
+        else:
+            self.hits += 1
+
+        return value
+
+    def invalidate(self, dataset):
+        if self._values.pop(dataset, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._values.clear()
+
 class Attr(object):
     """
     Base class representing an extended attribute of an object.
@@ -17,6 +63,16 @@ class Attr(object):
 
     BOOL_TYPE, NUMERIC_TYPE, TEXT_TYPE, TIME_TYPE = range(4)
 
+    # True if get() can return a list of values (see Predicate.__call__). Multi-valued attrs
+    # implement get_elements.
+    multi_valued = False
+
+    # True if the value depends only on the replicas of a dataset and can be kept in the AttrCache
+    cacheable = False
+
+    # AttrCache in use, if any
+    cache = None
+
     def __init__(self, vtype, attr = '', args = None):
         self.vtype = vtype
         self.attr = attr
@@ -51,7 +107,15 @@ class Attr(object):
                 return expr
 
         elif self.vtype == Attr.TIME_TYPE:
-            # Use GNU date for "natural language" parsing
+            try:
+                value = timeexpr.evaluate(expr)
+            except ValueError:
+                raise InvalidExpression('Invalid time expression %s' % expr)
+
+            if value is not None:
+                return value
+
+            # Use GNU date for "natural language" expressions not understood by timeexpr
             proc = subprocess.Popen(['date', '-d', expr, '+%s'], stdout = subprocess.PIPE, stderr = subprocess.PIPE)
             out, err = proc.communicate()
             if err != '':
@@ -84,6 +148,8 @@ class DatasetAttr(Attr):
                 return dataset.attr[self.required_attrs[0]]
             except KeyError:
                 return self.dict_default
+        elif self.cacheable and Attr.cache is not None:
+            return Attr.cache.get(dataset, self, self._get, dataset)
         else:
             return self._get(dataset)
 
@@ -97,14 +163,20 @@ class DatasetReplicaAttr(Attr):
     def get(self, replica):
         if type(replica) is BlockReplica:
             dataset_replica = replica.block.dataset.find_replica(replica.site)
-            return self._get(dataset_replica)
         else:
-            return self._get(replica)
+            dataset_replica = replica
+
+        if self.cacheable and Attr.cache is not None:
+            return Attr.cache.get(dataset_replica.dataset, (self, dataset_replica), self._get, dataset_replica)
+        else:
+            return self._get(dataset_replica)
 
 
 class BlockReplicaAttr(Attr):
     """Extract an attribute from a block replica. If a dataset replica is passed, return a list of values."""
 
+    multi_valued = True
+
     def __init__(self, vtype, attr = None, args = None):
         Attr.__init__(self, vtype, attr = attr, args = args)
 
@@ -114,6 +186,17 @@ class BlockReplicaAttr(Attr):
         else:
             return map(self._get, replica.block_replicas)
 
+    def get_elements(self, replica):
+        """
+        Return the objects whose _get values make up get(replica), or None if get(replica) is a single value.
+        Lets compiled conditions evaluate the values one by one and stop at the first match.
+        """
+
+        if type(replica) is BlockReplica:
+            return None
+        else:
+            return replica.block_replicas
+
 
 class ReplicaSiteAttr(Attr):
     """Extract an attribute from the site of a replica."""
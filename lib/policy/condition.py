@@ -1,3 +1,5 @@
+import time
+
 from dynamo.policy.predicates import Predicate
 
 class Condition(object):
@@ -7,6 +9,12 @@ class Condition(object):
         self.text = text
         self.predicates = []
         self.required_attrs = set()
+        # names of the variables used in the predicates
+        self.variable_names = set()
+        # {predicate: text}
+        self.predicate_texts = {}
+        # {predicate: [number of evaluations, number of passes, total evaluation time]} (see start_profiling)
+        self.predicate_stats = None
 
         pred_strs = map(str.strip, text.split(' and '))
 
@@ -25,6 +33,7 @@ class Condition(object):
 
             # list of name of attrs
             self.required_attrs.update(variable.required_attrs)
+            self.variable_names.add(expr)
 
             if len(words) > 2:
                 operator = words[1]
@@ -33,7 +42,11 @@ class Condition(object):
 
             rhs_expr = ' '.join(words[2:])
 
-            self.predicates.append(Predicate.get(variable, operator, rhs_expr))
+            predicate = Predicate.get(variable, operator, rhs_expr)
+            self.predicates.append(predicate)
+            self.predicate_texts[predicate] = pred_str
+
+        self.compile()
 
     def __str__(self):
         return 'Condition \'%s\'' % self.text
@@ -42,12 +55,164 @@ class Condition(object):
         return 'Condition(\'%s\')' % self.text
 
     def match(self, obj):
+        """
+        Evaluate the predicates on obj. Replaced by the compiled function of the instance (see compile).
+        """
+
+        return self.interpret(obj)
+
+    def interpret(self, obj):
+        """
+        Evaluate the predicates one by one.
+        """
+
         for predicate in self.predicates:
             if not predicate(obj):
                 return False
 
         return True
 
+    def compile(self):
+        """
+        Translate the predicates into a single Python function and set it as the match method of this
+        instance. Comparison operators and right-hand side values are written out, and variables that
+        always return a single value skip the container check of Predicate.__call__.
+        Call again whenever the predicates are changed.
+        """
+
+        # namespace of the compiled function
+        constants = {}
+        source = ['def match(obj):']
+
+        for ipred, predicate in enumerate(self.predicates):
+            test = predicate.compile('lhs', constants)
+
+            if test is None:
+                name = '_pred%d' % ipred
+                constants[name] = predicate
+                source.append('    if not %s(obj): return False' % name)
+                continue
+
+            variable = predicate.variable
+
+            getter = '_get%d' % ipred
+            constants[getter] = variable.get
+
+            if variable.multi_valued:
+                # OR over the values, same as Predicate.__call__, but stopping at the first match
+                elements = '_elements%d' % ipred
+                constants[elements] = variable.get_elements
+                value = '_value%d' % ipred
+                constants[value] = variable._get
+
+                source.extend([
+                    '    elements = %s(obj)' % elements,
+                    '    if elements is None:',
+                    '        lhs = %s(obj)' % getter,
+                    '        if not (%s): return False' % test,
+                    '    else:',
+                    '        for element in elements:',
+                    '            lhs = %s(element)' % value,
+                    '            if %s: break' % test,
+                    '        else: return False'
+                ])
+            else:
+                source.extend([
+                    '    lhs = %s(obj)' % getter,
+                    '    if not (%s): return False' % test
+                ])
+
+        source.append('    return True')
+
+        exec compile('\n'.join(source), '<%s>' % str(self), 'exec') in constants
+
+        self.match = constants['match']
+
+    def start_profiling(self):
+        """
+        Replace the match method with a function that evaluates the predicates one by one and records
+        the number of evaluations, the number of passes, and the evaluation time of each predicate.
+        """
+
+        self.predicate_stats = dict((predicate, [0, 0, 0.]) for predicate in self.predicates)
+        self.match = self._profile
+
+    def stop_profiling(self):
+        """
+        Restore the compiled match method. Collected statistics are kept until the next start_profiling.
+        """
+
+        self.compile()
+
+    def reorder(self):
+        """
+        Sort the predicates by the statistics from profiling, so that cheap predicates that reject many
+        objects are evaluated first. The rank of a predicate is its mean evaluation time divided by its
+        rejection rate (the expected cost of evaluating it per rejected object); predicates that never
+        rejected or were never evaluated go last in their original order. Predicates have no side effects,
+        so the order does not change the result of match.
+        @return True if the order changed.
+        """
+
+        if self.predicate_stats is None or len(self.predicates) < 2:
+            return False
+
+        def rank(predicate):
+            num_evaluated, num_passed, total_time = self.predicate_stats[predicate]
+            if num_evaluated == 0:
+                return (float('inf'), float('inf'))
+
+            mean_time = total_time / num_evaluated
+            if num_passed == num_evaluated:
+                return (float('inf'), mean_time)
+
+            return (mean_time / (1. - float(num_passed) / num_evaluated), mean_time)
+
+        # sorted is stable
+        ordered = sorted(self.predicates, key = rank)
+        if ordered == self.predicates:
+            return False
+
+        self.predicates = ordered
+        self.compile()
+
+        return True
+
+    def describe_predicates(self):
+        """
+        @return Text of the predicates in the current order, with statistics if profiled.
+        """
+
+        descriptions = []
+        for predicate in self.predicates:
+            text = self.predicate_texts[predicate]
+            if self.predicate_stats is not None:
+                num_evaluated, num_passed, total_time = self.predicate_stats[predicate]
+                if num_evaluated != 0:
+                    text += ' (%d evaluated, %.1f%% passed, %.2f us)' % (num_evaluated, num_passed * 100. / num_evaluated, total_time / num_evaluated * 1.e+6)
+                else:
+                    text += ' (not evaluated)'
+
+            descriptions.append(text)
+
+        return ' and '.join(descriptions)
+
+    def _profile(self, obj):
+        for predicate in self.predicates:
+            stats = self.predicate_stats[predicate]
+
+            start = time.time()
+            passed = predicate(obj)
+            stats[2] += time.time() - start
+
+            stats[0] += 1
+            if not passed:
+                return False
+
+            stats[1] += 1
+
+        return True
+
     def get_variable(self, expr, variables):
         """Return an Attr object using the expr from the given variables dictionary."""
 
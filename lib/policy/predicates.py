@@ -1,10 +1,27 @@
 import re
+import math
 
 import dynamo.policy.attrs as attrs
 
 class InvalidOperator(Exception):
     pass
 
+def _constant(value, constants):
+    """
+    Return the Python source of value for compiled predicates. Values that cannot be written as
+    literals are added to the constants dict (namespace of the compiled function) under a new name.
+    """
+
+    vtype = type(value)
+    if vtype is str or vtype is bool or vtype is int or vtype is long:
+        return repr(value)
+    elif vtype is float and not math.isinf(value) and not math.isnan(value):
+        return repr(value)
+    else:
+        name = '_c%d' % len(constants)
+        constants[name] = value
+        return name
+
 ##################
 ## Base classes ##
 ##################
@@ -61,6 +78,15 @@ class Predicate(object):
 
         return self._eval(lhs)
 
+    def compile(self, lhs, constants):
+        """
+        Return the source of a Python expression equivalent to _eval on the value named lhs. Used by
+        Condition.compile. Constants that cannot be written out are added to the constants dict.
+        Return None if the predicate cannot be compiled; it is then called as is.
+        """
+
+        return None
+
 class UnaryExpr(Predicate):
     operators = ['', 'not']
 
@@ -125,6 +151,25 @@ class SetElementExpr(Predicate):
 
         self.rhs = map(self.variable.rhs_map, elem_exprs)
 
+    def _compile_contains(self, lhs, constants):
+        # The order of the elements does not matter for the result of In and Notin
+        if self.variable.vtype == attrs.Attr.NUMERIC_TYPE:
+            return '%s in %s' % (lhs, _constant(frozenset(self.rhs), constants))
+
+        values = frozenset(elem for elem in self.rhs if type(elem) is not re._pattern_type)
+        patterns = [elem for elem in self.rhs if type(elem) is re._pattern_type]
+
+        terms = []
+        if len(values) != 0:
+            terms.append('%s in %s' % (lhs, _constant(values, constants)))
+        for pattern in patterns:
+            terms.append('%s(%s) is not None' % (_constant(pattern.match, constants), lhs))
+
+        if len(terms) == 0:
+            return 'False'
+
+        return ' or '.join(terms)
+
 
 #################################
 ## Unary (boolean) expressions ##
@@ -134,10 +179,16 @@ class Assert(UnaryExpr):
     def _eval(self, boolexpr):
         return boolexpr
 
+    def compile(self, lhs, constants):
+        return lhs
+
 class Negate(UnaryExpr):
     def _eval(self, boolexpr):
         return not boolexpr
 
+    def compile(self, lhs, constants):
+        return 'not %s' % lhs
+
 #####################################
 ## Binary (comparison) expressions ##
 #####################################
@@ -154,6 +205,12 @@ class Eq(BinaryExpr):
     def _eval(self, lhs):
         return self._call(lhs)
 
+    def compile(self, lhs, constants):
+        if type(self.rhs) is re._pattern_type:
+            return '%s(%s) is not None' % (_constant(self.rhs.match, constants), lhs)
+        else:
+            return '%s == %s' % (lhs, _constant(self.rhs, constants))
+
 class Neq(BinaryExpr):
     def __init__(self, variable, rhs_expr, is_re = False):
         BinaryExpr.__init__(self, variable, rhs_expr, is_re = is_re)
@@ -166,14 +223,26 @@ class Neq(BinaryExpr):
     def _eval(self, lhs):
         return self._call(lhs)
 
+    def compile(self, lhs, constants):
+        if type(self.rhs) is re._pattern_type:
+            return '%s(%s) is None' % (_constant(self.rhs.match, constants), lhs)
+        else:
+            return '%s != %s' % (lhs, _constant(self.rhs, constants))
+
 class Lt(BinaryExpr):
     def _eval(self, lhs):
         return lhs < self.rhs
 
+    def compile(self, lhs, constants):
+        return '%s < %s' % (lhs, _constant(self.rhs, constants))
+
 class Gt(BinaryExpr):
     def _eval(self, lhs):
         return lhs > self.rhs
 
+    def compile(self, lhs, constants):
+        return '%s > %s' % (lhs, _constant(self.rhs, constants))
+
 #########################################
 ## Set-element (inclusion) expressions ##
 #########################################
@@ -193,6 +262,9 @@ class In(SetElementExpr):
 
             return False
 
+    def compile(self, lhs, constants):
+        return self._compile_contains(lhs, constants)
+
 class Notin(SetElementExpr):
     def _eval(self, lhs):
         if self.variable.vtype == attrs.Attr.NUMERIC_TYPE:
@@ -208,3 +280,5 @@ class Notin(SetElementExpr):
 
             return True
 
+    def compile(self, lhs, constants):
+        return 'not (%s)' % self._compile_contains(lhs, constants)
@@ -35,6 +35,9 @@ class FilePopularity(object):
         for namespace, replacement in self.namespaces:
 
             usage_summary = self.pop_engine.get_namespace_usage_summary(namespace)
+
+            # resolve all file names at once
+            file_objects = inventory.find_files(replacement + name for name, _, _ in usage_summary)
     
             for (name,n_access,last_access) in usage_summary:
                 
@@ -42,7 +45,7 @@ class FilePopularity(object):
                 utc_access = calendar.timegm(last_access.utctimetuple())
     
                 lfn = replacement + name
-                file_object = inventory.find_file(lfn)
+                file_object = file_objects.get(lfn)
                 if file_object is None:
                     continue
 
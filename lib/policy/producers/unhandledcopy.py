@@ -3,7 +3,7 @@ import collections
 import logging
 
 from dynamo.registry.registry import RegistryDatabase
-from dynamo.dataformat import Configuration, Block, ObjectError, ConfigurationError
+from dynamo.dataformat import Configuration, ConfigurationError
 
 LOG = logging.getLogger(__name__)
 
@@ -30,18 +30,12 @@ class UnhandledCopyExists(object):
 
         for item_name in items:
             try:
-                dataset_name, block_name = Block.from_full_name(item_name)
-            except ObjectError:
-                dataset_name, block_name = item_name, None
-
-            try:
-                dataset = inventory.datasets[dataset_name]
+                dataset = inventory.datasets[item_name]
             except KeyError:
-                continue
-
-            if block_name is not None:
-                block = dataset.find_block(block_name)
+                block = inventory.find_block(item_name)
                 if block is None:
                     continue
 
+                dataset = block.dataset
+
             dataset.attr['unhandled_copy_exists'] = True
@@ -0,0 +1,285 @@
+import re
+import time
+import calendar
+import collections
+
+# Parsed expressions {expr: parsed tuple, or None if not supported}, least recently used first
+_parsed = collections.OrderedDict()
+# Bound on the number of cached expressions
+_MAX_PARSED = 256
+
+_MONTHS = {
+    'jan': 1, 'january': 1, 'feb': 2, 'february': 2, 'mar': 3, 'march': 3, 'apr': 4, 'april': 4,
+    'may': 5, 'jun': 6, 'june': 6, 'jul': 7, 'july': 7, 'aug': 8, 'august': 8,
+    'sep': 9, 'sept': 9, 'september': 9, 'oct': 10, 'october': 10, 'nov': 11, 'november': 11,
+    'dec': 12, 'december': 12
+}
+
+# Same numbering as time.struct_time.tm_wday
+_WEEKDAYS = {
+    'mon': 0, 'monday': 0, 'tue': 1, 'tues': 1, 'tuesday': 1, 'wed': 2, 'wednesday': 2,
+    'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3, 'fri': 4, 'friday': 4,
+    'sat': 5, 'saturday': 5, 'sun': 6, 'sunday': 6
+}
+
+# unit: (index in the relative list [years, months, days, seconds], multiplier)
+_UNITS = {
+    'year': (0, 1), 'month': (1, 1), 'fortnight': (2, 14), 'week': (2, 7), 'day': (2, 1),
+    'hour': (3, 3600), 'minute': (3, 60), 'min': (3, 60), 'second': (3, 1), 'sec': (3, 1)
+}
+
+_ORDINALS = {'last': -1, 'this': 0, 'next': 1}
+
+_SHIFTS = {'now': 0, 'today': 0, 'yesterday': -1, 'tomorrow': 1}
+
+_NUMBER = re.compile('[+-]?[0-9]+$')
+_ISO_DATE = re.compile('([0-9]{4})-([0-9]{1,2})-([0-9]{1,2})(?:t([0-9]{1,2}):([0-9]{2})(?::([0-9]{2}))?)?$')
+_US_DATE = re.compile('([0-9]{1,2})/([0-9]{1,2})/([0-9]{4})$')
+_CLOCK = re.compile('([0-9]{1,2}):([0-9]{2})(?::([0-9]{2}))?$')
+_DAY = re.compile('[0-9]{1,2}$')
+_YEAR = re.compile('[0-9]{4}$')
+
+def evaluate(expr, now = None):
+    """
+    Convert a date expression to a UNIX timestamp, with the same result as `date -d expr +%s` of GNU
+    coreutils. Only a subset of the GNU syntax is understood: "@N", absolute dates (2015-01-31,
+    2015-01-31T12:00:00, 01/31/2015, Jan 31 2015, 31 Jan 2015) with an optional time of day, time of
+    day alone, weekdays with an optional last/this/next, relative items ("N days ago", "-2 weeks",
+    "last month", "1 day 3 hours ago" with "ago" applying to the item before it), and now, today,
+    yesterday, tomorrow. Recently parsed expressions are cached.
+    @param expr  Date expression
+    @param now   Reference UNIX time for relative expressions (default current time)
+    @return Timestamp as float, or None if the expression is not in the supported subset.
+    """
+
+    try:
+        parsed = _parsed.pop(expr)
+    except KeyError:
+        # raises ValueError for invalid dates
+        parsed = _parse(expr)
+
+        while len(_parsed) >= _MAX_PARSED:
+            _parsed.popitem(last = False)
+
+    _parsed[expr] = parsed
+
+    if parsed is None:
+        return None
+
+    if now is None:
+        now = time.time()
+
+    return _evaluate(parsed, int(now))
+
+def _parse(expr):
+    """
+    @return (epoch, date, clock, weekday, relative) or None
+    """
+
+    tokens = expr.lower().replace(',', ' ').split()
+    if len(tokens) == 0:
+        return None
+
+    if tokens[0].startswith('@'):
+        if len(tokens) != 1 or not _NUMBER.match(tokens[0][1:]):
+            return None
+
+        return (int(tokens[0][1:]), None, None, None, None)
+
+    date = None
+    clock = None
+    weekday = None
+    # [years, months, days, seconds]
+    relative = [0, 0, 0, 0]
+
+    def unit_of(word):
+        if word in _UNITS:
+            return _UNITS[word]
+        elif word.endswith('s') and word[:-1] in _UNITS:
+            return _UNITS[word[:-1]]
+        else:
+            return None
+
+    itok = 0
+    while itok < len(tokens):
+        token = tokens[itok]
+        itok += 1
+        # next token, if any
+        following = tokens[itok] if itok < len(tokens) else None
+
+        matches = _ISO_DATE.match(token)
+        if matches:
+            if date is not None:
+                return None
+
+            date = tuple(int(v) for v in matches.group(1, 2, 3))
+            if matches.group(4) is not None:
+                if clock is not None:
+                    return None
+                clock = (int(matches.group(4)), int(matches.group(5)), int(matches.group(6) or 0))
+
+            continue
+
+        matches = _US_DATE.match(token)
+        if matches:
+            if date is not None:
+                return None
+
+            date = (int(matches.group(3)), int(matches.group(1)), int(matches.group(2)))
+            continue
+
+        matches = _CLOCK.match(token)
+        if matches:
+            if clock is not None:
+                return None
+
+            clock = (int(matches.group(1)), int(matches.group(2)), int(matches.group(3) or 0))
+            continue
+
+        if token in _MONTHS:
+            # Jan 31 [2015]
+            if date is not None or following is None or not _DAY.match(following):
+                return None
+
+            month = _MONTHS[token]
+            day = int(following)
+            itok += 1
+            if itok < len(tokens) and _YEAR.match(tokens[itok]):
+                year = int(tokens[itok])
+                itok += 1
+            else:
+                year = None
+
+            date = (year, month, day)
+            continue
+
+        if _DAY.match(token) and following in _MONTHS:
+            # 31 Jan [2015]
+            if date is not None:
+                return None
+
+            day = int(token)
+            month = _MONTHS[following]
+            itok += 1
+            if itok < len(tokens) and _YEAR.match(tokens[itok]):
+                year = int(tokens[itok])
+                itok += 1
+            else:
+                year = None
+
+            date = (year, month, day)
+            continue
+
+        if token in _WEEKDAYS:
+            if weekday is not None:
+                return None
+
+            weekday = (0, _WEEKDAYS[token])
+            continue
+
+        if token in _SHIFTS:
+            relative[2] += _SHIFTS[token]
+            continue
+
+        # relative items: [count] unit [ago]
+        if _NUMBER.match(token):
+            count = int(token)
+            unit = unit_of(following) if following is not None else None
+            if unit is None:
+                return None
+            itok += 1
+
+        elif token in _ORDINALS:
+            if following in _WEEKDAYS:
+                if weekday is not None:
+                    return None
+
+                weekday = (_ORDINALS[token], _WEEKDAYS[following])
+                itok += 1
+                continue
+
+            count = _ORDINALS[token]
+            unit = unit_of(following) if following is not None else None
+            if unit is None:
+                return None
+            itok += 1
+
+        else:
+            count = 1
+            unit = unit_of(token)
+            if unit is None:
+                return None
+
+        if itok < len(tokens) and tokens[itok] == 'ago':
+            count = -count
+            itok += 1
+
+        index, multiplier = unit
+        relative[index] += count * multiplier
+
+    if date is not None:
+        year, month, day = date
+        if year is not None and year < 1900:
+            return None
+        if month < 1 or month > 12 or day < 1 or day > calendar.monthrange(year or 2000, month)[1]:
+            # Feb 29 without a year is checked against the current year in _evaluate
+            raise ValueError('Invalid date in %s' % expr)
+
+        if weekday is not None:
+            # weekday together with a full date is left to GNU date
+            return None
+
+    if clock is not None:
+        hour, minute, second = clock
+        if hour > 23 or minute > 59 or second > 59:
+            raise ValueError('Invalid time in %s' % expr)
+
+    return (None, date, clock, weekday, tuple(relative))
+
+def _evaluate(parsed, now):
+    epoch, date, clock, weekday, relative = parsed
+
+    if epoch is not None:
+        return float(epoch)
+
+    tm = time.localtime(now)
+
+    if date is None:
+        year, month, day = tm.tm_year, tm.tm_mon, tm.tm_mday
+    else:
+        year, month, day = date
+        if year is None:
+            year = tm.tm_year
+            if day > calendar.monthrange(year, month)[1]:
+                raise ValueError('Invalid date %d-%02d-%02d' % (year, month, day))
+
+    if clock is not None:
+        hour, minute, second = clock
+    elif date is not None or weekday is not None:
+        hour, minute, second = 0, 0, 0
+    else:
+        hour, minute, second = tm.tm_hour, tm.tm_min, tm.tm_sec
+
+    timestamp = time.mktime((year, month, day, hour, minute, second, 0, 0, -1))
+
+    if date is not None or clock is not None:
+        if tuple(time.localtime(timestamp)[:6]) != (year, month, day, hour, minute, second):
+            # local time skipped by a DST change
+            raise ValueError('Invalid local time %d-%02d-%02d %02d:%02d:%02d' % (year, month, day, hour, minute, second))
+
+    # Same sequence of steps as GNU parse_datetime: weekday, then years, months, and days on the
+    # broken-down local time keeping the DST flag, then hours, minutes, and seconds as a time difference.
+
+    if weekday is not None:
+        ordinal, wday = weekday
+        tm = time.localtime(timestamp)
+        shift = (wday - tm.tm_wday + 7) % 7 + 7 * (ordinal - (1 if ordinal > 0 and tm.tm_wday != wday else 0))
+        timestamp = time.mktime((tm.tm_year, tm.tm_mon, tm.tm_mday + shift, tm.tm_hour, tm.tm_min, tm.tm_sec, 0, 0, -1))
+
+    years, months, days, seconds = relative
+
+    if years != 0 or months != 0 or days != 0:
+        tm = time.localtime(timestamp)
+        timestamp = time.mktime((tm.tm_year + years, tm.tm_mon + months, tm.tm_mday + days, tm.tm_hour, tm.tm_min, tm.tm_sec, 0, 0, tm.tm_isdst))
+
+    return timestamp + seconds
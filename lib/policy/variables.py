@@ -9,6 +9,8 @@ from dynamo.dataformat import Dataset, Site
 from dynamo.policy.attrs import Attr, DatasetAttr, DatasetReplicaAttr, BlockReplicaAttr, ReplicaSiteAttr, SiteAttr, InvalidExpression
 
 class DatasetHasIncompleteReplica(DatasetAttr):
+    cacheable = True
+
     def __init__(self):
         DatasetAttr.__init__(self, Attr.BOOL_TYPE)
 
@@ -42,6 +44,8 @@ class DatasetStatus(DatasetAttr):
         return getattr(Dataset, 'STAT_' + expr)
 
 class DatasetOnTape(DatasetAttr):
+    cacheable = True
+
     def __init__(self):
         DatasetAttr.__init__(self, Attr.NUMERIC_TYPE)
 
@@ -77,6 +81,8 @@ class DatasetRelease(DatasetAttr):
             return '%d_%d_%d_%s' % version
 
 class DatasetNumFullDiskCopy(DatasetAttr):
+    cacheable = True
+
     def __init__(self):
         DatasetAttr.__init__(self, Attr.NUMERIC_TYPE)
 
@@ -89,6 +95,8 @@ class DatasetNumFullDiskCopy(DatasetAttr):
         return num
 
 class DatasetNumFullCopy(DatasetAttr):
+    cacheable = True
+
     def __init__(self):
         DatasetAttr.__init__(self, Attr.NUMERIC_TYPE)
 
@@ -118,6 +126,8 @@ class ReplicaIncomplete(DatasetReplicaAttr):
         return False
 
 class ReplicaNumFullDiskCopyCommonOwner(DatasetReplicaAttr):
+    cacheable = True
+
     def __init__(self):
         DatasetReplicaAttr.__init__(self, Attr.NUMERIC_TYPE)
 
@@ -134,6 +144,8 @@ class ReplicaNumFullDiskCopyCommonOwner(DatasetReplicaAttr):
         return num
 
 class ReplicaNumFullOtherCopyCommonOwner(DatasetReplicaAttr):
+    cacheable = True
+
     def __init__(self):
         DatasetReplicaAttr.__init__(self, Attr.NUMERIC_TYPE)
 
@@ -4,6 +4,8 @@ import logging
 import time
 import re
 import multiprocessing
+import threading
+import contextlib
 from ConfigParser import ConfigParser
 
 import MySQLdb
@@ -29,6 +31,40 @@ from dynamo.dataformat import Configuration
 
 LOG = logging.getLogger(__name__)
 
+class _ConnectionLock(object):
+    """
+    Recursive lock that keeps track of its owner and how many times the owner acquired it, so that
+    a crashed thread can release the lock down to a given level.
+    """
+
+    def __init__(self):
+        self._lock = multiprocessing.RLock()
+        # owner and count are only modified by the thread holding the lock
+        self.owner = None
+        self.count = 0
+
+    def acquire(self, blocking = True):
+        if not self._lock.acquire(blocking):
+            return False
+
+        self.owner = threading.current_thread().ident
+        self.count += 1
+        return True
+
+    def release(self):
+        if self.owner != threading.current_thread().ident:
+            raise RuntimeError('Cannot release a lock not owned by the current thread')
+
+        self.count -= 1
+        if self.count == 0:
+            self.owner = None
+
+        self._lock.release()
+
+    def is_mine(self):
+        return self.owner == threading.current_thread().ident
+
+
 class MySQL(object):
     """Generic thread-safe MySQL interface (for an interface)."""
 
@@ -111,12 +147,17 @@ class MySQL(object):
         self._connection = None
 
         # Avoid interference in case the module is used from multiple threads
-        self._connection_lock = multiprocessing.RLock()
+        self._connection_lock = _ConnectionLock()
 
         # MySQL tables can be locked by multiple statements but are unlocked with one.
         # In nested functions with each one locking different tables, we need to call UNLOCK TABLES
         # only after the outermost function asks for it.
         self._locked_tables = []
+
+        # Depth of nested transaction() contexts and the thread running the transaction. Statements of the owner
+        # thread are not committed individually when the depth is nonzero.
+        self._transaction_depth = 0
+        self._transaction_owner = None
         
         # Use with care! If False, table locks and temporary tables cannot be used
         self.reuse_connection = config.get('reuse_connection', MySQL._default_config.get('reuse_connection', True))
@@ -227,13 +268,15 @@ class MySQL(object):
                 for _ in range(num_attempts):
                     try:
                         cursor.execute(sql, args)
-                        self._connection.commit()
+                        if not self._in_transaction():
+                            self._connection.commit()
                         break
                     except MySQLdb.OperationalError as err:
-                        if not (self.reuse_connection and err.args[0] == 2006):
+                        if not (self.reuse_connection and err.args[0] == 2006) or self._in_transaction():
                             raise
                             #2006 = MySQL server has gone away
                             #If we are reusing connections, this type of error is to be ignored
+                            #(but not within a transaction, which is lost with the connection)
 
                         if not silent:
                             LOG.error(str(sys.exc_info()[1]))
@@ -402,6 +445,65 @@ class MySQL(object):
             self._fully_unlock()
             raise
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context in which statements are not committed one by one. Everything executed through this object
+        in the context (query, insert_many, execute_many, etc.) is committed once at the end, or rolled back
+        if an exception is raised. The connection lock is held throughout the context, including when a
+        statement fails, so other threads wait until the commit or rollback is done. Nested contexts in the
+        same thread join the outermost transaction.
+        Note that only changes to transactional tables (InnoDB) can be rolled back.
+        """
+
+        if not self.reuse_connection:
+            raise RuntimeError('MySQL transactions cannot be used when reuse_connection = False.')
+
+        self._connection_lock.acquire()
+
+        if self._in_transaction():
+            # commit or rollback is done by the outermost context
+            self._transaction_depth += 1
+            try:
+                yield
+            finally:
+                self._transaction_depth -= 1
+                self._connection_lock.release()
+
+            return
+
+        self._transaction_depth = 1
+        self._transaction_owner = threading.current_thread().ident
+
+        try:
+            yield
+
+            if self._connection is not None:
+                self._connection.commit()
+
+        except:
+            exc_info = sys.exc_info()
+
+            if self._connection is not None:
+                try:
+                    self._connection.rollback()
+                except:
+                    LOG.error('Failed to roll back the transaction: %s', str(sys.exc_info()[1]))
+
+            self._end_transaction()
+            self._fully_unlock()
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        self._end_transaction()
+        self._connection_lock.release()
+
+    def _in_transaction(self):
+        return self._transaction_depth != 0 and self._transaction_owner == threading.current_thread().ident
+
+    def _end_transaction(self):
+        self._transaction_depth = 0
+        self._transaction_owner = None
+
     def execute_many(self, sqlbase, key, pool, additional_conditions = [], order_by = '', on_duplicate_key_update = ''):
         result = []
         result_sum = None
@@ -890,9 +992,12 @@ class MySQL(object):
         LOG.debug('make_map %s (%d) obejcts', table, num_obj)
 
     def _fully_unlock(self):
-        # Call when the thread crashed. Fully releases the lock
-        while True:
-            try:
-                self._connection_lock.release()
-            except (RuntimeError, AssertionError):
-                break
+        # Call when the thread crashed. Fully releases the lock, except for the holds of an ongoing transaction
+        # of this thread (one per nested context), which are released by transaction() after the rollback.
+        if self._in_transaction():
+            keep = self._transaction_depth
+        else:
+            keep = 0
+
+        while self._connection_lock.is_mine() and self._connection_lock.count > keep:
+            self._connection_lock.release()
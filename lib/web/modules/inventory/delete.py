@@ -298,17 +298,17 @@ class DeleteData(DeleteDataBase):
         self.queue = []
 
     def _delete(self, inventory, obj):
-        self.queue.append(('delete', repr(obj)))
+        self.queue.append(('delete', df.ObjectCodec.encode(obj)))
 
     def _update(self, inventory, obj):
         embedded_clone, updated = obj.embed_into(inventory, check = True)
         if updated:
-            self.queue.append(('update', repr(embedded_clone)))
+            self.queue.append(('update', df.ObjectCodec.encode(embedded_clone)))
 
         return embedded_clone
 
     def _register_update(self, inventory, obj):
-        self.queue.append(('update', repr(obj)))
+        self.queue.append(('update', df.ObjectCodec.encode(obj)))
 
     def _finalize(self):
         fields = ('cmd', 'obj')
@@ -261,6 +261,24 @@ class InjectDataBase(WebModule):
     def _make_blocks(self, objects, dataset, inventory, counts):
         num_blocks = 0
 
+        # load the files of all existing blocks that get new files in one go (block_files keeps them in memory)
+        existing_blocks = []
+        for obj in objects:
+            try:
+                block = dataset.find_block(df.Block.to_internal_name(obj['name']))
+            except:
+                # errors are reported in the main loop
+                continue
+
+            if block is not None and 'files' in obj:
+                existing_blocks.append(block)
+
+        try:
+            block_files = inventory.prefetch_files(existing_blocks)
+        except df.IntegrityError:
+            # see _make_files
+            raise TryAgain('Inventory update is ongoing. Please retry after a minute.')
+
         for obj in objects:
             try:
                 name = obj['name']
@@ -437,7 +455,7 @@ class InjectDataBase(WebModule):
                                 else:
                                     old_files_list.append(f.id)
             
-                            old_files_list = tuple(old_files_list)
+                            old_files_list = df.BlockReplica.make_file_ids(old_files_list)
 
                         replica.file_ids = old_files_list
                         self._register_update(inventory, replica)
@@ -544,7 +562,7 @@ class InjectDataBase(WebModule):
                     if len(file_ids) == block.num_files and block_replica.size == block.size:
                         block_replica.file_ids = None
                     else:
-                        block_replica.file_ids = tuple(file_ids)
+                        block_replica.file_ids = df.BlockReplica.make_file_ids(file_ids)
 
                     self._register_update(inventory, block_replica)
 
@@ -579,7 +597,7 @@ class InjectData(InjectDataBase):
 
     def _finalize(self):
         fields = ('cmd', 'obj')
-        mapping = lambda obj: ('update', repr(obj))
+        mapping = lambda obj: ('update', df.ObjectCodec.encode(obj))
 
         # make injection entries consecutive
         self.registry.db.lock_tables(write = ['data_injections'])
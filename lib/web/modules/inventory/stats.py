@@ -7,7 +7,7 @@ from dynamo.web.modules._base import WebModule
 from dynamo.web.modules._html import HTMLMixin
 from dynamo.web.modules._common import yesno
 import dynamo.web.exceptions as exceptions
-from dynamo.dataformat import Dataset, Site, Group
+from dynamo.dataformat import Dataset, Block, Site, Group
 
 from _customize import customize_stats
 
@@ -373,9 +373,18 @@ class InventoryStats(WebModule, HTMLMixin):
 
         return self.form_html(repl)
 
+class FilesCacheStats(WebModule):
+    """
+    Hit, miss, and eviction counters and the memory usage of the block file cache of the web server.
+    """
+
+    def run(self, caller, request, inventory):
+        return [Block.files_cache_stats()]
+
 
 export_data = {
     'stats/size': TotalSizeListing,
+    'stats/filescache': FilesCacheStats,
     'stats/replication': ReplicationFactorListing,
     'stats/usage': SiteUsageListing
 }
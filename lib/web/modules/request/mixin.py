@@ -74,13 +74,11 @@ class ParseInputMixin(object):
                     continue
     
                 try:
-                    dataset_name, block_name = df.Block.from_full_name(item)
+                    df.Block.from_full_name(item)
                 except df.ObjectError:
                     raise InvalidRequest('Invalid item name %s' % item)
     
-                try:
-                    inventory.datasets[dataset_name].find_block(block_name, must_find = True)
-                except:
+                if inventory.find_block(item) is None:
                     raise InvalidRequest('Invalid block name %s' % item)
 
         if 'site' in self.params:
@@ -1,11 +1,14 @@
 import os
 import sys
 import time
+import signal
 import traceback
 import json
 import logging
 import logging.handlers
 import socket
+import marshal
+import Queue
 import collections
 import warnings
 import multiprocessing
@@ -20,13 +23,16 @@ from dynamo.web.modules import modules, load_modules
 from dynamo.web.modules._html import HTMLMixin
 
 from dynamo.utils.transform import unicode2str
-from dynamo.utils.log import reset_logger
+from dynamo.utils.log import reset_logger, log_exception
 
 LOG = logging.getLogger(__name__)
 
 class WebServer(object):
     User = collections.namedtuple('User', ['name', 'dn', 'id', 'authlist'])
 
+    # State of the inventory update channel of the server process
+    UPD_WAITING, UPD_READY, UPD_FAILED = range(3)
+
     @staticmethod
     def format_dn(dn_string):
         """Read the DN string in the environ and return (user name, user id)."""
@@ -75,6 +81,11 @@ class WebServer(object):
 
         self.active_count = multiprocessing.Value('I', 0, lock = True)
 
+        # Inventory updates sent to the server process (see update_inventory)
+        self._reset_update_channel()
+        # Seconds the server process waits for an announced update to arrive
+        self.update_timeout = config.get('update_timeout', 10)
+
         HTMLMixin.contents_path = config.contents_path
         # common mixin class used by all page-generating modules
         with open(HTMLMixin.contents_path + '/html/header_common.html') as source:
@@ -94,6 +105,8 @@ class WebServer(object):
         if self.server_proc and self.server_proc.is_alive():
             raise RuntimeError('Web server is already running')
 
+        self._reset_update_channel()
+
         self.server_proc = multiprocessing.Process(target = self._serve)
         self.server_proc.daemon = True
         self.server_proc.start()
@@ -133,6 +146,9 @@ class WebServer(object):
         old_active_count = self.active_count
         self.active_count = multiprocessing.Value('I', 0, lock = True)
 
+        # The new server starts from the current inventory image
+        self._reset_update_channel()
+
         # A new WSGI server will overtake the socket. New requests will be handled by new_server_proc
         LOG.debug('Starting new web server.')
         new_server_proc = multiprocessing.Process(target = self._serve)
@@ -154,7 +170,121 @@ class WebServer(object):
 
         LOG.info('Started web server (PID %d).', self.server_proc.pid)
 
+    def update_inventory(self, update_commands):
+        """
+        Send inventory update commands to the server process, which applies them to its copy of the inventory
+        and replaces its idle children. Falls back to a restart if the server process failed to apply updates.
+        @param update_commands  List of (cmd, encoded object)
+        """
+
+        if self.server_proc is None:
+            return
+
+        if self.inventory_outdated():
+            self.restart()
+            return
+
+        try:
+            # Serialize here rather than in the feeder thread of the queue, where errors go unnoticed
+            data = marshal.dumps(update_commands)
+        except ValueError:
+            LOG.error('Inventory updates cannot be sent to the web server.')
+            self.restart()
+            return
+
+        self.update_queue.put((time.time(), data))
+
+        with self.num_updates_sent.get_lock():
+            self.num_updates_sent.value += 1
+
+        # If the server process is not ready yet, it will pick up the updates when it is
+        if self.update_state.value == WebServer.UPD_READY:
+            try:
+                os.kill(self.server_proc.pid, signal.SIGUSR2)
+            except OSError:
+                pass
+
+    def inventory_outdated(self):
+        """
+        @return True if the server process is gone or failed to apply inventory updates.
+        """
+
+        if self.server_proc is None:
+            return False
+
+        return not self.server_proc.is_alive() or self.update_state.value == WebServer.UPD_FAILED
+
+    def _reset_update_channel(self):
+        # Set before forking a server process. The queue is only written to from this process;
+        # don't block on exit if the server process is gone.
+        self.update_queue = multiprocessing.Queue()
+        self.update_queue.cancel_join_thread()
+        self.num_updates_sent = multiprocessing.Value('L', 0, lock = True)
+        self.update_state = multiprocessing.Value('b', WebServer.UPD_WAITING, lock = True)
+
+        # Used in the server process
+        self._num_updates_applied = 0
+        self._applying_updates = False
+        self._server_pid = 0
+
+    def _apply_inventory_updates(self, signum = None, frame = None):
+        """
+        SIGUSR2 handler of the server process. Runs in the main loop of the WSGI server between forks,
+        so the inventory image is never copied halfway through an update.
+        """
+
+        if os.getpid() != self._server_pid or self._applying_updates or self.update_state.value != WebServer.UPD_READY:
+            # a freshly forked child, a nested call, or a failed process
+            return
+
+        self._applying_updates = True
+
+        try:
+            while self._num_updates_applied < self.num_updates_sent.value:
+                try:
+                    sent_time, data = self.update_queue.get(timeout = self.update_timeout)
+                except Queue.Empty:
+                    LOG.error('Announced inventory updates did not arrive. Web server needs a restart.')
+                    self.update_state.value = WebServer.UPD_FAILED
+                    return
+
+                self._num_updates_applied += 1
+                update_commands = marshal.loads(data)
+
+                start = time.time()
+                try:
+                    self.dynamo_server.inventory.patch(update_commands)
+                except:
+                    LOG.error('Failed to apply inventory updates. Web server needs a restart.')
+                    log_exception(LOG)
+                    self.update_state.value = WebServer.UPD_FAILED
+                    return
+
+                # Idle children hold the old image. Ask them to exit; the WSGI server will fork new ones.
+                self._retire_idle_children()
+
+                LOG.info('Applied %d inventory updates in %.3f seconds (%.3f seconds after sending).', len(update_commands), time.time() - start, time.time() - sent_time)
+
+        finally:
+            self._applying_updates = False
+
+    def _retire_idle_children(self):
+        # Same as what the flup prefork server does to purge children: any activity on the parent socket makes a child exit.
+        # Busy children exit after serving their request anyway (maxRequests = 1).
+        for child in self.wsgi_server._children.values():
+            if not child['avail'] or child['file'] is None:
+                continue
+
+            try:
+                child['file'].send('bye')
+            except socket.error:
+                pass
+
     def _serve(self):
+        # Install the update handler first - an unhandled SIGUSR2 would terminate the process
+        self._server_pid = os.getpid()
+        signal.signal(signal.SIGUSR2, self._apply_inventory_updates)
+
         if self.log_path:
             reset_logger()
 
@@ -193,6 +323,10 @@ class WebServer(object):
         except KeyboardInterrupt:
             os._exit(0)
 
+        # Signal from now on and catch up with the updates sent so far
+        self.update_state.value = WebServer.UPD_READY
+        self._apply_inventory_updates()
+
         try:
             self.wsgi_server.run()
         except SystemExit as exc:
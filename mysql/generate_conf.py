@@ -26,6 +26,8 @@ def generate_local_board_conf(conf_str):
     board_conf = OD([('module', 'mysqlboard:MySQLUpdateBoard'), ('config', OD())])
     
     board_conf['config']['db_params'] = OD([('host', host), ('user', user), ('passwd', passwd), ('db', 'dynamoserver'), ('scratch_db', 'dynamo_tmp')])
+    # zlib-compress large update payloads written to this board
+    board_conf['config']['compress'] = conf.get('compress', False)
 
     return board_conf
 
@@ -62,6 +64,10 @@ def generate_store_conf(conf_str):
         ('passwd', passwd),
         ('scratch_db', 'dynamo_tmp')
     ])
+    # number of parallel connections used when loading the inventory
+    store_conf['config']['load_workers'] = conf.get('load_workers', 1)
+    # number of tables copied in parallel when cloning a remote store
+    store_conf['config']['clone_workers'] = conf.get('clone_workers', 4)
 
     store_conf['readonly_config']['db_params'] = OD([
         ('host', host),
@@ -44,6 +44,34 @@ fi
 
 MYSQL="mysql $MYSQLOPT"
 
+# Upgrade existing tables
+echo '#####################################'
+echo '######  MYSQL SCHEMA UPGRADES  ######'
+echo '#####################################'
+echo
+
+grep -v '^#' $THISDIR/upgrades.txt | while read DB TABLE COLUMN TYPE SPEC
+do
+  [ "$DB" ] || continue
+
+  # Skip if the table does not exist (will be created below)
+  EXISTS=$(echo "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = '$DB' AND TABLE_NAME = '$TABLE';" | $MYSQL -N)
+  [ "$EXISTS" = "1" ] || continue
+
+  CURRENT=$(echo "SELECT DATA_TYPE FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = '$DB' AND TABLE_NAME = '$TABLE' AND COLUMN_NAME = '$COLUMN';" | $MYSQL -N)
+  [ "$CURRENT" = "$TYPE" ] && continue
+
+  echo 'ALTER TABLE `'$DB'`.`'$TABLE'` '$SPEC';'
+  echo 'ALTER TABLE `'$DB'`.`'$TABLE'` '"$SPEC"';' | $MYSQL
+  if [ $? -ne 0 ]
+  then
+    echo "Schema upgrade failed."
+    exit 1
+  fi
+done || exit 1
+
+echo
+
 # Set up databases
 echo '##########################################'
 echo '######  MYSQL DATABASES AND TABLES  ######'
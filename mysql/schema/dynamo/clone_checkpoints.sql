@@ -0,0 +1,8 @@
+CREATE TABLE `clone_checkpoints` (
+  `table_name` varchar(64) CHARACTER SET latin1 COLLATE latin1_general_cs NOT NULL,
+  `source` varchar(256) CHARACTER SET latin1 COLLATE latin1_general_cs NOT NULL,
+  `last_key` varchar(1024) CHARACTER SET latin1 COLLATE latin1_general_cs DEFAULT NULL,
+  `num_rows` bigint(20) unsigned NOT NULL DEFAULT '0',
+  `status` enum('copying','done') CHARACTER SET latin1 COLLATE latin1_general_ci NOT NULL,
+  PRIMARY KEY (`table_name`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
@@ -0,0 +1,7 @@
+CREATE TABLE `inventory_changes` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `version` varchar(32) CHARACTER SET latin1 COLLATE latin1_general_cs NOT NULL,
+  `commands` longblob NOT NULL,
+  PRIMARY KEY (`id`),
+  KEY `version` (`version`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
@@ -1,6 +1,7 @@
 CREATE TABLE `inventory_updates` (
   `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
   `cmd` enum('update','delete') NOT NULL,
-  `obj` text CHARACTER SET latin1 COLLATE latin1_general_cs NOT NULL,
+  `compressed` tinyint(1) unsigned NOT NULL DEFAULT '0',
+  `obj` mediumblob NOT NULL,
   PRIMARY KEY (`id`)
 ) ENGINE=MyISAM DEFAULT CHARSET=latin1;
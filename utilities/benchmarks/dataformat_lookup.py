@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+#######################################################################
+## Micro-benchmark of name-based lookups on dataformat objects.
+## Builds datasets of increasing numbers of blocks (each with replicas
+## at a few sites) in memory and measures the time per call of
+## Dataset.find_block, Dataset.find_replica and Block.find_replica.
+## The cost per call should not grow with the dataset size.
+#######################################################################
+
+import sys
+import timeit
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description = 'Benchmark dataformat name lookups')
+parser.add_argument('--sizes', '-s', metavar = 'N', dest = 'sizes', nargs = '+', type = int, default = [10, 100, 1000, 10000, 50000], help = 'Numbers of blocks per dataset.')
+parser.add_argument('--sites', '-t', metavar = 'N', dest = 'num_sites', type = int, default = 20, help = 'Number of sites holding a replica of the dataset.')
+parser.add_argument('--calls', '-n', metavar = 'N', dest = 'calls', type = int, default = 10000, help = 'Number of lookups per measurement.')
+
+args = parser.parse_args()
+sys.argv = []
+
+from dynamo.dataformat import Dataset, Block, Site, Group, DatasetReplica, BlockReplica
+
+def make_dataset(num_blocks, sites):
+    dataset = Dataset('/Bench/Lookup%d/TEST' % num_blocks)
+    for ib in xrange(num_blocks):
+        block = Block('%08d' % ib, dataset, size = 1, num_files = 1, bid = ib + 1)
+        dataset.blocks.add(block)
+
+    for site in sites:
+        replica = DatasetReplica(dataset, site)
+        dataset.replicas.add(replica)
+
+    # block replicas only for the last block to keep the memory footprint small
+    for site in sites:
+        block_replica = BlockReplica(block, site, Group.null_group)
+        block.replicas.add(block_replica)
+
+    return dataset, block
+
+sites = [Site('T2_BENCH_%03d' % i) for i in xrange(args.num_sites)]
+
+print '%10s %20s %20s %20s' % ('blocks', 'find_block (us)', 'find_replica (us)', 'block.find_replica (us)')
+
+for num_blocks in args.sizes:
+    dataset, block = make_dataset(num_blocks, sites)
+    # look up the last-inserted objects - worst case for a linear scan
+    block_name = block.name
+    site = sites[-1]
+
+    # warm up (indices are built at the first lookup)
+    dataset.find_block(block_name)
+    dataset.find_replica(site)
+    block.find_replica(site)
+
+    t_block = timeit.timeit(lambda: dataset.find_block(block_name), number = args.calls)
+    t_replica = timeit.timeit(lambda: dataset.find_replica(site), number = args.calls)
+    t_breplica = timeit.timeit(lambda: block.find_replica(site), number = args.calls)
+
+    print '%10d %20.3f %20.3f %20.3f' % (num_blocks, t_block / args.calls * 1.e+6, t_replica / args.calls * 1.e+6, t_breplica / args.calls * 1.e+6)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+#######################################################################
+## Vectorized Detox policy benchmark.
+## Builds a synthetic inventory (same as policy_condition.py), runs a
+## number of simulated Detox iterations over a policy stack, and checks
+## that VectorizedPolicy.evaluate returns the same actions as
+## DetoxPolicy.evaluate for every replica. Between iterations, some
+## block replicas are removed from the inventory and the datasets are
+## invalidated, as Detox does after deletions. Reports the evaluation
+## time per iteration of the two. Needs NumPy.
+#######################################################################
+
+import sys
+import time
+import random
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description = 'Compare vectorized and replica-by-replica policy evaluation')
+parser.add_argument('--datasets', '-n', metavar = 'N', dest = 'num_datasets', type = int, default = 5000, help = 'Number of datasets.')
+parser.add_argument('--blocks', '-b', metavar = 'N', dest = 'num_blocks', type = int, default = 10, help = 'Number of blocks per dataset.')
+parser.add_argument('--sites', '-s', metavar = 'N', dest = 'num_sites', type = int, default = 40, help = 'Number of disk sites.')
+parser.add_argument('--policy', '-p', metavar = 'PATH', dest = 'policy', help = 'Detox policy file to take the policy lines from (default: built-in stack).')
+parser.add_argument('--iterations', '-i', metavar = 'N', dest = 'iterations', type = int, default = 5, help = 'Number of simulated Detox iterations.')
+parser.add_argument('--delete', '-d', metavar = 'N', dest = 'num_delete', type = int, default = 200, help = 'Number of dataset replicas to strip blocks from between iterations.')
+
+args = parser.parse_args()
+sys.argv = []
+
+from dynamo.dataformat import Dataset, Block, Site, Group, DatasetReplica, BlockReplica
+import dynamo.detox.detoxpolicy as detoxpolicy
+from dynamo.detox.detoxpolicy import DetoxPolicy, PolicyLine, Decision, BlockAction
+from dynamo.detox.vectorized import VectorizedPolicy
+
+if not VectorizedPolicy.available:
+    sys.stderr.write('NumPy is not available.\n')
+    sys.exit(1)
+
+POLICY = [
+    'Protect dataset.tape_copy_requested',
+    'Protect replica.enforcer_protected',
+    'Protect site.status != READY',
+    'ProtectBlock blockreplica.is_locked',
+    'Dismiss dataset.status == PRODUCTION',
+    'Protect dataset.name == /Bench1*/*/RAW',
+    'Delete dataset.on_tape == FULL and dataset.last_access older_than 200 days ago',
+    'Delete dataset.num_full_disk_copy > 2 and dataset.usage_rank > 150',
+    'Protect dataset.last_access newer_than 30 days ago',
+    'DeleteBlock blockreplica.owner == local and blockreplica.last_update older_than 300 days ago',
+    'Delete replica.num_access < 2 and dataset.last_update older_than 500 days ago',
+    'Dismiss replica.incomplete',
+    'Delete dataset.usage_rank > 100 and replica.size > 5e+9',
+    'Delete replica.num_full_disk_copy_common_owner > 1 and not dataset.is_latest_production_release'
+]
+
+DEFAULT = 'Dismiss'
+
+def read_policy_lines(path):
+    lines = []
+    default = DEFAULT
+    with open(path) as source:
+        for line in source:
+            words = line.split()
+            if len(words) == 0 or not hasattr(detoxpolicy, words[0]) or words[0] in ('Partition', 'On', 'When', 'Until', 'Order', 'Algo'):
+                continue
+            if len(words) == 1:
+                default = words[0]
+            else:
+                lines.append(' '.join(words))
+
+    return lines, default
+
+def make_inventory():
+    random.seed(12345)
+
+    now = time.time()
+
+    groups = [Group('AnalysisOps', gid = 1), Group('DataOps', gid = 2), Group('local', gid = 3)]
+    sites = []
+    for i in xrange(args.num_sites):
+        status = Site.STAT_READY if i % 10 != 9 else Site.STAT_MORGUE
+        sites.append(Site('T2_BENCH_%03d' % i, storage_type = Site.TYPE_DISK, status = status, sid = i + 1))
+    for i in xrange(4):
+        sites.append(Site('T1_BENCH_%03d_MSS' % i, storage_type = Site.TYPE_MSS, status = Site.STAT_READY, sid = args.num_sites + i + 1))
+
+    replicas = []
+
+    for ids in xrange(args.num_datasets):
+        name = '/Bench%d/Policy%d/%s' % (ids, ids % 7, random.choice(['AOD', 'AODSIM', 'MINIAOD', 'RAW']))
+        status = random.choice([Dataset.STAT_VALID, Dataset.STAT_VALID, Dataset.STAT_PRODUCTION])
+        dataset = Dataset(name, status = status, software_version = (8, random.randint(0, 2), 21, ''), last_update = int(now - random.randint(0, 800) * 86400), did = ids + 1)
+
+        dataset.attr['last_access'] = int(now - random.randint(0, 400) * 86400)
+        dataset.attr['num_access'] = random.randint(0, 10)
+        dataset.attr['global_usage_rank'] = random.randint(0, 200)
+        dataset.attr['tape_copy_requested'] = random.random() < 0.1
+        dataset.attr['latest_production_release'] = random.random() < 0.3
+
+        for ib in xrange(args.num_blocks):
+            block = Block(Block.to_internal_name('%08x' % (ids * args.num_blocks + ib)), dataset, size = random.randint(1, 1000) * 1000000, num_files = 10, last_update = int(now - random.randint(0, 800) * 86400), bid = ids * args.num_blocks + ib + 1)
+            dataset.blocks.add(block)
+
+        dataset_sites = random.sample(sites, random.randint(1, 4))
+
+        for site in dataset_sites:
+            replica = DatasetReplica(dataset, site)
+            dataset.replicas.add(replica)
+            replicas.append(replica)
+
+            for block in dataset.blocks:
+                if random.random() < 0.1:
+                    continue
+
+                if random.random() < 0.05:
+                    # half of the files
+                    size = block.size / 2
+                    file_ids = tuple(long(block.id * 10 + i) for i in xrange(5))
+                else:
+                    size = block.size
+                    file_ids = None
+
+                block_replica = BlockReplica(block, site, random.choice(groups), size = size, last_update = int(now - random.randint(0, 400) * 86400), file_ids = file_ids)
+                block.replicas.add(block_replica)
+                replica.block_replicas.add(block_replica)
+
+        if random.random() < 0.1:
+            dataset.attr['enforcer_protected_replicas'] = set([random.choice(list(dataset.replicas))])
+
+        if random.random() < 0.05:
+            site = random.choice(dataset_sites)
+            dataset.attr['locked_blocks'] = {site: set(random.sample(list(dataset.blocks), 2))}
+
+    return replicas
+
+def make_policy(lines, default):
+    policy = DetoxPolicy.__new__(DetoxPolicy)
+    policy.policy_lines = []
+    for line in lines:
+        words = line.split()
+        policy.policy_lines.append(PolicyLine(Decision(getattr(detoxpolicy, words[0])), ' '.join(words[1:])))
+
+    policy.default_decision = Decision(getattr(detoxpolicy, default))
+
+    return policy
+
+def summarize(actions):
+    result = []
+    for action in actions:
+        if isinstance(action, BlockAction):
+            result.append((type(action), action.matched_line, frozenset(action.block_replicas)))
+        else:
+            result.append((type(action), action.matched_line))
+
+    return result
+
+if args.policy:
+    lines, default = read_policy_lines(args.policy)
+else:
+    lines, default = POLICY, DEFAULT
+
+policy = make_policy(lines, default)
+vectorized = VectorizedPolicy(policy)
+
+replicas = make_inventory()
+
+print 'Synthetic inventory: %d dataset replicas. %d policy lines.' % (len(replicas), len(policy.policy_lines))
+
+random.seed(54321)
+
+print '%-10s %14s %14s %14s %8s' % ('iteration', 'evaluate (s)', 'prepare (s)', 'vector (s)', 'speedup')
+
+total_scalar = 0.
+total_vector = 0.
+
+for iteration in xrange(args.iterations):
+    start = time.time()
+    scalar_results = [summarize(policy.evaluate(replica)) for replica in replicas]
+    t_scalar = time.time() - start
+
+    start = time.time()
+    vectorized.prepare(replicas)
+    t_prepare = time.time() - start
+    vector_results = [summarize(vectorized.evaluate(replica)) for replica in replicas]
+    t_vector = time.time() - start
+
+    for replica, scalar, vector in zip(replicas, scalar_results, vector_results):
+        if scalar != vector:
+            sys.stderr.write('Mismatch in iteration %d for %s: %s != %s\n' % (iteration, str(replica), str(scalar), str(vector)))
+            sys.exit(1)
+
+    if iteration != 0:
+        # the first iteration includes building the columns
+        total_scalar += t_scalar
+        total_vector += t_vector
+
+    print '%-10d %14.3f %14.3f %14.3f %8.2f' % (iteration, t_scalar, t_prepare, t_vector, t_scalar / t_vector)
+
+    # simulate deletions
+    for replica in random.sample(replicas, min(args.num_delete, len(replicas))):
+        if len(replica.block_replicas) == 0:
+            continue
+
+        for block_replica in random.sample(list(replica.block_replicas), (len(replica.block_replicas) + 1) / 2):
+            replica.block_replicas.remove(block_replica)
+            block_replica.block.replicas.remove(block_replica)
+
+        vectorized.invalidate(replica.dataset)
+
+print 'Results identical in all iterations. Decisions from columns: %d, partly from columns: %d, replica by replica: %d.' % (vectorized.num_vectorized, vectorized.num_partial, vectorized.num_fallback)
+if args.iterations > 1:
+    print 'Mean speedup after the first iteration: %.2f' % (total_scalar / total_vector)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+#######################################################################
+## Memory report for BlockReplica.file_ids representations.
+## Builds a synthetic inventory of incomplete block replicas (file ids
+## as they would come out of MySQL, i.e. long integers) once with
+## tuples and once with compact FileIdArrays, and reports the size of
+## the file_ids containers and the process RSS growth for each mode.
+#######################################################################
+
+import os
+import sys
+import gc
+import random
+import resource
+import timeit
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description = 'Compare memory usage of tuple and compact BlockReplica.file_ids')
+parser.add_argument('--replicas', '-r', metavar = 'N', dest = 'num_replicas', type = int, default = 100000, help = 'Number of incomplete block replicas.')
+parser.add_argument('--files', '-f', metavar = 'N', dest = 'num_files', type = int, default = 100, help = 'Average number of files per block.')
+parser.add_argument('--seed', '-s', metavar = 'N', dest = 'seed', type = int, default = 1, help = 'Random seed.')
+
+args = parser.parse_args()
+sys.argv = []
+
+from dynamo.dataformat import Dataset, Block, Site, Group, BlockReplica
+
+def rss_kb():
+    with open('/proc/self/statm') as source:
+        return int(source.read().split()[1]) * resource.getpagesize() / 1024
+
+def make_replicas(compact):
+    BlockReplica._compact_file_ids = compact
+
+    random.seed(args.seed)
+
+    dataset = Dataset('/Bench/FileIds/TEST')
+    site = Site('T2_BENCH_000')
+
+    replicas = []
+    next_file_id = long(1)
+    for ib in xrange(args.num_replicas):
+        num_files = random.randint(1, 2 * args.num_files)
+        block = Block('%08d' % ib, dataset, size = num_files, num_files = num_files, bid = ib + 1)
+
+        # the replica has a random subset of the block files; new long objects for each replica as in MySQLInventoryStore
+        file_ids = [long(next_file_id + i) for i in xrange(num_files) if random.random() < 0.5]
+        next_file_id += num_files
+
+        replica = BlockReplica(block, site, Group.null_group, size = len(file_ids), file_ids = [])
+        replica.file_ids = BlockReplica.make_file_ids(file_ids)
+        replicas.append(replica)
+
+    return replicas
+
+def container_size(replicas):
+    total = 0
+    for replica in replicas:
+        total += sys.getsizeof(replica.file_ids)
+        if type(replica.file_ids) is tuple:
+            total += sum(sys.getsizeof(fid) for fid in replica.file_ids)
+
+    return total
+
+print 'Synthetic inventory: %d incomplete block replicas, ~%d files per block' % (args.num_replicas, args.num_files / 2)
+print '%10s %15s %15s %15s %20s' % ('mode', 'file ids', 'containers (MB)', 'RSS growth (MB)', 'has_file (us/call)')
+
+def report(compact):
+    gc.collect()
+    rss_before = rss_kb()
+
+    replicas = make_replicas(compact)
+
+    gc.collect()
+    rss_growth = rss_kb() - rss_before
+
+    num_ids = sum(len(r.file_ids) for r in replicas)
+    size = container_size(replicas)
+
+    sample = [(r.file_ids, r.file_ids[len(r.file_ids) / 2]) for r in replicas[:1000] if len(r.file_ids) != 0]
+    ncalls = 100
+    elapsed = timeit.timeit(lambda: [fid in file_ids for file_ids, fid in sample], number = ncalls)
+
+    print '%10s %15d %15.1f %15.1f %20.3f' % ('compact' if compact else 'tuple', num_ids, size / 1048576., rss_growth / 1024., elapsed / ncalls / len(sample) * 1.e+6)
+    sys.stdout.flush()
+
+for compact in [False, True]:
+    # measure each mode in a fresh process so that the RSS of one does not hide the other
+    pid = os.fork()
+    if pid == 0:
+        report(compact)
+        os._exit(0)
+    else:
+        os.waitpid(pid, 0)
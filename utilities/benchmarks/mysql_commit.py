@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+#######################################################################
+## Commit throughput benchmark for the MySQL interface.
+## Writes the same rows into a scratch table with one commit per
+## statement (default behavior of MySQL.query), with all statements in
+## one MySQL.transaction(), and with insert_many with and without a
+## transaction, and reports the number of rows written per second.
+## Needs a local MySQL/MariaDB server and a database where the user can
+## create tables. The scratch table is dropped at the end.
+#######################################################################
+
+import sys
+import time
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description = 'Compare per-statement and transactional commit throughput')
+parser.add_argument('--host', '-H', metavar = 'HOST', dest = 'host', default = 'localhost', help = 'MySQL host.')
+parser.add_argument('--user', '-u', metavar = 'USER', dest = 'user', required = True, help = 'MySQL user.')
+parser.add_argument('--passwd', '-p', metavar = 'PASSWD', dest = 'passwd', default = '', help = 'MySQL password.')
+parser.add_argument('--db', '-d', metavar = 'DB', dest = 'db', default = 'test', help = 'Database to create the scratch table in.')
+parser.add_argument('--engine', '-e', metavar = 'ENGINE', dest = 'engine', default = 'InnoDB', help = 'Storage engine of the scratch table.')
+parser.add_argument('--rows', '-n', metavar = 'N', dest = 'num_rows', type = int, default = 2000, help = 'Number of rows to write per mode.')
+
+args = parser.parse_args()
+sys.argv = []
+
+from dynamo.utils.interface.mysql import MySQL
+
+TABLE = 'commit_benchmark'
+
+db = MySQL({'host': args.host, 'user': args.user, 'passwd': args.passwd, 'db': args.db, 'reuse_connection': True})
+
+db.query('DROP TABLE IF EXISTS `%s`' % TABLE)
+db.query('CREATE TABLE `%s` (`id` int(10) unsigned NOT NULL, `value` varchar(64) NOT NULL, PRIMARY KEY (`id`)) ENGINE=%s' % (TABLE, args.engine))
+
+rows = [(i, 'value%d' % i) for i in xrange(args.num_rows)]
+sql = 'INSERT INTO `%s` (`id`, `value`) VALUES (%%s, %%s)' % TABLE
+
+def per_statement():
+    for row in rows:
+        db.query(sql, *row)
+
+def transaction():
+    with db.transaction():
+        for row in rows:
+            db.query(sql, *row)
+
+def bulk():
+    db.insert_many(TABLE, ('id', 'value'), None, rows, do_update = False)
+
+def bulk_transaction():
+    with db.transaction():
+        # force multiple statements
+        for start in xrange(0, len(rows), 100):
+            db.insert_many(TABLE, ('id', 'value'), None, rows[start:start + 100], do_update = False)
+
+print '%-35s %10s %12s' % ('mode', 'time (s)', 'rows/s')
+
+try:
+    for name, func in [('query, commit per statement', per_statement), ('query, one transaction', transaction),
+                       ('insert_many', bulk), ('insert_many x100, one transaction', bulk_transaction)]:
+        db.query('TRUNCATE TABLE `%s`' % TABLE)
+
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+
+        if db.query('SELECT COUNT(*) FROM `%s`' % TABLE)[0] != len(rows):
+            sys.stderr.write('Row count mismatch in mode %s\n' % name)
+            sys.exit(1)
+
+        print '%-35s %10.3f %12.1f' % (name, elapsed, len(rows) / elapsed)
+
+finally:
+    db.query('DROP TABLE `%s`' % TABLE)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+#######################################################################
+## Policy condition benchmark.
+## Builds a synthetic inventory of datasets, blocks and replicas at
+## disk and tape sites, checks that the compiled match function of
+## each condition in a corpus of policy conditions (built-in list and
+## optionally the policy lines of Detox policy files) agrees with the
+## predicate-by-predicate interpretation on every dataset and block
+## replica, and reports the evaluation time per replica of the two.
+## A second copy of each condition is profiled on the inventory and
+## its predicates are reordered (Condition.reorder); the reordered
+## condition is checked and timed as well.
+#######################################################################
+
+import sys
+import time
+import random
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description = 'Compare compiled and interpreted policy conditions')
+parser.add_argument('--datasets', '-n', metavar = 'N', dest = 'num_datasets', type = int, default = 5000, help = 'Number of datasets.')
+parser.add_argument('--blocks', '-b', metavar = 'N', dest = 'num_blocks', type = int, default = 10, help = 'Number of blocks per dataset.')
+parser.add_argument('--sites', '-s', metavar = 'N', dest = 'num_sites', type = int, default = 40, help = 'Number of disk sites.')
+parser.add_argument('--policy', '-p', metavar = 'PATH', dest = 'policies', nargs = '+', default = [], help = 'Detox policy files to take additional conditions from.')
+parser.add_argument('--repeat', '-r', metavar = 'N', dest = 'repeat', type = int, default = 3, help = 'Number of timing repetitions (best is reported).')
+
+args = parser.parse_args()
+sys.argv = []
+
+from dynamo.dataformat import Dataset, Block, Site, Group, DatasetReplica, BlockReplica
+from dynamo.detox.conditions import ReplicaCondition
+
+CONDITIONS = [
+    'dataset.name == /Bench1*/*/*',
+    'dataset.name =~ /Bench[0-9]+/Policy[0-9]/AOD.*',
+    'dataset.name in [/Bench1/*/* /Bench2*/Policy1/MINIAOD]',
+    'dataset.name notin [/Bench3*/*/*]',
+    'dataset.status == VALID',
+    'dataset.status != PRODUCTION',
+    'dataset.on_tape == FULL',
+    'dataset.on_tape != NONE',
+    'dataset.tape_copy_requested',
+    'not dataset.is_latest_production_release',
+    'dataset.last_access older_than 90 days ago',
+    'dataset.last_update newer_than 2015-01-01',
+    'dataset.size > 1000000000',
+    'dataset.num_full_disk_copy > 1',
+    'dataset.usage_rank > 100',
+    'dataset.release == 8_0_*',
+    'replica.size > 1e+9',
+    'replica.incomplete',
+    'not replica.incomplete',
+    'replica.last_block_created older_than 30 days ago',
+    'replica.first_block_created older_than 2016-01-01',
+    'replica.num_access < 5',
+    'replica.num_full_disk_copy_common_owner > 1',
+    'replica.num_full_other_copy_common_owner > 0',
+    'replica.enforcer_protected',
+    'blockreplica.owner == AnalysisOps',
+    'blockreplica.owner in [AnalysisOps DataOps]',
+    'blockreplica.owner notin [local Data*]',
+    'blockreplica.last_update older_than 60 days ago',
+    'blockreplica.is_locked',
+    'not blockreplica.is_last_transfer_source',
+    'blockreplica.num_full_disk_copy > 2',
+    'blockreplica.on_tape',
+    'site.name == T2_BENCH_00*',
+    'site.status == READY',
+    'site.storage_type in [DISK MSS]',
+    'dataset.name == /Bench1*/*/* and replica.num_access < 3 and dataset.last_access older_than 30 days ago',
+    'site.storage_type == DISK and dataset.num_full_disk_copy > 1 and not replica.enforcer_protected and blockreplica.owner == DataOps',
+    'dataset.usage_rank > 50 and replica.size > 1e+8 and blockreplica.last_update older_than 10 days ago and not blockreplica.is_locked'
+]
+
+DECISIONS = ('Ignore', 'Protect', 'Delete', 'Dismiss', 'ProtectBlock', 'DeleteBlock', 'DismissBlock')
+
+def read_policy_conditions(path):
+    conditions = []
+    with open(path) as source:
+        for line in source:
+            words = line.split()
+            if len(words) > 1 and words[0] in DECISIONS:
+                conditions.append(' '.join(words[1:]))
+
+    return conditions
+
+def make_inventory():
+    random.seed(12345)
+
+    now = time.time()
+
+    groups = [Group('AnalysisOps', gid = 1), Group('DataOps', gid = 2), Group('local', gid = 3)]
+    sites = []
+    for i in xrange(args.num_sites):
+        status = Site.STAT_READY if i % 10 != 9 else Site.STAT_MORGUE
+        sites.append(Site('T2_BENCH_%03d' % i, storage_type = Site.TYPE_DISK, status = status, sid = i + 1))
+    for i in xrange(4):
+        sites.append(Site('T1_BENCH_%03d_MSS' % i, storage_type = Site.TYPE_MSS, status = Site.STAT_READY, sid = args.num_sites + i + 1))
+
+    replicas = []
+
+    for ids in xrange(args.num_datasets):
+        name = '/Bench%d/Policy%d/%s' % (ids, ids % 7, random.choice(['AOD', 'AODSIM', 'MINIAOD', 'RAW']))
+        status = random.choice([Dataset.STAT_VALID, Dataset.STAT_VALID, Dataset.STAT_PRODUCTION])
+        dataset = Dataset(name, status = status, software_version = (8, random.randint(0, 2), 21, ''), last_update = int(now - random.randint(0, 800) * 86400), did = ids + 1)
+
+        dataset.attr['last_access'] = int(now - random.randint(0, 400) * 86400)
+        dataset.attr['num_access'] = random.randint(0, 10)
+        dataset.attr['global_usage_rank'] = random.randint(0, 200)
+        dataset.attr['tape_copy_requested'] = random.random() < 0.1
+        dataset.attr['latest_production_release'] = random.random() < 0.3
+
+        for ib in xrange(args.num_blocks):
+            block = Block(Block.to_internal_name('%08x' % (ids * args.num_blocks + ib)), dataset, size = random.randint(1, 1000) * 1000000, num_files = 10, last_update = int(now - random.randint(0, 800) * 86400), bid = ids * args.num_blocks + ib + 1)
+            dataset.blocks.add(block)
+
+        dataset_sites = random.sample(sites, random.randint(1, 4))
+
+        for site in dataset_sites:
+            replica = DatasetReplica(dataset, site)
+            dataset.replicas.add(replica)
+            replicas.append(replica)
+
+            for block in dataset.blocks:
+                if random.random() < 0.1:
+                    continue
+
+                if random.random() < 0.05:
+                    # half of the files
+                    size = block.size / 2
+                    file_ids = tuple(long(block.id * 10 + i) for i in xrange(5))
+                else:
+                    size = block.size
+                    file_ids = None
+
+                block_replica = BlockReplica(block, site, random.choice(groups), size = size, last_update = int(now - random.randint(0, 400) * 86400), file_ids = file_ids)
+                block.replicas.add(block_replica)
+                replica.block_replicas.add(block_replica)
+
+        if random.random() < 0.1:
+            dataset.attr['enforcer_protected_replicas'] = set([random.choice(list(dataset.replicas))])
+
+        if random.random() < 0.05:
+            site = random.choice(dataset_sites)
+            dataset.attr['locked_blocks'] = {site: set(random.sample(list(dataset.blocks), 2))}
+
+    return replicas
+
+conditions = list(CONDITIONS)
+for path in args.policies:
+    conditions.extend(read_policy_conditions(path))
+
+replicas = make_inventory()
+block_replicas = [br for replica in replicas for br in replica.block_replicas]
+
+print 'Synthetic inventory: %d dataset replicas, %d block replicas.' % (len(replicas), len(block_replicas))
+
+# Equivalence check
+compiled = []
+for text in conditions:
+    condition = ReplicaCondition(text)
+    compiled.append(condition)
+
+    for obj in replicas + block_replicas:
+        if condition.match(obj) != condition.interpret(obj):
+            sys.stderr.write('Mismatch for condition \'%s\' on %s\n' % (text, str(obj)))
+            sys.exit(1)
+
+reordered = []
+for condition in compiled:
+    copy = ReplicaCondition(condition.text)
+    copy.start_profiling()
+    for obj in replicas:
+        copy.match(obj)
+    copy.stop_profiling()
+    copy.reorder()
+    reordered.append(copy)
+
+    for obj in replicas + block_replicas:
+        if copy.match(obj) != condition.interpret(obj):
+            sys.stderr.write('Mismatch for reordered condition \'%s\' on %s\n' % (copy.describe_predicates(), str(obj)))
+            sys.exit(1)
+
+print 'Equivalence check OK for %d conditions.' % len(compiled)
+
+def best_time(func):
+    best = None
+    for _ in xrange(args.repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+print '%-60s %14s %14s %14s %8s' % ('condition', 'interp (us)', 'compiled (us)', 'reordered (us)', 'speedup')
+
+total_interp = 0.
+total_compiled = 0.
+total_reordered = 0.
+
+for condition, copy in zip(compiled, reordered):
+    interpret = condition.interpret
+    match = condition.match
+    match_reordered = copy.match
+
+    t_interp = best_time(lambda: [interpret(r) for r in replicas])
+    t_compiled = best_time(lambda: [match(r) for r in replicas])
+    t_reordered = best_time(lambda: [match_reordered(r) for r in replicas])
+
+    total_interp += t_interp
+    total_compiled += t_compiled
+    total_reordered += t_reordered
+
+    text = condition.text
+    if len(text) > 60:
+        text = text[:57] + '...'
+
+    print '%-60s %14.3f %14.3f %14.3f %8.2f' % (text, t_interp / len(replicas) * 1.e+6, t_compiled / len(replicas) * 1.e+6, t_reordered / len(replicas) * 1.e+6, t_interp / t_reordered)
+
+print '%-60s %14.3f %14.3f %14.3f %8.2f' % ('total', total_interp / len(replicas) * 1.e+6, total_compiled / len(replicas) * 1.e+6, total_reordered / len(replicas) * 1.e+6, total_interp / total_reordered)
+
+for copy in reordered:
+    if len(copy.predicates) > 1:
+        print 'Learned order: ' + copy.describe_predicates()
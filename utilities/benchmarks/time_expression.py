@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+#######################################################################
+## Time expression check and benchmark.
+## Evaluates a corpus of policy time expressions (built-in list and
+## optionally the older_than / newer_than right-hand sides of policy
+## files) with the in-process parser dynamo.policy.timeexpr and with
+## `date -d <expr> +%s` (GNU coreutils) in several time zones, checks
+## that the two agree, and reports the time per expression of the two.
+## Expressions outside of the supported subset are listed; policy
+## attributes fall back to GNU date for them.
+#######################################################################
+
+import os
+import sys
+import time
+import subprocess
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description = 'Compare in-process time expression parsing with GNU date')
+parser.add_argument('--tz', '-z', metavar = 'TZ', dest = 'zones', nargs = '+', default = ['UTC', 'Europe/Zurich', 'America/Chicago', 'Australia/Sydney'], help = 'Time zones to check.')
+parser.add_argument('--policy', '-p', metavar = 'PATH', dest = 'policies', nargs = '+', default = [], help = 'Policy files to take additional expressions from.')
+parser.add_argument('--repeat', '-r', metavar = 'N', dest = 'repeat', type = int, default = 1000, help = 'Number of in-process evaluations per expression for timing.')
+
+args = parser.parse_args()
+sys.argv = []
+
+import dynamo.policy.timeexpr as timeexpr
+
+EXPRESSIONS = [
+    'now', 'today', 'yesterday', 'tomorrow',
+    '1 day ago', '7 days ago', '30 days ago', '90 days ago', '150 days ago', '200 days ago', '365 days ago', '1000 days ago',
+    '2 weeks ago', '1 fortnight ago', '6 months ago', '1 month ago', '13 months ago', '1 year ago', '2 years ago',
+    '12 hours ago', '36 hours ago', '90 minutes ago', '10 sec ago', '45 seconds ago',
+    '1 day 2 hours ago', '2 weeks ago 3 hours', '3 days', '+3 days', '-3 days', '20 days', 'day ago', 'week',
+    'last week', 'last month', 'last year', 'next week', 'this day',
+    'monday', 'friday', 'sunday', 'last monday', 'last friday', 'last sunday', 'next monday', 'next friday', 'this tuesday',
+    'Monday', 'last Wed', 'monday 3 days ago', 'last monday 12:00',
+    '2015-01-01', '2016-01-01', '2015-07-05', '2016-02-29', '2015-03-29', '2015-10-25',
+    '2015-01-05 13:45', '2015-07-05 13:45:10', '2015-07-05T13:45:10', '2015-03-29 02:30',
+    '01/05/2015', '12/31/2016', 'Jan 5 2015', 'January 5, 2015', '5 Jan 2015', '31 December 2016', 'Jul 4',
+    '2015-01-01 +3 days', '2015-01-31 1 month', '2016-02-29 1 year ago', '13:45', '00:00',
+    '@0', '@1400000000',
+    '2016-02-30', '2015-13-01', '25:00', 'garbage', '3 parsecs ago', 'a day ago', '2015-01-01 UTC', 'midnight'
+]
+
+def read_policy_expressions(path):
+    expressions = []
+    with open(path) as source:
+        for line in source:
+            for predicate in line.split(' and '):
+                for op in ('older_than', 'newer_than'):
+                    if ' %s ' % op in predicate:
+                        expressions.append(predicate.split(' %s ' % op, 1)[1].strip())
+
+    return expressions
+
+def gnu_date(expr):
+    proc = subprocess.Popen(['date', '-d', expr, '+%s'], stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    out, err = proc.communicate()
+    if err != '':
+        return None
+
+    return float(out.strip())
+
+def in_process(expr, now):
+    try:
+        return timeexpr.evaluate(expr, now)
+    except ValueError:
+        return 'invalid'
+
+expressions = list(EXPRESSIONS)
+for path in args.policies:
+    expressions.extend(read_policy_expressions(path))
+
+unsupported = set()
+num_failed = 0
+
+for zone in args.zones:
+    os.environ['TZ'] = zone
+    time.tzset()
+
+    for expr in expressions:
+        start = int(time.time())
+        reference = gnu_date(expr)
+        end = int(time.time())
+
+        # the clock may have ticked while date was running
+        results = set(in_process(expr, now) for now in xrange(start, end + 1))
+
+        if None in results:
+            unsupported.add(expr)
+            continue
+
+        if reference is None:
+            ok = (results == set(['invalid']))
+        else:
+            ok = (reference in results)
+
+        if not ok:
+            sys.stderr.write('Mismatch in %s for \'%s\': date %s, timeexpr %s\n' % (zone, expr, reference, ' '.join(map(str, sorted(results)))))
+            num_failed += 1
+
+if num_failed != 0:
+    sys.exit(1)
+
+print 'Equivalence check OK for %d expressions in %d time zones.' % (len(expressions) - len(unsupported), len(args.zones))
+if len(unsupported) != 0:
+    print 'Not supported in-process (GNU date is used): %s' % ', '.join('\'%s\'' % expr for expr in sorted(unsupported))
+
+supported = [expr for expr in expressions if expr not in unsupported and in_process(expr, None) != 'invalid']
+
+start = time.time()
+for expr in supported:
+    gnu_date(expr)
+t_gnu = (time.time() - start) / len(supported)
+
+start = time.time()
+for _ in xrange(args.repeat):
+    for expr in supported:
+        timeexpr.evaluate(expr)
+t_cached = (time.time() - start) / len(supported) / args.repeat
+
+start = time.time()
+for _ in xrange(args.repeat):
+    timeexpr._parsed.clear()
+    for expr in supported:
+        timeexpr.evaluate(expr)
+t_uncached = (time.time() - start) / len(supported) / args.repeat
+
+print '%-25s %12s' % ('method', 'time (us)')
+print '%-25s %12.2f' % ('GNU date', t_gnu * 1.e+6)
+print '%-25s %12.2f' % ('timeexpr, not cached', t_uncached * 1.e+6)
+print '%-25s %12.2f' % ('timeexpr, cached', t_cached * 1.e+6)
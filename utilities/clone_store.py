@@ -5,15 +5,22 @@
 ## This version only handles MySQLInventoryStore and assumes MySQL
 ## user and password are identical to the local store. Need to add
 ## command line options etc. for more general cases.
+## Tables are copied in parallel and in checkpointed chunks; running
+## the script again after an interruption resumes the copy.
 #######################################################################
 
 import os
 import sys
+import time
 import logging
+import threading
 from argparse import ArgumentParser
 
 parser = ArgumentParser(description = 'Parse configuration files')
 parser.add_argument('source', metavar = 'HOST', help = 'Source host to copy the inventory from.')
+parser.add_argument('--workers', '-j', metavar = 'N', dest = 'num_workers', type = int, help = 'Number of tables copied in parallel.')
+parser.add_argument('--chunk-size', '-c', metavar = 'N', dest = 'chunk_size', type = int, help = 'Number of rows copied between checkpoints.')
+parser.add_argument('--restart', '-r', action = 'store_true', dest = 'restart', help = 'Discard the checkpoints of an interrupted clone and start over.')
 
 args = parser.parse_args()
 sys.argv = []
@@ -53,6 +60,35 @@ remote = InventoryStore.get_instance(config.inventory.persistency.module, remote
 
 LOG.info('Cloning inventory store from %s', args.source)
 
-local.clone_from(remote)
+if args.restart:
+    local._mysql.query('DELETE FROM `clone_checkpoints`')
 
-LOG.info('Done.')
+start_time = time.time()
+last_report = {} # {table: (time, rows)}
+progress_lock = threading.Lock()
+
+def report_progress(table, num_rows, total_rows):
+    with progress_lock:
+        now = time.time()
+        last_time, last_rows = last_report.get(table, (start_time, 0))
+        if num_rows < total_rows and now - last_time < 10.:
+            return
+
+        if now > last_time:
+            rate = (num_rows - last_rows) / (now - last_time)
+        else:
+            rate = 0.
+
+        if total_rows != 0:
+            fraction = 100. * num_rows / total_rows
+        else:
+            fraction = 100.
+
+        LOG.info('%s: %d/%d rows (%.1f%%), %.0f rows/s', table, num_rows, total_rows, fraction, rate)
+        last_report[table] = (now, num_rows)
+
+results = local.clone_tables(remote, num_workers = args.num_workers, chunk_size = args.chunk_size, progress = report_progress)
+
+elapsed = time.time() - start_time
+total = sum(results.itervalues())
+LOG.info('Done. Copied %d rows in %.1f seconds (%.0f rows/s).', total, elapsed, total / max(elapsed, 1.e-6))